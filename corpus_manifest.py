@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+'''
+Manifest of the files used to create the training file of one step (path, size, modification time, hash and the
+position of its sequences in the training file). It's stored next to the parameters of the model, and when the training
+file is created again the sequences of the files that did not change are copied from the previous training file,
+so only the new and modified files are processed
+'''
+from __future__ import print_function
+import sys
+import os
+import locale
+
+from feature_cache import get_file_hash
+
+
+NEW_EXTENSION = '.new'
+
+
+class CorpusManifest:
+    def __init__(self, manifest_filename, output_filename):
+        '''
+        Reads the manifest of the previous training file. The new training file is written to new_output_filename,
+        and it replaces the previous one (and its manifest) in save(), so if the process fails both are kept
+        '''
+        self.filename = manifest_filename
+        self.output_filename = output_filename
+        self.new_output_filename = output_filename+NEW_EXTENSION
+        #Same encoding used by open() for the training file
+        self.encoding = locale.getpreferredencoding(False)
+        self.configuration = self.previous_configuration = None
+        self.previous_entries = {}      #path --> (size, mtime, hash, offset, length)
+        self.entries = []
+        self.offset = 0
+        self.num_unchanged = self.num_modified = self.num_added = 0
+        self.previous_fd = None
+
+        if os.path.exists(manifest_filename) and os.path.exists(output_filename):
+            fd = open(manifest_filename, 'r')
+            self.previous_configuration, output_size = fd.readline().rstrip('\n').split('\t')
+            for line in fd:
+                path, size, mtime, file_hash, offset, length = line.rstrip('\n').split('\t')
+                self.previous_entries[path] = (int(size), float(mtime), file_hash, int(offset), int(length))
+            fd.close()
+            if os.path.getsize(output_filename) != int(output_size):
+                self.previous_entries = {}
+
+
+    def set_configuration(self, configuration):
+        '''
+        The sequences of the previous training file are reused only if it was created with the same
+        configuration (see feature_cache.get_configuration_hash)
+        '''
+        self.configuration = configuration
+        if self.previous_configuration != configuration:
+            self.previous_entries = {}
+        if len(self.previous_entries) != 0:
+            self.previous_fd = open(self.output_filename, 'rb')
+
+
+    def get_sequences(self, filename):
+        '''
+        Returns the sequences of the file in the previous training file, or None if it's new or has been modified. The
+        file is hashed only if the size or the modification time are not the same
+        '''
+        if not isinstance(filename, str) or not os.path.isfile(filename):
+            return None
+        previous = self.previous_entries.get(filename)
+        if previous is None:
+            self.num_added += 1
+            return None
+        size, mtime, file_hash, offset, length = previous
+        stat = os.stat(filename)
+        if stat.st_size != size or stat.st_mtime != mtime:
+            if stat.st_size != size or get_file_hash(filename) != file_hash:
+                self.num_modified += 1
+                return None
+        self.num_unchanged += 1
+        self.previous_fd.seek(offset)
+        return self.previous_fd.read(length).decode(self.encoding)
+
+
+    def add(self, filename, sequences):
+        '''
+        Adds the file, with its sequences written at the current end of the new training file
+        '''
+        length = len(sequences.encode(self.encoding))
+        if isinstance(filename, str) and os.path.isfile(filename):
+            stat = os.stat(filename)
+            previous = self.previous_entries.get(filename)
+            if previous is not None and previous[0] == stat.st_size and previous[1] == stat.st_mtime:
+                file_hash = previous[2]
+            else:
+                file_hash = get_file_hash(filename)
+            self.entries.append((filename, stat.st_size, stat.st_mtime, file_hash, self.offset, length))
+        self.offset += length
+
+
+    def save(self):
+        '''
+        Replaces the previous training file by the new one, once it's complete and closed, and saves the manifest
+        '''
+        if self.previous_fd is not None:
+            self.previous_fd.close()
+            self.previous_fd = None
+        #Without manifest the next process creates the training file from scratch, so if this one fails before the new
+        #manifest is written the training file is never paired with the manifest of another one
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(self.new_output_filename, self.output_filename)
+        fd = open(self.filename+NEW_EXTENSION, 'w')
+        fd.write('%s\t%d\n' % (self.configuration, self.offset))
+        for path, size, mtime, file_hash, offset, length in self.entries:
+            fd.write('%s\t%d\t%r\t%s\t%d\t%d\n' % (path, size, mtime, file_hash, offset, length))
+        fd.close()
+        os.rename(self.filename+NEW_EXTENSION, self.filename)
+        num_removed = len(set(self.previous_entries) - set(entry[0] for entry in self.entries))
+        print('Manifest %s: %d unchanged files, %d modified, %d added, %d removed' % (self.filename, self.num_unchanged, self.num_modified, self.num_added, num_removed), file=sys.stderr)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+'''
+In-process decoder for CRF++ models. It reads the text version of the model (crf_learn -t)
+and tags the sequences with the same labels as crf_test, without calling to an external process
+'''
+from __future__ import print_function
+import sys
+import re
+import argparse
+
+import numpy
+
+
+TEXT_MODEL_EXTENSION = '.txt'
+
+#Same values as CRF++ for the positions out of the sequence
+MAX_CONTEXT_SIZE = 8
+BOS = ['_B-%d' % n for n in range(1, MAX_CONTEXT_SIZE+1)]
+EOS = ['_B+%d' % n for n in range(1, MAX_CONTEXT_SIZE+1)]
+
+MACRO = re.compile(r'%x\[(-?\d+),(\d+)\]')
+
+
+class CRFPPModel:
+    '''
+    CRF++ model loaded from the text model file. The weights are kept as 32 bits floats and added
+    in the same order than crf_test does with the binary model, so the costs (and the labels) are the same
+    '''
+    def __init__(self, model_filename=None):
+        self.cost_factor = 1.0
+        self.xsize = 0
+        self.labels = []
+        self.unigram_templates = []     #List of ([(literal, row, col)...], last_literal)
+        self.bigram_templates = []
+        self.id_for_feature = {}
+        self.weights = None
+        if model_filename is not None:
+            self.load_text_model(model_filename)
+
+
+    def load_text_model(self, model_filename):
+        fd = open(model_filename,'r')
+
+        #Header
+        for line in fd:
+            line = line.rstrip('\n')
+            if line == '':
+                break
+            key, value = line.split(':',1)
+            if key == 'cost-factor':
+                self.cost_factor = float(value)
+            elif key == 'xsize':
+                self.xsize = int(value)
+            elif key == 'maxid':
+                maxid = int(value)
+
+        #Labels
+        for line in fd:
+            line = line.rstrip('\n')
+            if line == '':
+                break
+            self.labels.append(line)
+
+        #Templates
+        for line in fd:
+            line = line.rstrip('\n')
+            if line == '':
+                break
+            if line[0] == 'U':
+                self.unigram_templates.append(self.compile_template(line))
+            elif line[0] == 'B':
+                self.bigram_templates.append(self.compile_template(line))
+            else:
+                raise ValueError('Unknown type of template %s in %s' % (line, model_filename))
+
+        #Feature strings
+        for line in fd:
+            line = line.rstrip('\n')
+            if line == '':
+                break
+            this_id, feature = line.split(' ',1)
+            self.id_for_feature[feature] = int(this_id)
+
+        #Weights
+        weights = []
+        for line in fd:
+            weights.append(float(line))
+        fd.close()
+
+        if len(weights) != maxid:
+            raise ValueError('The model file %s is broken, %d weights and maxid is %d' % (model_filename, len(weights), maxid))
+        self.weights = numpy.array(weights, dtype=numpy.float32)
+
+
+    def compile_template(self, template):
+        '''
+        Splits the template in literal parts and %x[row,col] macros
+        '''
+        parts = []
+        last = 0
+        for match in MACRO.finditer(template):
+            row = int(match.group(1))
+            col = int(match.group(2))
+            if abs(row) > MAX_CONTEXT_SIZE or col >= self.xsize:
+                raise ValueError('Wrong macro in the template %s' % template)
+            parts.append((template[last:match.start()], row, col))
+            last = match.end()
+        return parts, template[last:]
+
+
+    def apply_template(self, template, columns, position):
+        parts, end = template
+        values = []
+        for literal, row, col in parts:
+            values.append(literal)
+            idx = position + row
+            if idx < 0:
+                values.append(BOS[-idx-1])
+            elif idx >= len(columns):
+                values.append(EOS[idx-len(columns)])
+            else:
+                values.append(columns[idx][col])
+        values.append(end)
+        return ''.join(values)
+
+
+    def get_feature_ids(self, templates, columns, position):
+        feature_ids = []
+        for template in templates:
+            this_id = self.id_for_feature.get(self.apply_template(template, columns, position))
+            if this_id is not None:
+                feature_ids.append(this_id)
+        return feature_ids
+
+
+    def get_costs(self, feature_ids, num_values):
+        '''
+        Sum of the weights for every value (label or pair of labels), in 32 bits and in the same order as crf_test
+        '''
+        if len(feature_ids) == 0:
+            return numpy.zeros(num_values)
+        indexes = numpy.array(feature_ids)[:,None] + numpy.arange(num_values)
+        sums = numpy.cumsum(self.weights[indexes], axis=0, dtype=numpy.float32)[-1]
+        return self.cost_factor * sums.astype(numpy.float64)
+
+
+    def tag_sequence(self, columns):
+        '''
+        Returns the list of labels for one sequence, given as a list of rows of columns
+        '''
+        if len(columns) == 0:
+            return []
+        for row in columns:
+            if len(row) < self.xsize:
+                raise ValueError('Wrong number of columns (%d, and the model has %d): %s' % (len(row), self.xsize, ' '.join(row)))
+
+        ysize = len(self.labels)
+        best_cost = self.get_costs(self.get_feature_ids(self.unigram_templates, columns, 0), ysize)
+        best_previous = []
+        for position in range(1, len(columns)):
+            node_costs = self.get_costs(self.get_feature_ids(self.unigram_templates, columns, position), ysize)
+            path_costs = self.get_costs(self.get_feature_ids(self.bigram_templates, columns, position), ysize*ysize).reshape(ysize, ysize)
+
+            # Cost of coming from the label of the row to the label of the column. As in crf_test, the
+            # first previous label with the maximum cost is selected
+            costs = (best_cost[:,None] + path_costs) + node_costs[None,:]
+            previous = numpy.argmax(costs, axis=0)
+            best_cost = costs[previous, numpy.arange(ysize)]
+            best_previous.append(previous)
+
+        label_ids = [int(numpy.argmax(best_cost))]
+        for previous in reversed(best_previous):
+            label_ids.append(int(previous[label_ids[-1]]))
+        label_ids.reverse()
+        return [self.labels[label_id] for label_id in label_ids]
+
+
+    def tag_sequences(self, sequences):
+        '''
+        Tags a list of sequences (lists of rows of feature values, as created by the feature extractors) and returns
+        the output as crf_test does: for every token the columns plus the label, and an empty row after every sequence
+        '''
+        output = []
+        for sequence in sequences:
+            columns = [split_columns(row) for row in sequence]
+            labels = self.tag_sequence(columns)
+            for row, label in zip(columns, labels):
+                output.append(row + [label])
+            if len(columns) != 0:
+                output.append([])
+        return output
+
+
+    def tag_file(self, filename):
+        '''
+        Tags a file in CRF++ format (one token per line and sequences separated by empty lines)
+        '''
+        sequences = []
+        current = []
+        fd = open(filename,'r')
+        for line in fd:
+            line = line.rstrip('\n')
+            if line == '' or line[0] in ' \t':
+                if len(current) != 0:
+                    sequences.append(current)
+                current = []
+            else:
+                current.append([line])
+        fd.close()
+        if len(current) != 0:
+            sequences.append(current)
+        return self.tag_sequences(sequences)
+
+
+def split_columns(row):
+    '''
+    Columns of one row as crf_test reads them: split by tabs and spaces, ignoring empty values
+    '''
+    for value in row:
+        if value == '' or ' ' in value or '\t' in value:
+            return [column for column in '\t'.join(row).replace(' ','\t').split('\t') if column != '']
+    return row
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Tags a file in CRF++ format with the text version of a CRF++ model, with the same output as crf_test')
+    argument_parser.add_argument('-m', dest='model', required=True, help='CRF++ model in text format (crf_learn -t)')
+    argument_parser.add_argument('input_file', help='File to tag')
+    args = argument_parser.parse_args()
+
+    model = CRFPPModel(args.model)
+    for row in model.tag_file(args.input_file):
+        print('\t'.join(row))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+'''
+Pool of crf_test processes that are kept running between documents. The sequences are sent through
+the standard input and the labels are read from the standard output, one sentence at a time
+'''
+from __future__ import print_function
+import sys
+import shutil
+import threading
+from subprocess import Popen, PIPE
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from path_crf import PATH_TO_CRF_TEST
+
+
+class CRFTestProcess:
+    '''
+    One crf_test process reading from stdin. crf_test does not flush the output after every sentence,
+    so it runs under stdbuf to get the output line by line
+    '''
+    def __init__(self, model_filename):
+        self.model_filename = model_filename
+        self.process = None
+        self.start()
+
+
+    def start(self):
+        stdbuf = shutil.which('stdbuf')
+        if stdbuf is None:
+            raise IOError('stdbuf (GNU coreutils) is needed to keep crf_test running')
+        self.process = Popen([stdbuf, '-oL', PATH_TO_CRF_TEST, '-m', self.model_filename], stdin=PIPE, stdout=PIPE)
+
+
+    def stop(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+            try:
+                self.process.stdin.close()
+            except (IOError, OSError):
+                pass
+        self.process = None
+
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+
+    def write_sequences(self, process, sequences, errors):
+        try:
+            for sequence in sequences:
+                for values in sequence:
+                    process.stdin.write(('\t'.join(values)+'\n').encode('utf-8'))
+                process.stdin.write(b'\n')
+            process.stdin.flush()
+        except (IOError, OSError, ValueError) as e:
+            errors.append(e)
+
+
+    def tag_sequences(self, sequences):
+        '''
+        Returns the output as the CRF decoder: for every token the columns and the label, and an empty row
+        after every sequence. The sequences are written from another thread while the output is read,
+        so none of the pipes can get full
+        '''
+        sequences = [sequence for sequence in sequences if len(sequence) != 0]
+        errors = []
+        writer = threading.Thread(target=self.write_sequences, args=(self.process, sequences, errors))
+        writer.start()
+        output = []
+        try:
+            for sequence in sequences:
+                for values in sequence:
+                    line = self.process.stdout.readline()
+                    if not line:
+                        raise IOError('crf_test stopped while tagging with the model %s' % self.model_filename)
+                    columns = line.decode('utf-8').rstrip('\n').split('\t')
+                    if columns[0] != values[0]:
+                        raise IOError('Wrong output of crf_test for the model %s, expected %s and got %s' % (self.model_filename, values[0], columns[0]))
+                    output.append(columns)
+                if self.process.stdout.readline().strip() != b'':
+                    raise IOError('Wrong output of crf_test for the model %s, the sentence does not end after %s' % (self.model_filename, values[0]))
+                output.append([])
+        except:
+            #The process can not be used anymore, it's stopped so the writer thread also finishes
+            self.stop()
+            writer.join()
+            raise
+        writer.join()
+        if len(errors) != 0:
+            self.stop()
+            raise errors[0]
+        return output
+
+
+class CRFTestPool:
+    '''
+    Keeps num_workers crf_test processes for one model, so several threads can tag at the same time.
+    Crashed processes are started again and the sequences are tagged once more
+    '''
+    def __init__(self, model_filename, num_workers=1):
+        self.model_filename = model_filename
+        self.workers = queue.Queue()
+        self.all_workers = []
+        for n in range(num_workers):
+            worker = CRFTestProcess(model_filename)
+            self.all_workers.append(worker)
+            self.workers.put(worker)
+
+
+    def tag_sequences(self, sequences):
+        worker = self.workers.get()
+        try:
+            if not worker.is_alive():
+                worker.start()
+            try:
+                return worker.tag_sequences(sequences)
+            except (IOError, OSError) as e:
+                print('Restarting crf_test for the model %s after the error: %s' % (self.model_filename, str(e)), file=sys.stderr)
+                worker.start()
+                return worker.tag_sequences(sequences)
+        finally:
+            self.workers.put(worker)
+
+
+    def close(self):
+        for worker in self.all_workers:
+            worker.stop()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+'''
+Dependency paths from all the terms of a sentence to the span of one expression. It gives the same
+paths as get_shortest_path_spans of the dependency extractor of KafNafParserPy, but the paths of the
+expression are indexed only once instead of being compared with the paths of every term
+'''
+from __future__ import print_function
+
+
+def get_first_positions(paths):
+    '''
+    For every path (list of (function, term_id)), the position of the first appearance of every term id
+    '''
+    list_first_positions = []
+    for path in paths:
+        first_positions = {}
+        for position, (func, term_id) in enumerate(path):
+            if term_id not in first_positions:
+                first_positions[term_id] = position
+        list_first_positions.append(first_positions)
+    return list_first_positions
+
+
+class DependencyPathsToSpan:
+    '''
+    Shortest dependency paths to the terms of a span (the expression), for any term of the sentence
+    '''
+    def __init__(self, document_index, extractor, span_term_ids):
+        self.document_index = document_index
+        self.extractor = extractor
+        self.span_term_ids = span_term_ids
+        #For every term of the span: term id --> list of (num_path, position) in its paths
+        self.positions_for_span_term = {}
+        for span_term_id in span_term_ids:
+            if span_term_id in self.positions_for_span_term:
+                continue
+            positions_for_term_id = {}
+            first_positions = document_index.get_dependency_path_positions(span_term_id)
+            for num_path, these_positions in enumerate(first_positions):
+                for term_id, position in these_positions.items():
+                    if term_id not in positions_for_term_id:
+                        positions_for_term_id[term_id] = []
+                    positions_for_term_id[term_id].append((num_path, position))
+            self.positions_for_span_term[span_term_id] = positions_for_term_id
+
+
+    def get_shortest_path(self, term1, term2):
+        '''
+        Same as get_shortest_path(term1, term2) of the dependency extractor, with term2 in the span. Of all the
+        connections (term2 in a path of term1, term1 in a path of term2 or a term in paths of both), the shortest
+        one is selected, and with the same length the first one in the order followed by the extractor
+        '''
+        if term1 == term2:
+            return []
+        first_positions1 = self.document_index.get_dependency_path_positions(term1)
+        positions_for_term_id2 = self.positions_for_span_term[term2]
+
+        best_key = best_hit = None
+        for num1, these_positions in enumerate(first_positions1):
+            idx1 = these_positions.get(term2)
+            if idx1 is not None:
+                key = (idx1, 1, num1, 0)
+                if best_key is None or key < best_key:
+                    best_key, best_hit = key, (idx1, 0, num1, None)
+
+        for num2, idx2 in positions_for_term_id2.get(term1, []):
+            key = (idx2, 2, num2, 0)
+            if best_key is None or key < best_key:
+                best_key, best_hit = key, (0, idx2, None, num2)
+
+        for num1, these_positions in enumerate(first_positions1):
+            for common_id, idx1 in these_positions.items():
+                for num2, idx2 in positions_for_term_id2.get(common_id, []):
+                    key = (idx1+idx2, 3, num1, num2)
+                    if best_key is None or key < best_key:
+                        best_key, best_hit = key, (idx1, idx2, num1, num2)
+
+        if best_hit is None:
+            return None
+
+        idx1, idx2, numpath1, numpath2 = best_hit
+        dep_path = []
+        if numpath2 is None:
+            #term2 is in one of the paths of term1
+            for func, node in self.extractor.paths_for_termid[term1][numpath1][:idx1+1]:
+                dep_path.append(func)
+        elif numpath1 is None:
+            #term1 is in one of the paths of term2
+            for func, node in self.extractor.paths_for_termid[term2][numpath2][:idx2+1]:
+                dep_path.append(func)
+        else:
+            #There is a common node linking both. If several nodes of the two paths give the same length, the
+            #extractor takes the first one in the order of the set of common nodes, so it's done the same here
+            path1 = self.extractor.paths_for_termid[term1][numpath1]
+            path2 = self.extractor.paths_for_termid[term2][numpath2]
+            ids1 = [my_id for my_func, my_id in path1]
+            ids2 = [my_id for my_func, my_id in path2]
+            for common_id in set(ids1) & set(ids2):
+                if ids1.index(common_id) + ids2.index(common_id) == best_key[0]:
+                    idx1 = ids1.index(common_id)
+                    idx2 = ids2.index(common_id)
+                    break
+            for func, node in path1[:idx1+1]:
+                dep_path.append(func)
+            for func, node in path2[:idx2+1][-1::-1]:
+                dep_path.append(func)
+        return dep_path
+
+
+    def get_shortest_path_to_span(self, term_id):
+        '''
+        Same as get_shortest_path_spans([term_id], span_term_ids) of the dependency extractor
+        '''
+        shortest_path = None
+        for span_term_id in self.span_term_ids:
+            this_path = self.get_shortest_path(term_id, span_term_id)
+            if shortest_path is None or (this_path is not None and len(this_path)<len(shortest_path)):
+                shortest_path = this_path
+        return shortest_path
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+'''
+Index of a KAF/NAF document, created once and shared by the feature extractors and the tagger
+'''
+from __future__ import print_function
+import threading
+from feature_columns import StringTable
+from dependency_paths import get_first_positions
+
+
+class DocumentIndex:
+    '''
+    Sentences, tokens and terms of a KAF/NAF object, and the constituency/dependency extractors,
+    so they are not read again by every step
+    '''
+    def __init__(self, naf_obj):
+        self.naf_obj = naf_obj
+        self.sentence_ids = []                  #In the order of the document
+        self.token_ids_for_sentence = {}        #Sentence id --> list of token ids
+        self.sentence_for_token_id = {}
+        self.num_token_for_token_id = {}        #Position of the token in the document
+        self.term_id_for_token_id = {}
+        self.token_ids_for_term_id = {}
+        self.position_by_offset_for_token_id = None
+        self.feature_values = StringTable()        #Values of the features of all the sequences of the document
+        self.static_columns_for_sentence = {}      #Sentence id --> {label: ids of the values for the tokens of the sentence}
+        self.constituency_extractor = None
+        self.deepest_phrase_for_term_id = None     #Term id --> label of the deepest constituent
+        self.dependency_extractor = None
+        self.dependency_path_positions_for_term_id = {}
+        self.extractor_lock = threading.Lock()
+
+        for num_token, token in enumerate(naf_obj.get_tokens()):
+            token_id = token.get_id()
+            sent_id = token.get_sent()
+            if sent_id not in self.token_ids_for_sentence:
+                self.sentence_ids.append(sent_id)
+                self.token_ids_for_sentence[sent_id] = []
+            self.token_ids_for_sentence[sent_id].append(token_id)
+            self.sentence_for_token_id[token_id] = sent_id
+            self.num_token_for_token_id[token_id] = num_token
+
+        for term in naf_obj.get_terms():
+            term_id = term.get_id()
+            token_ids = term.get_span().get_span_ids()
+            self.token_ids_for_term_id[term_id] = token_ids
+            for token_id in token_ids:
+                self.term_id_for_token_id[token_id] = term_id
+
+
+    def get_position_by_offset(self, token_id):
+        '''
+        Position of the token when all the tokens are sorted by decreasing offset
+        '''
+        if self.position_by_offset_for_token_id is None:
+            list_ids_offset = []
+            for token in self.naf_obj.get_tokens():
+                list_ids_offset.append((token.get_id(),int(token.get_offset())))
+            position_by_offset_for_token_id = {}
+            for num_token, (this_id, this_offset) in enumerate(sorted(list_ids_offset, key=lambda t: -t[1])):
+                position_by_offset_for_token_id[this_id] = num_token
+            self.position_by_offset_for_token_id = position_by_offset_for_token_id
+        return self.position_by_offset_for_token_id[token_id]
+
+
+    def get_static_columns(self, sentence_id, static_features):
+        '''
+        Values, ready to be written, of the features of the sentence that do not depend on the opinions (token,
+        lemma, pos...) as {label: array of ids in feature_values, in the order of the tokens}. static_features are
+        the features of the registry of the step (see feature_registry) that are needed, every one is extracted
+        the first time it's requested and then shared by the expression, target and holder steps and all the
+        opinions of the sentence
+        '''
+        static_columns = self.static_columns_for_sentence.get(sentence_id)
+        if static_columns is None:
+            static_columns = self.static_columns_for_sentence.setdefault(sentence_id, {})
+        missing_features = []
+        for feature in static_features:
+            for label in feature.labels:
+                if label not in static_columns:
+                    missing_features.append(feature)
+                    break
+        if len(missing_features) != 0:
+            token_ids = self.token_ids_for_sentence.get(sentence_id, [])
+            features = {}
+            for token_id in token_ids:
+                features[token_id] = {}
+            new_columns = {}
+            for feature in missing_features:
+                feature.extract(self.naf_obj, token_ids, features)
+                for label in feature.labels:
+                    values = []
+                    for token_id in token_ids:
+                        feature_value = features[token_id].get(label)
+                        if feature_value is None:
+                            feature_value = '-'
+                        values.append(feature_value.replace(' ','_'))
+                    new_columns[label] = self.feature_values.get_ids(values)
+            #All the new columns are added at once, the other step can be reading them
+            static_columns.update(new_columns)
+        return static_columns
+
+
+    def get_constituency_extractor(self):
+        #The extractors can be requested at the same time by the target and holder steps
+        with self.extractor_lock:
+            if self.constituency_extractor is None:
+                self.constituency_extractor = self.naf_obj.get_constituency_extractor()
+            return self.constituency_extractor
+
+
+    def get_deepest_phrase(self, term_id):
+        '''
+        Label of the deepest constituent of the term (as get_deepest_phrase_for_termid of the constituency extractor),
+        the labels for all the terms are obtained together the first time
+        '''
+        if self.deepest_phrase_for_term_id is None:
+            extractor = self.get_constituency_extractor()
+            deepest_phrase_for_term_id = {}
+            if extractor is not None:
+                for term_id_in_tree, terminal_id in extractor.terminal_for_term.items():
+                    first_path = extractor.paths_for_terminal[terminal_id][0]
+                    if len(first_path) > 1:
+                        deepest_phrase_for_term_id[term_id_in_tree] = extractor.label_for_nonter.get(first_path[1])
+            self.deepest_phrase_for_term_id = deepest_phrase_for_term_id
+        return self.deepest_phrase_for_term_id.get(term_id)
+
+
+    def get_dependency_extractor(self):
+        with self.extractor_lock:
+            if self.dependency_extractor is None:
+                self.dependency_extractor = self.naf_obj.get_dependency_extractor()
+            return self.dependency_extractor
+
+
+    def get_dependency_path_positions(self, term_id):
+        '''
+        Position of every term in the dependency paths from term_id to the root, computed once per term
+        '''
+        first_positions = self.dependency_path_positions_for_term_id.get(term_id)
+        if first_positions is None:
+            first_positions = get_first_positions(self.get_dependency_extractor().paths_for_termid[term_id])
+            self.dependency_path_positions_for_term_id[term_id] = first_positions
+        return first_positions
+
+
+def get_document_index(naf_obj):
+    '''
+    Returns the index of the KAF/NAF object, created the first time and stored as the attribute document_index
+    '''
+    document_index = getattr(naf_obj, 'document_index', None)
+    if document_index is None:
+        document_index = DocumentIndex(naf_obj)
+        naf_obj.document_index = document_index
+    return document_index
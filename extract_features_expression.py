@@ -5,11 +5,18 @@ import sys
 import os
 import argparse
 import tempfile
+import io
 
 
 from KafNafParserPy import KafNafParser, KafNafParserMod
 from collections import defaultdict
 import KafNafParserPy
+from document_index import get_document_index
+from naf_reader import NafReader
+from feature_columns import SequenceColumns
+from feature_registry import FeatureRegistry, get_template_columns
+from feature_cache import FeatureCache, get_configuration_hash, process_files
+from corpus_manifest import CorpusManifest
 
 try:
     import pickle as pickler
@@ -20,29 +27,12 @@ except:
 WORDNET_LEXICON_FILENAME = 'my_wn_exp_lex.bin'
 TRAINING_FILENAME='training.expression'
 TESTING_FILENAME='testing.expression'
+MODEL_FILENAME = 'model.expression'
 RESOURCES_FOLDER = 'resources'
 PARAMETERS_FILENAME = 'parameters.expression'
-
-def create_structures(naf_obj, filename):
-    '''
-    Creates some structures and indexes that will be stored as public attributes of the kafnafparser object
-    '''
-    #naf_obj.filename = filename
-    naf_obj.list_sentence_ids = []
-    naf_obj.num_token_for_token_id = {}
-    
-    for num_token, token in enumerate(naf_obj.get_tokens()):
-        sent_id = token.get_sent()
-        if sent_id not in naf_obj.list_sentence_ids:
-            naf_obj.list_sentence_ids.append(sent_id)
-        naf_obj.num_token_for_token_id[token.get_id()] = num_token
-    
-    naf_obj.termid_for_tokenid = {}
-    for term in naf_obj.get_terms():
-        list_tokens= term.get_span().get_span_ids()
-        for token_id in list_tokens:
-            naf_obj.termid_for_tokenid[token_id] = term.get_id()
-             
+MANIFEST_FILENAME = 'manifest.expression'
+PATH_SENTIMENT_NVA_GI42 = '/home/izquierdo/cltl_repos/opinion_miner_deluxe/clean/lexicons/sentiment-nva-gi42.txt'
+PATH_LEXOUT_90000 = '/home/izquierdo/cltl_repos/opinion_miner_deluxe/clean/lexicons/lexOut_90000_monovalue.txt'
 
 def get_sentence_id_for_opinion(naf_obj,this_opinion):
     '''
@@ -106,7 +96,7 @@ def extract_terms_pos(naf_obj,list_token_ids, features):
     
     
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         features[token_id][lemma_label] = term_obj.get_lemma()
         features[token_id][pos_label] = term_obj.get_pos()
@@ -119,8 +109,6 @@ def extract_terms_pos(naf_obj,list_token_ids, features):
 def extract_mpqa(naf_obj, list_token_ids, features, overall_options):
     mpqa_label = 'in_mpqa_lexicon'
 
-    constituency_extractor = naf_obj.get_constituency_extractor()
-    
     #if overall_options.get('use_mpqa_lexicon',False):
     #    mpqa_lexicon = overall_options.get('wordnet_lexicon')
     #else:
@@ -133,7 +121,7 @@ def extract_mpqa(naf_obj, list_token_ids, features, overall_options):
         return [mpqa_label]
     
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         
         if features[token_id].get(mpqa_label) is None:
@@ -148,8 +136,8 @@ def extract_mpqa(naf_obj, list_token_ids, features, overall_options):
                 features[token_id][mpqa_label] = '1'
                 
                 ##Add also the other in the same chunk
-                if False and constituency_extractor is not None:
-                    deepest_chunk_and_terms = constituency_extractor.get_deepest_phrase_for_termid(term_id)  #('NP', ['t6', 't7', 't8'])
+                if False and naf_obj.document_index.get_constituency_extractor() is not None:
+                    deepest_chunk_and_terms = naf_obj.document_index.get_constituency_extractor().get_deepest_phrase_for_termid(term_id)  #('NP', ['t6', 't7', 't8'])
                     for sub_term_id in deepest_chunk_and_terms[1]:
                         sub_token_ids = naf_obj.get_term(sub_term_id).get_span().get_span_ids()
                         for sub_token_id in sub_token_ids:
@@ -172,7 +160,7 @@ def extract_wordnet_lexicon(naf_obj, list_token_ids, features, overall_parameter
         return [this_label]
     
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         frequency_in_wordnet_lexicon = 0
         if wordnet_lexicon is not None:
@@ -198,20 +186,17 @@ def extract_custom_lexicon(naf_obj,list_token_ids, features, custom_lexicon):
 
 def extract_chunks(naf_obj, list_token_ids, features):
     this_label = 'deepest_chunk'
-    extractor = naf_obj.get_constituency_extractor()
-    if extractor is not None:
+    if naf_obj.document_index.get_constituency_extractor() is not None:
         for token_id in list_token_ids:
-            term_id = naf_obj.termid_for_tokenid[token_id]
-            term_obj = naf_obj.get_term(term_id)
-            deepest_chunk_and_terms = extractor.get_deepest_phrase_for_termid(term_obj.get_id())
-            features[token_id][this_label] = deepest_chunk_and_terms[0]
+            term_id = naf_obj.document_index.term_id_for_token_id[token_id]
+            features[token_id][this_label] = naf_obj.document_index.get_deepest_phrase(term_id)
     return [this_label]
 
 
 def extract_sentiment_nva(naf_obj,list_token_ids,features, overall_parameters):
     this_label = 'sentiment_nva'
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         if term_obj is not None:
             lemma = term_obj.get_lemma().lower()
@@ -228,7 +213,7 @@ def extract_sentiment_nva(naf_obj,list_token_ids,features, overall_parameters):
 def extract_lexOut_90000(naf_obj,list_token_ids,features, overall_parameters):
     this_label = 'lexOut'
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         if term_obj is not None:
             lemma = term_obj.get_lemma().lower()
@@ -246,7 +231,7 @@ def extract_lexOut_90000(naf_obj,list_token_ids,features, overall_parameters):
 def extract_from_lexicon(naf_obj,list_token_ids,features, overall_parameters):
     this_label = 'custom_lexicon'
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         if term_obj is not None:
             lemma = term_obj.get_lemma().lower()
@@ -259,65 +244,53 @@ def extract_from_lexicon(naf_obj,list_token_ids,features, overall_parameters):
             
     
 
-def create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions=[], output=sys.stdout, log=False):
+##############################################
+## FEATURES OF THE SEQUENCES, IN THE ORDER OF THE COLUMNS
+##############################################
+FEATURES = FeatureRegistry()
+FEATURES.add(['token'], extract_tokens, static=True)
+FEATURES.add(['lemma', 'pos'], extract_terms_pos, static=True)
+#The MPQA column is extracted for all the models, also the ones trained without use_mpqa_lexicon (-mpqa)
+FEATURES.add(['in_mpqa_lexicon'], extract_mpqa, arguments=['overall_parameters'])
+FEATURES.add(['in_wordnet_lexicon'], extract_wordnet_lexicon, arguments=['overall_parameters'], parameter='use_wordnet_lexicon')
+FEATURES.add(['deepest_chunk'], extract_chunks, static=True)
+#Not used by default, the columns are only included if the model is trained with the parameter. The custom
+#lexicons must be given already loaded as custom_lexicon in the parameters
+FEATURES.add(['sentiment_nva'], extract_sentiment_nva, arguments=['overall_parameters'], parameter='use_sentiment_nva', optional=True)
+FEATURES.add(['lexOut'], extract_lexOut_90000, arguments=['overall_parameters'], parameter='use_lexout_90000', optional=True)
+FEATURES.add(['custom_lexicon'], extract_from_lexicon, arguments=['overall_parameters'], parameter='use_custom_lexicon', optional=True)
+FEATURES.add(['in_custom_lexicon'], extract_custom_lexicon, arguments=['custom_lexicon'], parameter='use_custom_lexicon_tokens', optional=True)
+
+
+def write_sequence(sequence, output):
+    '''
+    Writes the sequence in CRF++ format, or appends it to the output if it is a list (sequences kept in memory)
+    '''
+    if isinstance(output, list):
+        output.append(sequence)
+    else:
+        sequence.write(output)
+
+
+def create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions=[], output=sys.stdout, log=False, features_to_extract=None):
     if log:
         print('\t\tCreating sequence for the sentence', sentence_id, 'and the opinions', ' '.join(opinion.get_id() for opinion in list_opinions), file=sys.stderr)
         
     # Get all the token ids that belong to the sentence id
-    token_ids = []
+    token_ids = naf_obj.document_index.token_ids_for_sentence.get(sentence_id, [])
+    if features_to_extract is None:
+        features_to_extract = FEATURES.get_features_to_extract(overall_parameters)
+    static_columns = naf_obj.document_index.get_static_columns(sentence_id, [feature for feature in features_to_extract if feature.static])
     features = {}
-    for token in naf_obj.get_tokens():
-        if token.get_sent() == sentence_id:
-            token_ids.append(token.get_id())
-            features[token.get_id()] = {}
+    for token_id in token_ids:
+        features[token_id] = {}
     
     ####################################    
     ## EXTRACTING FEATURES
     ####################################
-    list_feature_labels = []
-    
-    ## Tokens
-    feature_labels = extract_tokens(naf_obj,token_ids, features)
-    list_feature_labels.extend(feature_labels)
-    
-     ## Terms and POS
-    feature_labels = extract_terms_pos(naf_obj,token_ids, features)
-    list_feature_labels.extend(feature_labels)
-    
-    
-    #MPQA lexicon
-    feature_labels = extract_mpqa(naf_obj, token_ids, features, overall_parameters)
-    list_feature_labels.extend(feature_labels)
-    
-    #WORDNET LEXICON
-    feature_labels = extract_wordnet_lexicon(naf_obj, token_ids, features, overall_parameters)
-    list_feature_labels.extend(feature_labels)
-
-    
-    #Chunks
-    feature_labels = extract_chunks(naf_obj, token_ids, features)
-    list_feature_labels.extend(feature_labels)
-    
-    ##sentiment_vna
-    #feature_labels = extract_sentiment_nva(naf_obj,token_ids,features, overall_parameters)
-    #list_feature_labels.extend(feature_labels)
-    
-    ##lexOut 90000
-    #feature_labels = extract_lexOut_90000(naf_obj,token_ids,features, overall_parameters)
-    #list_feature_labels.extend(feature_labels)
-    
-    
-    #USA STE BONICO
-    ##This is good one to use
-    #feature_labels = extract_from_lexicon(naf_obj,token_ids,features, overall_parameters)
-    #list_feature_labels.extend(feature_labels)
-    
-    ########
-    # We dont use the custom lexicon for now
-    #feature_labels = extract_custom_lexicon(naf_obj, token_ids, features, overall_parameters.get('custom_lexicon'))
-    #list_feature_labels.extend(feature_labels)
-    ##############
-    ####
+    #The static features are already extracted for the sentence, and the columns not used by the model are left empty
+    list_feature_labels = FEATURES.get_column_labels(overall_parameters)
+    FEATURES.extract(features_to_extract, naf_obj, token_ids, features, {'overall_parameters': overall_parameters, 'custom_lexicon': overall_parameters.get('custom_lexicon')})
     
     ##################
     ## THE TOKENS THAT ARE EXPRESSION
@@ -326,38 +299,37 @@ def create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions=[],
         opinion_expression_token_list = opinion_expression_token_list | set(get_token_ids_for_opinion_expression(naf_obj, opinion))
         
     ##PRINT THE SEQUENCE
-    for token_id in token_ids:
-        values_to_print = []
-        values_to_print.append(naf_obj.filename+'#'+token_id)
-        
-        for feature_label in list_feature_labels:
+    #One column per feature, the values are kept in the string table of the document
+    sequence = SequenceColumns(naf_obj.document_index.feature_values, naf_obj.filename+'#', token_ids)
+    for feature_label in list_feature_labels:
+        if feature_label in static_columns:
+            sequence.add_column_ids(static_columns[feature_label])
+            continue
+        values = []
+        for token_id in token_ids:
             feature_value = features[token_id].get(feature_label,'-')
             if feature_value == None:
                 feature_value = '-'
-            
-            feature_value = feature_value.replace(' ','_')
-            values_to_print.append(feature_value)
-            
-        #######################################################
-        #The class, in this case is the expression
-        #######################################################
-        this_class = None
+            values.append(feature_value.replace(' ','_'))
+        sequence.add_column(values)
+        
+    #######################################################
+    #The class, in this case is the expression
+    #######################################################
+    classes = []
+    for token_id in token_ids:
         if token_id in opinion_expression_token_list:
-            this_class = 'DSE'
+            classes.append('DSE')
         else:
-            this_class = 'O'
-        
-        #In case we do not want to include the DSE label in the test file (it's not used by the system for tagging)    
-        #if overall_parameters['is_test']:
-        #    this_class = 'O'
-             
-        values_to_print.append(this_class)
-        ############################################
-
-        this_str = '\t'.join(values_to_print)
-        output.write(this_str+'\n')        
-        #print '\t'.join(values_to_print)
-    output.write('\n')
+            classes.append('O')
+    
+    #In case we do not want to include the DSE label in the test file (it's not used by the system for tagging)    
+    #if overall_parameters['is_test']:
+    #    classes = ['O']*len(token_ids)
+         
+    sequence.add_column(classes)
+    ############################################
+    write_sequence(sequence, output)
     
     
 
@@ -394,7 +366,7 @@ def map_pos_to_sentiment_nva(this_pos):
          
 def load_sentiment_nva_gi42():
     this_lexicon = {}
-    path_to_file = '/home/izquierdo/cltl_repos/opinion_miner_deluxe/clean/lexicons/sentiment-nva-gi42.txt'
+    path_to_file = PATH_SENTIMENT_NVA_GI42
     fd = open(path_to_file)
     polarities_for_lemma = defaultdict(set)
     for line in fd:
@@ -412,7 +384,7 @@ def load_sentiment_nva_gi42():
             
 def load_lexOut_90000():
     this_lexicon = {}
-    path_to_file = '/home/izquierdo/cltl_repos/opinion_miner_deluxe/clean/lexicons/lexOut_90000_monovalue.txt'
+    path_to_file = PATH_LEXOUT_90000
     fd = open(path_to_file)
     polarities_for_lemma = defaultdict(set)
     for line in fd:
@@ -429,20 +401,126 @@ def load_lexOut_90000():
     fd.close()
     return this_lexicon
 
-def main(inputfile, type, folder, overall_parameters={},log=False):
+
+def load_parameters(folder):
+    '''
+    Loads the parameters stored in the model folder when the model was trained
+    '''
+    parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
+    fd_param = open(parameter_filename,'rb')
+    try:
+        overall_parameters = pickler.load(fd_param,encoding='bytes')
+    except TypeError:
+        overall_parameters = pickler.load(fd_param)
+    fd_param.close()
+    return overall_parameters
+
+
+def process_file(filename, type, overall_parameters, features_to_extract, output_fd, gold_fd=None, log=False):
+    '''
+    Extracts the features of one KAF/NAF file (or object) and writes its sequences to output_fd
+    '''
+    if log:
+        print('EXPRESSION: processing file', filename, file=sys.stderr)
+    
+    if isinstance(filename,(KafNafParser,NafReader)):
+        naf_obj = filename
+    else:
+        #Only the layers needed for the features are read
+        naf_obj = NafReader(filename)
+    get_document_index(naf_obj)
+    
+    #Extract all the opinions
+    opinions_per_sentence = defaultdict(list)
+    num_opinions = 0
+    for opinion in naf_obj.get_opinions():
+        exp = opinion.get_expression()
+        if exp is not None:
+            p = exp.get_polarity()
+            
+            if p != 'NON-OPINIONATED':
+                #if p.startswith('D-'):           
+                sentence_id = get_sentence_id_for_opinion(naf_obj,opinion)
+                if sentence_id is not None:
+                    opinions_per_sentence[sentence_id].append(opinion)
+                    num_opinions += 1
+    if log:
+        print('\tNum of opinions:', num_opinions, file=sys.stderr)
+    
+    
+    if type == 'train':
+        ############################
+        # One sequence per sentence
+        ############################
+        for sentence_id in naf_obj.document_index.sentence_ids:
+            opinions_in_sent = opinions_per_sentence.get(sentence_id,[])
+            if len(opinions_in_sent) != 0:
+                ##Only sentences with opinions
+                create_sequence(naf_obj, sentence_id, overall_parameters, opinions_in_sent, output = output_fd, features_to_extract = features_to_extract)
+    elif type == 'test':
+        #TESTING CASE
+        #For the testing, one sequence is created for every sentence
+        for sentence_id in naf_obj.document_index.sentence_ids:
+            opinions_in_sent = opinions_per_sentence.get(sentence_id,[])
+            if len(opinions_in_sent) != 0:
+                #Only tested on sentences with opinions
+                create_sequence(naf_obj, sentence_id, overall_parameters, opinions_in_sent,output = output_fd, features_to_extract = features_to_extract)
+                
+        ## Create the gold standard data also
+        opinion_list = []
+        for this_sentence, these_opinions in list(opinions_per_sentence.items()):
+            opinion_list.extend(these_opinions)
+        if gold_fd is not None:
+            create_gold_standard(naf_obj,opinion_list,gold_fd)
+    elif type == 'tag':
+        #TAGGING CASE
+        # All the sentences are considered
+        for sentence_id in naf_obj.document_index.sentence_ids:
+            create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions = [],output = output_fd, log=log, features_to_extract = features_to_extract)
+
+
+#Arguments of every worker process when the files are processed in parallel (-j)
+worker_arguments = None
+
+def init_worker(this_type, overall_parameters, features_to_extract, with_gold_standard, log):
+    global worker_arguments
+    worker_arguments = (this_type, overall_parameters, features_to_extract, with_gold_standard, log)
+
+
+def process_file_in_worker(filename):
+    '''
+    Processes one file in a worker process and returns its sequences and gold standard (None if not needed) as text
+    '''
+    this_type, overall_parameters, features_to_extract, with_gold_standard, log = worker_arguments
+    output = io.StringIO()
+    gold_output = None
+    if with_gold_standard:
+        gold_output = io.StringIO()
+    process_file(filename, this_type, overall_parameters, features_to_extract, output, gold_output, log=log)
+    if gold_output is None:
+        return output.getvalue(), None
+    return output.getvalue(), gold_output.getvalue()
+
+
+def main(inputfile, type, folder, overall_parameters=None,log=False, in_memory=False, num_processes=1, cache_folder=None):
     files = []
     output_fd = None
+    manifest = None
+    if overall_parameters is None and type != 'tag':
+        overall_parameters = {}
     if type == 'train':
         if not os.path.isdir(folder):
             os.mkdir(folder)
         res_fol = os.path.join(folder,RESOURCES_FOLDER)
         if not os.path.isdir(res_fol):
             os.mkdir(res_fol)
-        output_fd = open(folder+'/'+TRAINING_FILENAME,'w')
+        #Manifest of the files of the previous training file, only the new and modified files are processed again
+        manifest = CorpusManifest(os.path.join(folder,MANIFEST_FILENAME), folder+'/'+TRAINING_FILENAME)
+        output_fd = open(manifest.new_output_filename,'w')
             
         ##Save the parametes
         parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
-        fd_parameter = open(parameter_filename,'w')
+        fd_parameter = open(parameter_filename,'wb')
         pickler.dump(overall_parameters,fd_parameter,protocol=0)
         print('Parameters saved to file %s' % parameter_filename, file=sys.stderr)
         fd_parameter.close()
@@ -454,24 +532,23 @@ def main(inputfile, type, folder, overall_parameters={},log=False):
         fin.close()
         
     elif type == 'tag':
-        parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
-        fd_param = open(parameter_filename,'rb')
-        try:
-            overall_parameters = pickler.load(fd_param,encoding='bytes')
-        except TypeError:
-            overall_parameters = pickler.load(fd_param)
-        fd_param.close()
-
-        #Input is a isngle file
-        files.append(inputfile)
+        #The parameters can be given already loaded (tagging server)
+        if overall_parameters is None:
+            overall_parameters = load_parameters(folder)
+
+        #Input is a single file or a list of them (batch)
+        if isinstance(inputfile, list):
+            files.extend(inputfile)
+        else:
+            files.append(inputfile)
         
-        #Output FD will be a temporary file
-        output_fd = tempfile.NamedTemporaryFile('w', delete=False)
+        #Output FD will be a temporary file, or a list of sequences if they are tagged in memory
+        if in_memory:
+            output_fd = []
+        else:
+            output_fd = tempfile.NamedTemporaryFile('w', delete=False)
     elif type == 'test':
-        parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
-        fd_param = open(parameter_filename,'r')
-        these_overall_parameters = pickler.load(fd_param)
-        fd_param.close()
+        these_overall_parameters = load_parameters(folder)
         for opt, val in list(these_overall_parameters.items()):
             overall_parameters[opt] = val
         
@@ -483,18 +560,25 @@ def main(inputfile, type, folder, overall_parameters={},log=False):
         output_fd = open(folder+'/'+TESTING_FILENAME,'w')
         
           
-    ##Load the sentiment-nva-gi42.txt
-    ##overall_parameters['sentiment-nva-gi42'] = load_sentiment_nva_gi42()  
+    #Features to extract, when tagging only the ones read by the templates of the model
+    used_columns = None
+    if type == 'tag':
+        used_columns = get_template_columns(os.path.join(folder, MODEL_FILENAME))
+    features_to_extract = FEATURES.get_features_to_extract(overall_parameters, used_columns)
     
+    #Lexicons for the features, already loaded if the parameters are kept in memory between calls
+    if FEATURES.is_extracted('sentiment_nva', features_to_extract) and overall_parameters.get('sentiment-nva-gi42') is None:
+        overall_parameters['sentiment-nva-gi42'] = load_sentiment_nva_gi42()
     
-    ##overall_parameters['lexOut_90000_monovalue'] = load_lexOut_90000()
+    if FEATURES.is_extracted('lexOut', features_to_extract) and overall_parameters.get('lexOut_90000_monovalue') is None:
+        overall_parameters['lexOut_90000_monovalue'] = load_lexOut_90000()
 
-    ###if overall_parameters['use_mpqa_lexicon']:
-    from mpqa_lexicon import MPQA_subjectivity_lexicon
-    overall_parameters['mpqa_lexicon'] = MPQA_subjectivity_lexicon()
+    if FEATURES.is_extracted('in_mpqa_lexicon', features_to_extract) and overall_parameters.get('mpqa_lexicon') is None:
+        from mpqa_lexicon import MPQA_subjectivity_lexicon
+        overall_parameters['mpqa_lexicon'] = MPQA_subjectivity_lexicon()
     
     
-    if overall_parameters.get('use_wordnet_lexicon', False):
+    if FEATURES.is_extracted('in_wordnet_lexicon', features_to_extract) and overall_parameters.get('wordnet_lexicon') is None:
         from wordnet_lexicon import WordnetLexicon
         wordnet_lexicon_expression = WordnetLexicon()
         complete_wn_filename = os.path.join(folder, RESOURCES_FOLDER, WORDNET_LEXICON_FILENAME) 
@@ -502,13 +586,30 @@ def main(inputfile, type, folder, overall_parameters={},log=False):
         if type == 'train':
             #We create it from the training files
             print('Creating WORDNET LEXICON FILE from %d files and storing it on %s' % (len(files), complete_wn_filename), file=sys.stderr)
-            wordnet_lexicon_expression.create_from_files(files,'expression')
+            wordnet_lexicon_expression.create_from_files(files,'expression',num_processes)
             wordnet_lexicon_expression.save_to_file(complete_wn_filename)
         else:
             #READ IT
             wordnet_lexicon_expression.load_from_file(complete_wn_filename)
         overall_parameters['wordnet_lexicon'] = wordnet_lexicon_expression
         
+    #Files of the lexicons, part of the key of the feature cache
+    resource_files = []
+    if FEATURES.is_extracted('sentiment_nva', features_to_extract):
+        resource_files.append(PATH_SENTIMENT_NVA_GI42)
+    if FEATURES.is_extracted('lexOut', features_to_extract):
+        resource_files.append(PATH_LEXOUT_90000)
+    if FEATURES.is_extracted('in_mpqa_lexicon', features_to_extract):
+        from mpqa_lexicon import PATH_MPQA_LEXICON
+        resource_files.append(PATH_MPQA_LEXICON)
+    if FEATURES.is_extracted('in_wordnet_lexicon', features_to_extract):
+        resource_files.append(os.path.join(folder, RESOURCES_FOLDER, WORDNET_LEXICON_FILENAME))
+    if FEATURES.is_extracted('custom_lexicon', features_to_extract) or FEATURES.is_extracted('in_custom_lexicon', features_to_extract):
+        #The custom lexicons are given already loaded, the cache can not know if they change
+        if cache_folder is not None:
+            print('The feature cache is not used with custom lexicons', file=sys.stderr)
+        cache_folder = None
+        
     gold_fd = None    
     gold_filename = overall_parameters.get('gold_standard')
     if gold_filename is not None:
@@ -516,80 +617,40 @@ def main(inputfile, type, folder, overall_parameters={},log=False):
           
     #Processing every file
     
-    #### FOR THE CUSTOM LEXICON
-    #from customized_lexicon import CustomizedLexicon
-    #overall_parameters['custom_lexicon'] = CustomizedLexicon()
-    #overall_parameters['custom_lexicon'].load_from_filename('EXP.nl')
-    ###########################
-
-    #from customized_lexicon import CustomizedLexicon
-    #overall_parameters['custom_lexicon'] = CustomizedLexicon()
-    #overall_parameters['custom_lexicon'].load_for_language('it')
-    
-    for filename in files:
-        if log:
-            print('EXPRESSION: processing file', filename, file=sys.stderr)
-        
-        if isinstance(filename,KafNafParser):
-            naf_obj = filename
-        else:
-            naf_obj = KafNafParser(filename)
-        create_structures(naf_obj, filename)
-        
-        #Extract all the opinions
-        opinions_per_sentence = defaultdict(list)
-        num_opinions = 0
-        for opinion in naf_obj.get_opinions():
-            exp = opinion.get_expression()
-            if exp is not None:
-                p = exp.get_polarity()
-                
-                if p != 'NON-OPINIONATED':
-                    #if p.startswith('D-'):           
-                    sentence_id = get_sentence_id_for_opinion(naf_obj,opinion)
-                    if sentence_id is not None:
-                        opinions_per_sentence[sentence_id].append(opinion)
-                        num_opinions += 1
-        if log:
-            print('\tNum of opinions:', num_opinions, file=sys.stderr)
-        
-        
-        if type == 'train':
-            ############################
-            # One sequence per sentence
-            ############################
-            for sentence_id in naf_obj.list_sentence_ids:
-                opinions_in_sent = opinions_per_sentence.get(sentence_id,[])
-                if len(opinions_in_sent) != 0:
-                    ##Only sentences with opinions
-                    create_sequence(naf_obj, sentence_id, overall_parameters, opinions_in_sent, output = output_fd)
-        elif type == 'test':
-            #TESTING CASE
-            #For the testing, one sequence is created for every sentence
-            for sentence_id in naf_obj.list_sentence_ids:
-                opinions_in_sent = opinions_per_sentence.get(sentence_id,[])
-                if len(opinions_in_sent) != 0:
-                    #Only tested on sentences with opinions
-                    create_sequence(naf_obj, sentence_id, overall_parameters, opinions_in_sent,output = output_fd)
-                    
-            ## Create the gold standard data also
-            opinion_list = []
-            for this_sentence, these_opinions in list(opinions_per_sentence.items()):
-                opinion_list.extend(these_opinions)
+    if type != 'tag':
+        #The files are processed in a pool of processes (-j) and their output is written in the order of the list.
+        #The files found in the feature cache (-cache) are not processed again
+        feature_cache = None
+        if cache_folder is not None:
+            feature_cache = FeatureCache(cache_folder, 'expression', type, overall_parameters, resource_files)
+        if manifest is not None:
+            manifest.set_configuration(get_configuration_hash('expression', type, overall_parameters, resource_files))
+        worker_parameters = (type, overall_parameters, features_to_extract, gold_fd is not None, log)
+        for sequences, gold_standard in process_files(files, init_worker, process_file_in_worker, worker_parameters, num_processes, feature_cache, gold_fd is not None, manifest):
+            output_fd.write(sequences)
             if gold_fd is not None:
-                create_gold_standard(naf_obj,opinion_list,gold_fd)
-        elif type == 'tag':
-            #TAGGING CASE
-            # All the sentences are considered
-            for sentence_id in naf_obj.list_sentence_ids:
-                create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions = [],output = output_fd, log=log)
+                gold_fd.write(gold_standard)
+    else:
+        for filename in files:
+            process_file(filename, type, overall_parameters, features_to_extract, output_fd, gold_fd, log)
+
+    if log:
+        for lexicon_name in ['mpqa_lexicon', 'wordnet_lexicon']:
+            if overall_parameters.get(lexicon_name) is not None:
+                overall_parameters[lexicon_name].memo.report()
             
             
     if gold_fd is not None:
         gold_fd.close() 
         print('Gold standard in the file %s' % gold_fd.name, file=sys.stderr)
         
+    if in_memory:
+        return output_fd
     output_fd.close()
+    if manifest is not None:
+        #The training file is only replaced once the new one is complete
+        manifest.save()
+        return manifest.output_filename
     return output_fd.name
     
 
@@ -603,6 +664,8 @@ if __name__ == '__main__':
     argument_parser.add_argument('-wn_lex', dest='use_wn_lexicon', action='store_true', help='Use the WordNet lexicon')
     argument_parser.add_argument('-f', dest='folder', required=True, help='Folder to store the data')
     argument_parser.add_argument('-gs', dest='gold_standard', help='File to store the gold standard annotations (For evaluation)')
+    argument_parser.add_argument('-j', dest='num_processes', type=int, default=1, help='Number of processes to extract the features for training/testing (default 1)')
+    argument_parser.add_argument('-cache', dest='cache_folder', help='Folder to cache the features of every file for training/testing')
     args = argument_parser.parse_args()
     
     
@@ -619,5 +682,5 @@ if __name__ == '__main__':
            
    
         
-    main(args.inputfile,args.type, args.folder, overall_parameters)
+    main(args.inputfile,args.type, args.folder, overall_parameters, num_processes=args.num_processes, cache_folder=args.cache_folder)
     
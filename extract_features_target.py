@@ -4,8 +4,16 @@ from __future__ import print_function
 import sys
 import os
 import tempfile
+import io
 import argparse
 from KafNafParserPy import KafNafParser
+from document_index import get_document_index
+from naf_reader import NafReader
+from feature_columns import SequenceColumns
+from feature_registry import FeatureRegistry, get_template_columns
+from feature_cache import FeatureCache, get_configuration_hash, process_files
+from corpus_manifest import CorpusManifest
+from dependency_paths import DependencyPathsToSpan
 from collections import defaultdict
 
 try:
@@ -15,28 +23,9 @@ except:
 
 TRAINING_FILENAME='training.target'
 TESTING_FILENAME='testing.target'
+MODEL_FILENAME = 'model.target'
 PARAMETERS_FILENAME = 'parameters.target'
-
-def create_structures(naf_obj, filename):
-    '''
-    Creates some structures and indexes that will be stored as public attributes of the kafnafparser object
-    '''
-    #naf_obj.filename = filename
-    naf_obj.list_sentence_ids = []
-    naf_obj.num_token_for_token_id = {}
-    
-    for num_token, token in enumerate(naf_obj.get_tokens()):
-        sent_id = token.get_sent()
-        if sent_id not in naf_obj.list_sentence_ids:
-            naf_obj.list_sentence_ids.append(sent_id)
-        naf_obj.num_token_for_token_id[token.get_id()] = num_token
-    
-    naf_obj.termid_for_tokenid = {}
-    for term in naf_obj.get_terms():
-        list_tokens= term.get_span().get_span_ids()
-        for token_id in list_tokens:
-            naf_obj.termid_for_tokenid[token_id] = term.get_id()
-             
+MANIFEST_FILENAME = 'manifest.target'
 
 def get_sentence_id_for_opinion(naf_obj,this_opinion):
     '''
@@ -116,7 +105,7 @@ def extract_terms_pos(naf_obj,list_token_ids, features):
     
     
     for token_id in list_token_ids:
-        term_id = naf_obj.termid_for_tokenid[token_id]
+        term_id = naf_obj.document_index.term_id_for_token_id[token_id]
         term_obj = naf_obj.get_term(term_id)
         features[token_id][lemma_label] = term_obj.get_lemma()
         features[token_id][pos_label] = term_obj.get_pos()
@@ -126,13 +115,10 @@ def extract_terms_pos(naf_obj,list_token_ids, features):
 
 def extract_chunks(naf_obj, list_token_ids, features):
     this_label = 'deepest_chunk'
-    extractor = naf_obj.get_constituency_extractor()
-    if extractor is not None:
+    if naf_obj.document_index.get_constituency_extractor() is not None:
         for token_id in list_token_ids:
-            term_id = naf_obj.termid_for_tokenid[token_id]
-            term_obj = naf_obj.get_term(term_id)
-            deepest_chunk_and_terms = extractor.get_deepest_phrase_for_termid(term_obj.get_id())
-            features[token_id][this_label] = deepest_chunk_and_terms[0]
+            term_id = naf_obj.document_index.term_id_for_token_id[token_id]
+            features[token_id][this_label] = naf_obj.document_index.get_deepest_phrase(term_id)
     return [this_label]
 
 
@@ -149,56 +135,91 @@ def extract_dse(naf_obj, token_ids, features, opinion):
 
 
                 
-def extract_distance_dse_target(naf_obj, token_ids, features, opinion):
+def get_distances_to_dse(naf_obj, token_ids, list_opinions):
+    '''
+    Distances from the tokens to the DSE of every opinion, computed at once for all the opinions of the sentence.
+    Returns a matrix with one row per opinion: 0 for the tokens in the span of the DSE and the minimum of the
+    distances to the first and last tokens of the DSE for the rest
+    '''
+    import numpy
+    num_token_for_token_id = naf_obj.document_index.num_token_for_token_id
+    positions = numpy.array([num_token_for_token_id[token_id] for token_id in token_ids], dtype=numpy.int64)
+    
+    #Positions of the tokens of all the DSEs, one after the other, and where every DSE starts
+    expression_positions = []
+    starts = []
+    for opinion in list_opinions:
+        starts.append(len(expression_positions))
+        for eid in get_token_ids_for_opinion_expression(naf_obj, opinion):
+            expression_positions.append(num_token_for_token_id[eid])
+    expression_positions = numpy.array(expression_positions, dtype=numpy.int64)
+    min_pos_eid = numpy.minimum.reduceat(expression_positions, starts)[:,None]
+    max_pos_eid = numpy.maximum.reduceat(expression_positions, starts)[:,None]
+    
+    distances = numpy.minimum(positions[None,:]-min_pos_eid, positions[None,:]-max_pos_eid)
+    distances[(positions[None,:] >= min_pos_eid) & (positions[None,:] <= max_pos_eid)] = 0
+    return distances
+
+
+def extract_distance_dse_target(naf_obj, token_ids, features, opinion, distances=None):
+    '''
+    The distances can be given already computed for the opinion (a row of get_distances_to_dse)
+    '''
     label = 'distance_to_dse'
     if opinion is not None:
-        expression_ids = get_token_ids_for_opinion_expression(naf_obj, opinion)
-        min_pos_eid = max_pos_eid = None
-        for eid in expression_ids:
-            this_pos = naf_obj.num_token_for_token_id[eid]
-            if min_pos_eid is None or this_pos< min_pos_eid:
-                min_pos_eid = this_pos
-                
-            if max_pos_eid is None or this_pos > max_pos_eid:
-                max_pos_eid = this_pos
-        ###
-        for token_id in token_ids:
-            position = naf_obj.num_token_for_token_id[token_id]
-            if position>=min_pos_eid and position <= max_pos_eid:
-                dist = 0
-            else:
-                #d1 = abs(position-min_pos_eid)
-                #d2 = abs(position-max_pos_eid)
-                d1 = position-min_pos_eid
-                d2 = position-max_pos_eid
-                dist = min(d1,d2)
-            #features[token_id][label] = str(dist)
-            features[token_id][label] = str(dist//3)
+        if distances is None:
+            distances = get_distances_to_dse(naf_obj, token_ids, [opinion])[0]
+        for token_id, dist in zip(token_ids, (distances//3).tolist()):
+            features[token_id][label] = str(dist)
     return [label]
 
 
 
 def extract_dependency_path_to_dse(naf_obj,token_ids,features, opinion):
     label = 'dependency_path'
-    extractor = naf_obj.get_dependency_extractor()
+    extractor = naf_obj.document_index.get_dependency_extractor()
     if extractor is not None:
         if isinstance(opinion,list):
             expression_term_ids = []
             for token_id in opinion:
-                term_id = naf_obj.termid_for_tokenid[token_id]
+                term_id = naf_obj.document_index.term_id_for_token_id[token_id]
                 expression_term_ids.append(term_id)
         else:
             expression_term_ids = opinion.get_expression().get_span().get_span_ids()
 
+        #The paths of the expression are indexed once and shared by all the tokens
+        paths_to_dse = DependencyPathsToSpan(naf_obj.document_index, extractor, expression_term_ids)
         for token_id in token_ids:
-            term_id = naf_obj.termid_for_tokenid[token_id]
-            path = extractor.get_shortest_path_spans([term_id],expression_term_ids)
+            term_id = naf_obj.document_index.term_id_for_token_id[token_id]
+            path = paths_to_dse.get_shortest_path_to_span(term_id)
             if path is not None and len(path) > 0:
                 features[token_id][label] = '#'.join(path)
     return [label]
     
     
-def create_sequence(naf_obj, this_type, sentence_id, overall_parameters, opinion=None, output=sys.stdout, log=False):
+##############################################
+## FEATURES OF THE SEQUENCES, IN THE ORDER OF THE COLUMNS
+##############################################
+FEATURES = FeatureRegistry()
+FEATURES.add(['token'], extract_tokens, static=True)
+FEATURES.add(['lemma', 'pos'], extract_terms_pos, static=True)
+FEATURES.add(['distance_to_dse'], extract_distance_dse_target, arguments=['opinion', 'distances_to_dse'])
+FEATURES.add(['dependency_path'], extract_dependency_path_to_dse, arguments=['opinion'])
+FEATURES.add(['deepest_chunk'], extract_chunks, static=True)
+FEATURES.add(['DSE'], extract_dse, arguments=['opinion'])
+
+
+def write_sequence(sequence, output):
+    '''
+    Writes the sequence in CRF++ format, or appends it to the output if it is a list (sequences kept in memory)
+    '''
+    if isinstance(output, list):
+        output.append(sequence)
+    else:
+        sequence.write(output)
+
+
+def create_sequence(naf_obj, this_type, sentence_id, overall_parameters, opinion=None, output=sys.stdout, log=False, distances_to_dse=None, features_to_extract=None):
     
     if log and opinion is not None:
         if isinstance(opinion, list):
@@ -207,47 +228,21 @@ def create_sequence(naf_obj, this_type, sentence_id, overall_parameters, opinion
             print('\t\tCreating sequence for the sentence', sentence_id, 'and the opinion', opinion.get_id(), file=sys.stderr)
             
     # Get all the token ids that belong to the sentence id
-    token_ids = []
+    token_ids = naf_obj.document_index.token_ids_for_sentence.get(sentence_id, [])
+    if features_to_extract is None:
+        features_to_extract = FEATURES.get_features_to_extract(overall_parameters)
+    static_columns = naf_obj.document_index.get_static_columns(sentence_id, [feature for feature in features_to_extract if feature.static])
     features = {}
-    for token in naf_obj.get_tokens():
-        if token.get_sent() == sentence_id:
-            token_ids.append(token.get_id())
-            features[token.get_id()] = {}
+    for token_id in token_ids:
+        features[token_id] = {}
     
     ####################################    
     ## EXTRACTING FEATURES
     ####################################
-    list_feature_labels = []
-    
-    ## Tokens
-    feature_labels = extract_tokens(naf_obj,token_ids, features)
-    list_feature_labels.extend(feature_labels)
-    
-     ## Terms and POS
-    feature_labels = extract_terms_pos(naf_obj,token_ids, features)
-    list_feature_labels.extend(feature_labels)
-    
-    
-    feature_labels = extract_distance_dse_target(naf_obj, token_ids, features, opinion)
-    list_feature_labels.extend(feature_labels)
-   
-    
-    feature_labels = extract_dependency_path_to_dse(naf_obj, token_ids, features, opinion)
-    list_feature_labels.extend(feature_labels)
-    
-    
-    #Chunks
-    feature_labels = extract_chunks(naf_obj, token_ids, features)
-    list_feature_labels.extend(feature_labels)
-    
-    
-    
-    feature_labels = extract_dse(naf_obj, token_ids, features, opinion)  
-    list_feature_labels.extend(feature_labels)
+    #The static features are already extracted for the sentence, and the columns not used by the model are left empty
+    list_feature_labels = FEATURES.get_column_labels(overall_parameters)
+    FEATURES.extract(features_to_extract, naf_obj, token_ids, features, {'opinion': opinion, 'distances_to_dse': distances_to_dse})
     
-    
-    
-      
     ##################
     ## THE TOKENS THAT ARE TARGETS
         
@@ -256,32 +251,32 @@ def create_sequence(naf_obj, this_type, sentence_id, overall_parameters, opinion
         opinion_target_token_list = get_token_ids_for_opinion_target(naf_obj, opinion)
         
     ##PRINT THE SEQUENCE
-    for token_id in token_ids:
-        values_to_print = []
-        values_to_print.append(naf_obj.filename+'#'+token_id)
-        
-        for feature_label in list_feature_labels:
+    #One column per feature, the values are kept in the string table of the document
+    sequence = SequenceColumns(naf_obj.document_index.feature_values, naf_obj.filename+'#', token_ids)
+    for feature_label in list_feature_labels:
+        if feature_label in static_columns:
+            sequence.add_column_ids(static_columns[feature_label])
+            continue
+        values = []
+        for token_id in token_ids:
             feature_value = features[token_id].get(feature_label,'-')
             if feature_value is None:
                 feature_value = '-'
-            feature_value = feature_value.replace(' ','_')
-            values_to_print.append(feature_value)
-            
-        #######################################################
-        #The class, in this case is the expression
-        #######################################################
-        this_class = None
+            values.append(feature_value.replace(' ','_'))
+        sequence.add_column(values)
+        
+    #######################################################
+    #The class, in this case is the target
+    #######################################################
+    classes = []
+    for token_id in token_ids:
         if token_id in opinion_target_token_list:
-            this_class = 'TARGET'
+            classes.append('TARGET')
         else:
-            this_class = 'O'
-        values_to_print.append(this_class)
-        ############################################
-        
-        this_str = '\t'.join(values_to_print)
-        output.write(this_str+'\n')        
-        #print '\t'.join(values_to_print)
-    output.write('\n')
+            classes.append('O')
+    sequence.add_column(classes)
+    ############################################
+    write_sequence(sequence, output)
     
 
 def create_gold_standard_target(naf_obj,opinion_list,gold_fd):
@@ -302,19 +297,145 @@ def create_gold_standard_target(naf_obj,opinion_list,gold_fd):
                 values = [this_text for this_id, this_text, this_offset in list_text_tokens]
                 gold_fd.write('%s\t%s\t%s\n' % (label,(' '.join(values)),str_ids))
                 already_added.add(str_ids)
+
+
+def load_parameters(folder):
+    '''
+    Loads the parameters stored in the model folder when the model was trained
+    '''
+    parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
+    fd_param = open(parameter_filename,'rb')
+    try:
+        overall_parameters = pickler.load(fd_param,encoding='bytes')
+    except TypeError:
+        overall_parameters = pickler.load(fd_param)
+    fd_param.close()
+    return overall_parameters
+
+
+def process_file(filename, this_type, overall_parameters, features_to_extract, output_fd, gold_fd=None, detected_dse={}, log=False):
+    '''
+    Extracts the features of one KAF/NAF file (or object) and writes its sequences to output_fd
+    '''
+    if log:
+        print('TARGET: processing file', filename, file=sys.stderr)
+    
+    if isinstance(filename,(KafNafParser,NafReader)):
+        naf_obj = filename
+    else:
+        #Only the layers needed for the features are read
+        naf_obj = NafReader(filename)
+        
+    get_document_index(naf_obj)
+    
+    #Extract all the opinions
+    opinions_per_sentence = defaultdict(list)
+    num_opinions = 0
+   
+    
+    for opinion in naf_obj.get_opinions():
+        exp = opinion.get_expression()
+        if exp is not None:
+            p = exp.get_polarity()
+            if p != 'NON-OPINIONATED':
+                target = opinion.get_target()
+                if target is not None:  
+                    span = target.get_span()
+                    if span is not None:
+                        S = span.get_span_ids()
+                        if len(S) != 0:    
+                            sentence_id = get_sentence_id_for_opinion(naf_obj,opinion)
+                            if sentence_id is not None:
+                                opinions_per_sentence[sentence_id].append(opinion)
+                                num_opinions += 1
                 
-            
+    if log:
+        print('\tNum of opinions:', num_opinions, file=sys.stderr)
+    
+    if this_type == 'train':
+        # For the train a sequence is created for every opinion
+        #One sequence is created for every DSE (possible to have repeated sentences)
+        sentences_with_opinions = set()
+        for this_sentence, these_opinions in list(opinions_per_sentence.items()):
+            distances = get_distances_to_dse(naf_obj, naf_obj.document_index.token_ids_for_sentence.get(this_sentence, []), these_opinions)
+            for num_opinion, opinion in enumerate(these_opinions):
+                sentences_with_opinions.add(this_sentence)
+                create_sequence(naf_obj, this_type, this_sentence, overall_parameters, opinion, output = output_fd, distances_to_dse = distances[num_opinion], features_to_extract = features_to_extract)
         
+        #Include the rest of sentence without opinions
+        '''
+        for sentence_id in naf_obj.document_index.sentence_ids:
+            if sentence_id not in sentences_with_opinions:
+                create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions=[])
+        '''
+            
+    elif this_type=='tag':
+        # Obtain the opinions per sentence per
+        opinions_per_sentence = defaultdict(list)
+        for list_name_ids, list_words in detected_dse:
+            #When tagging a batch of files, the DSE can belong to other file
+            if list_name_ids[0][:list_name_ids[0].rfind('#')] != naf_obj.filename:
+                continue
+            list_ids = [v[v.rfind('#')+1:] for v in list_name_ids]
+            sentence_for_opinion = naf_obj.document_index.sentence_for_token_id[list_ids[0]]
+            opinions_per_sentence[sentence_for_opinion].append(list_ids)
+            
+        for this_sentence, these_opinions in list(opinions_per_sentence.items()):
+            #The distances to all the DSEs of the sentence are computed at once
+            distances = get_distances_to_dse(naf_obj, naf_obj.document_index.token_ids_for_sentence.get(this_sentence, []), these_opinions)
+            for num_opinion, list_dse_token_ids in enumerate(these_opinions):
+                create_sequence(naf_obj, this_type, this_sentence, overall_parameters, opinion = list_dse_token_ids, output = output_fd,log=log, distances_to_dse = distances[num_opinion], features_to_extract = features_to_extract)
+
+    elif this_type=='test':
+        #For the testing, one sequence is created for every sentence, with no opinion included
+        opinion_list = []
+        for this_sentence, these_opinions in list(opinions_per_sentence.items()):
+            distances = get_distances_to_dse(naf_obj, naf_obj.document_index.token_ids_for_sentence.get(this_sentence, []), these_opinions)
+            for num_opinion, opinion in enumerate(these_opinions):
+                create_sequence(naf_obj, this_type, this_sentence, overall_parameters, opinion, output = output_fd, distances_to_dse = distances[num_opinion], features_to_extract = features_to_extract)
+                opinion_list.append(opinion)
+   
+        if gold_fd is not None:
+            create_gold_standard_target(naf_obj,opinion_list,gold_fd)
+
+
+#Arguments of every worker process when the files are processed in parallel (-j)
+worker_arguments = None
+
+def init_worker(this_type, overall_parameters, features_to_extract, with_gold_standard, log):
+    global worker_arguments
+    worker_arguments = (this_type, overall_parameters, features_to_extract, with_gold_standard, log)
+
 
-def main(inputfile, this_type, folder, overall_parameters = {}, detected_dse = {},log=False):
+def process_file_in_worker(filename):
+    '''
+    Processes one file in a worker process and returns its sequences and gold standard (None if not needed) as text
+    '''
+    this_type, overall_parameters, features_to_extract, with_gold_standard, log = worker_arguments
+    output = io.StringIO()
+    gold_output = None
+    if with_gold_standard:
+        gold_output = io.StringIO()
+    process_file(filename, this_type, overall_parameters, features_to_extract, output, gold_output, log=log)
+    if gold_output is None:
+        return output.getvalue(), None
+    return output.getvalue(), gold_output.getvalue()
+
+
+def main(inputfile, this_type, folder, overall_parameters = None, detected_dse = {},log=False, in_memory=False, num_processes=1, cache_folder=None):
     files = []
     output_fd = None
+    manifest = None
+    if overall_parameters is None and this_type != 'tag':
+        overall_parameters = {}
     if this_type == 'train':
-        output_fd = open(folder+'/'+TRAINING_FILENAME,'w')
+        #Manifest of the files of the previous training file, only the new and modified files are processed again
+        manifest = CorpusManifest(os.path.join(folder,MANIFEST_FILENAME), folder+'/'+TRAINING_FILENAME)
+        output_fd = open(manifest.new_output_filename,'w')
             
         ##Save the parametes
         parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
-        fd_parameter = open(parameter_filename,'w')
+        fd_parameter = open(parameter_filename,'wb')
         pickler.dump(overall_parameters,fd_parameter,protocol=0)
         print('Parameters saved to file %s' % parameter_filename, file=sys.stderr)
         fd_parameter.close()
@@ -326,24 +447,23 @@ def main(inputfile, this_type, folder, overall_parameters = {}, detected_dse = {
         fin.close()
         
     elif this_type == 'tag':
-        parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
-        fd_param = open(parameter_filename,'rb')
-        try:
-            overall_parameters = pickler.load(fd_param,encoding='bytes')
-        except TypeError:
-            overall_parameters = pickler.load(fd_param)
-        fd_param.close()
-
-        #Input is a isngle file
-        files.append(inputfile)
+        #The parameters can be given already loaded (tagging server)
+        if overall_parameters is None:
+            overall_parameters = load_parameters(folder)
+
+        #Input is a single file or a list of them (batch)
+        if isinstance(inputfile, list):
+            files.extend(inputfile)
+        else:
+            files.append(inputfile)
         
-        #Output FD will be a temporary file
-        output_fd = tempfile.NamedTemporaryFile('w', delete=False)
+        #Output FD will be a temporary file, or a list of sequences if they are tagged in memory
+        if in_memory:
+            output_fd = []
+        else:
+            output_fd = tempfile.NamedTemporaryFile('w', delete=False)
     elif this_type == 'test':
-        parameter_filename = os.path.join(folder,PARAMETERS_FILENAME)
-        fd_param = open(parameter_filename,'r')
-        these_overall_parameters = pickler.load(fd_param)
-        fd_param.close()
+        these_overall_parameters = load_parameters(folder)
         for opt, val in list(these_overall_parameters.items()):
             overall_parameters[opt] = val
         
@@ -355,93 +475,48 @@ def main(inputfile, this_type, folder, overall_parameters = {}, detected_dse = {
         output_fd = open(folder+'/'+TESTING_FILENAME,'w')
      
       
+    #Features to extract, when tagging only the ones read by the templates of the model
+    used_columns = None
+    if this_type == 'tag':
+        used_columns = get_template_columns(os.path.join(folder, MODEL_FILENAME))
+    features_to_extract = FEATURES.get_features_to_extract(overall_parameters, used_columns)
+    
     gold_fd = None    
     gold_filename = overall_parameters.get('gold_standard')
     if gold_filename is not None:
         gold_fd = open(gold_filename ,'w')
           
 
-    for filename in files:
-        if log:
-            print('TARGET: processing file', filename, file=sys.stderr)
-        
-        if isinstance(filename,KafNafParser):
-            naf_obj = filename
-        else:
-            naf_obj = KafNafParser(filename)
-            
-        create_structures(naf_obj, filename)
-        
-        #Extract all the opinions
-        opinions_per_sentence = defaultdict(list)
-        num_opinions = 0
-       
-        
-        for opinion in naf_obj.get_opinions():
-            exp = opinion.get_expression()
-            if exp is not None:
-                p = exp.get_polarity()
-                if p != 'NON-OPINIONATED':
-                    target = opinion.get_target()
-                    if target is not None:  
-                        span = target.get_span()
-                        if span is not None:
-                            S = span.get_span_ids()
-                            if len(S) != 0:    
-                                sentence_id = get_sentence_id_for_opinion(naf_obj,opinion)
-                                if sentence_id is not None:
-                                    opinions_per_sentence[sentence_id].append(opinion)
-                                    num_opinions += 1
-                    
-        if log:
-            print('\tNum of opinions:', num_opinions, file=sys.stderr)
-        
-        if this_type == 'train':
-            # For the train a sequence is created for every opinion
-            #One sequence is created for every DSE (possible to have repeated sentences)
-            sentences_with_opinions = set()
-            for this_sentence, these_opinions in list(opinions_per_sentence.items()):
-                for opinion in these_opinions:
-                    sentences_with_opinions.add(this_sentence)
-                    create_sequence(naf_obj, this_type, this_sentence, overall_parameters, opinion, output = output_fd)
-            
-            #Include the rest of sentence without opinions
-            '''
-            for sentence_id in naf_obj.list_sentence_ids:
-                if sentence_id not in sentences_with_opinions:
-                    create_sequence(naf_obj, sentence_id, overall_parameters, list_opinions=[])
-            '''
-                
-        elif this_type=='tag':
-            # Obtain the opinions per sentence per
-            opinions_per_sentence = defaultdict(list)
-            for list_name_ids, list_words in detected_dse:
-                list_ids = [v[v.rfind('#')+1:] for v in list_name_ids]
-                first_token = naf_obj.get_token(list_ids[0])
-                sentence_for_opinion = first_token.get_sent()
-                opinions_per_sentence[sentence_for_opinion].append(list_ids)
-                
-            for this_sentence, these_opinions in list(opinions_per_sentence.items()):
-                for list_dse_token_ids in these_opinions:
-                    create_sequence(naf_obj, this_type, this_sentence, overall_parameters, opinion = list_dse_token_ids, output = output_fd,log=log)  
-
-        elif this_type=='test':
-            #For the testing, one sequence is created for every sentence, with no opinion included
-            opinion_list = []
-            for this_sentence, these_opinions in list(opinions_per_sentence.items()):
-                for opinion in these_opinions:
-                    create_sequence(naf_obj, this_type, this_sentence, overall_parameters,opinion, output = output_fd)
-                    opinion_list.append(opinion)
-   
+    if this_type != 'tag':
+        #The files are processed in a pool of processes (-j) and their output is written in the order of the list.
+        #The files found in the feature cache (-cache) are not processed again
+        feature_cache = None
+        if cache_folder is not None:
+            feature_cache = FeatureCache(cache_folder, 'target', this_type, overall_parameters)
+        if manifest is not None:
+            manifest.set_configuration(get_configuration_hash('target', this_type, overall_parameters))
+        worker_parameters = (this_type, overall_parameters, features_to_extract, gold_fd is not None, log)
+        for sequences, gold_standard in process_files(files, init_worker, process_file_in_worker, worker_parameters, num_processes, feature_cache, gold_fd is not None, manifest):
+            output_fd.write(sequences)
             if gold_fd is not None:
-                create_gold_standard_target(naf_obj,opinion_list,gold_fd)
+                gold_fd.write(gold_standard)
+    else:
+        for filename in files:
+            process_file(filename, this_type, overall_parameters, features_to_extract, output_fd, gold_fd, detected_dse, log)
             
             
     if gold_fd is not None:
         gold_fd.close() 
         print('Gold standard in the file %s' % gold_fd.name, file=sys.stderr)
         
-    return output_fd.name 
+    if in_memory:
+        return output_fd
+    output_fd.close()
+    if manifest is not None:
+        #The training file is only replaced once the new one is complete
+        manifest.save()
+        return manifest.output_filename
+    return output_fd.name
     
 
 if __name__ == '__main__':
@@ -451,6 +526,8 @@ if __name__ == '__main__':
     argument_parser.add_argument('-t', dest='type', choices=['train', 'test','tag'], required=True,  default='train', help='Whether to train or test')
     argument_parser.add_argument('-f', dest='folder', required=True, help='Folder to store the data')
     argument_parser.add_argument('-gs', dest='gold_standard', help='File to store the gold standard annotations (For evaluation)')
+    argument_parser.add_argument('-j', dest='num_processes', type=int, default=1, help='Number of processes to extract the features for training/testing (default 1)')
+    argument_parser.add_argument('-cache', dest='cache_folder', help='Folder to cache the features of every file for training/testing')
 
     args = argument_parser.parse_args()
 
@@ -460,6 +537,6 @@ if __name__ == '__main__':
 
     detected_dse = [(['example_en.naf#w4'], ['nice']), (['example_en.naf#w9', 'example_en.naf#w10', 'example_en.naf#w11'], ['the', 'best', '!!'])]
        
-    main(args.inputfile,args.type, args.folder, overall_parameters, detected_dse)
+    main(args.inputfile,args.type, args.folder, overall_parameters, detected_dse, num_processes=args.num_processes, cache_folder=args.cache_folder)
     
     
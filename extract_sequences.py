@@ -23,7 +23,12 @@ def extract_sequences(input, this_type):
     word_for_id = {}
     num_sequence = None
     for line in my_input:
-        line = line.strip().decode()
+        #Lines can be bytes (output of crf_test) or already split in columns (CRF decoder in memory)
+        if isinstance(line, list):
+            line = '\t'.join(line)
+        elif isinstance(line, bytes):
+            line = line.decode()
+        line = line.strip()
         if line.startswith('#'):
             # # 1 0.025510
             fields = line.strip().split()
@@ -52,14 +57,25 @@ def extract_sequences(input, this_type):
     
     
     ##Remove those sequences that are completely contained in other
-    indexes_to_remove = []
+    #Only the sequences sharing some id can overlap, so they are found with an index id --> sequences
+    sequences_for_id = {}
+    for n, (numseq, s) in enumerate(sequences_of_ids):
+        if numseq is not None:
+            for this_id in s:
+                if this_id not in sequences_for_id:
+                    sequences_for_id[this_id] = []
+                sequences_for_id[this_id].append(n)
+                
+    indexes_to_remove = set()
     for n1, (numseq1, s1) in enumerate(sequences_of_ids):
         #Should we remove s1?
-        for n2, (numseq2, s2) in enumerate(sequences_of_ids):
-            if n1 != n2 and numseq1 is not None and numseq2 is not None and int(numseq1) > int(numseq2):
-                common = set(s1) & set(s2)
-                if len(common) != 0:
-                    indexes_to_remove.append(n1)
+        if numseq1 is None:
+            continue
+        for this_id in s1:
+            for n2 in sequences_for_id[this_id]:
+                numseq2 = sequences_of_ids[n2][0]
+                if n1 != n2 and int(numseq1) > int(numseq2):
+                    indexes_to_remove.add(n1)
                     #print>>sys.stderr, 'Removed %s of sequence %d because overlaps with %s of seq %d' % (s1,numseq1, s2, numseq2)
                         
     #print 'Remove:'
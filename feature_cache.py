@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+'''
+Cache of the sequences extracted for every document when creating the training/testing files. The key of every
+document is the hash of its content and path, the extractor, the type (train/test), the parameters, the resources used by the features
+(lexicons) and the version of the code, so the features of a document are only extracted again if any of them changes
+'''
+from __future__ import print_function
+import sys
+import os
+import glob
+import hashlib
+import tempfile
+import multiprocessing
+
+import KafNafParserPy
+from lexicon_store import COMPILED_EXTENSION
+
+
+SEQUENCES_EXTENSION = '.seq'
+GOLD_STANDARD_EXTENSION = '.gold'
+
+__code_version = None
+
+def get_code_version():
+    '''
+    Hash of the python modules and resources of the opinion miner and the version of KafNafParserPy
+    '''
+    global __code_version
+    if __code_version is None:
+        this_folder = os.path.dirname(os.path.abspath(__file__))
+        code_hash = hashlib.sha1()
+        for filename in sorted(glob.glob(os.path.join(this_folder, '*.py')) + glob.glob(os.path.join(this_folder, 'resources', '*'))):
+            #The compiled lexicons (see lexicon_store) are created from the resources, they are not part of the code
+            if not os.path.isfile(filename) or filename.endswith(COMPILED_EXTENSION):
+                continue
+            code_hash.update(os.path.basename(filename).encode('utf-8'))
+            code_hash.update(get_file_hash(filename).encode('utf-8'))
+        code_hash.update(str(getattr(KafNafParserPy, '__version__', os.path.dirname(KafNafParserPy.__file__))).encode('utf-8'))
+        __code_version = code_hash.hexdigest()
+    return __code_version
+
+
+def get_file_hash(filename):
+    file_hash = hashlib.sha1()
+    fd = open(filename, 'rb')
+    for block in iter(lambda: fd.read(1 << 20), b''):
+        file_hash.update(block)
+    fd.close()
+    return file_hash.hexdigest()
+
+
+def get_parameters_hash(overall_parameters):
+    '''
+    Hash of the values of the parameters that are saved with the model (the lexicons loaded in the parameters
+    are not included, they are given as resource files, and neither is the name of the gold standard file)
+    '''
+    values = []
+    for key, value in sorted(overall_parameters.items(), key=lambda t: str(t[0])):
+        if key == 'gold_standard':
+            continue
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            values.append('%r=%r' % (key, value))
+    return hashlib.sha1('\n'.join(values).encode('utf-8')).hexdigest()
+
+
+def get_configuration_hash(extractor_name, this_type, overall_parameters, resource_files=[]):
+    '''
+    Hash of everything, apart from the document, that the sequences of one document depend on
+    '''
+    configuration_hash = hashlib.sha1()
+    configuration_hash.update(extractor_name.encode('utf-8'))
+    configuration_hash.update(this_type.encode('utf-8'))
+    configuration_hash.update(get_parameters_hash(overall_parameters).encode('utf-8'))
+    for resource_file in resource_files:
+        if os.path.exists(resource_file):
+            configuration_hash.update(get_file_hash(resource_file).encode('utf-8'))
+        else:
+            configuration_hash.update(b'missing')
+    configuration_hash.update(get_code_version().encode('utf-8'))
+    return configuration_hash.hexdigest()
+
+
+class FeatureCache:
+    '''
+    Sequences (and gold standard) of every document for one extractor and type, stored in cache_folder/extractor_name
+    '''
+    def __init__(self, cache_folder, extractor_name, this_type, overall_parameters, resource_files=[]):
+        self.folder = os.path.join(cache_folder, extractor_name)
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        self.key_prefix = get_configuration_hash(extractor_name, this_type, overall_parameters, resource_files)
+        self.hits = 0
+        self.misses = 0
+
+
+    def get_key(self, filename):
+        '''
+        Key for a file of the list, None if it's not a file (KafNafParser objects are not cached)
+        '''
+        if not isinstance(filename, str) or not os.path.isfile(filename):
+            return None
+        key_hash = hashlib.sha1()
+        key_hash.update(self.key_prefix.encode('utf-8'))
+        #The path is also included, it's part of the identifiers of the tokens
+        key_hash.update(filename.encode('utf-8'))
+        key_hash.update(get_file_hash(filename).encode('utf-8'))
+        return key_hash.hexdigest()
+
+
+    def get_filename(self, key, extension):
+        return os.path.join(self.folder, key[:2], key+extension)
+
+
+    def get(self, key, with_gold_standard):
+        '''
+        Returns (sequences, gold standard or None) or None if they are not in the cache
+        '''
+        output = None
+        if key is not None:
+            try:
+                fd = open(self.get_filename(key, SEQUENCES_EXTENSION), 'r')
+                sequences = fd.read()
+                fd.close()
+                gold_standard = None
+                if with_gold_standard:
+                    fd = open(self.get_filename(key, GOLD_STANDARD_EXTENSION), 'r')
+                    gold_standard = fd.read()
+                    fd.close()
+                output = (sequences, gold_standard)
+            except IOError:
+                output = None
+        if output is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return output
+
+
+    def put(self, key, sequences, gold_standard):
+        if key is None:
+            return
+        self.write(self.get_filename(key, SEQUENCES_EXTENSION), sequences)
+        if gold_standard is not None:
+            self.write(self.get_filename(key, GOLD_STANDARD_EXTENSION), gold_standard)
+
+
+    def write(self, filename, text):
+        #The content of a key never changes, a file already in the cache is not written again
+        if os.path.exists(filename):
+            return
+        #Written to a temporary file and renamed, so other runs never read an incomplete file
+        folder = os.path.dirname(filename)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                pass
+        fd = tempfile.NamedTemporaryFile('w', dir=folder, delete=False)
+        fd.write(text)
+        fd.close()
+        os.rename(fd.name, filename)
+
+
+    def report(self):
+        print('Feature cache %s: %d hits, %d misses' % (self.folder, self.hits, self.misses), file=sys.stderr)
+
+
+def process_files(files, init_worker, process_file_in_worker, worker_arguments, num_processes=1, feature_cache=None, with_gold_standard=False, manifest=None):
+    '''
+    Yields (sequences, gold standard) for every file of the list, in order. The files are processed by process_file_in_worker
+    in the current process or in a pool of num_processes processes (initialized with init_worker(*worker_arguments)), and
+    the ones found in the manifest of the previous training file (see corpus_manifest) or in the feature cache are not
+    processed again. The sequences taken from the manifest are stored in the cache too. The files are added to the manifest,
+    which is saved by the caller once the training file is closed
+    '''
+    keys = [None] * len(files)
+    cached = [None] * len(files)
+    files_to_process = []
+    for num_file, filename in enumerate(files):
+        if manifest is not None and not with_gold_standard:
+            sequences = manifest.get_sequences(filename)
+            if sequences is not None:
+                cached[num_file] = (sequences, None)
+                #They are also stored in the cache, for the training files of other folders
+                if feature_cache is not None:
+                    feature_cache.put(feature_cache.get_key(filename), sequences, None)
+                continue
+        if feature_cache is not None:
+            keys[num_file] = feature_cache.get_key(filename)
+            cached[num_file] = feature_cache.get(keys[num_file], with_gold_standard)
+        if cached[num_file] is None:
+            files_to_process.append(filename)
+
+    if num_processes > 1 and len(files_to_process) > 1:
+        pool = multiprocessing.Pool(num_processes, initializer=init_worker, initargs=worker_arguments)
+        results = pool.imap(process_file_in_worker, files_to_process)
+    else:
+        pool = None
+        init_worker(*worker_arguments)
+        results = (process_file_in_worker(filename) for filename in files_to_process)
+
+    for num_file, filename in enumerate(files):
+        if cached[num_file] is not None:
+            sequences, gold_standard = cached[num_file]
+        else:
+            sequences, gold_standard = next(results)
+            if feature_cache is not None:
+                feature_cache.put(keys[num_file], sequences, gold_standard)
+        if manifest is not None:
+            manifest.add(filename, sequences)
+        yield sequences, gold_standard
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if feature_cache is not None:
+        feature_cache.report()
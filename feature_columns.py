@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+'''
+Columnar representation of the feature sequences. Every value of a feature is stored once in a table of
+strings and the sequences keep, for every feature, an array with the ids of the values of the tokens
+'''
+from __future__ import print_function
+import threading
+from array import array
+
+
+class StringTable:
+    '''
+    Interned strings: every different string gets an integer id
+    '''
+    def __init__(self):
+        self.id_for_string = {}
+        self.strings = []
+        #The target and holder steps can add values at the same time
+        self.lock = threading.Lock()
+
+
+    def get_id(self, value):
+        this_id = self.id_for_string.get(value)
+        if this_id is None:
+            with self.lock:
+                this_id = self.id_for_string.get(value)
+                if this_id is None:
+                    this_id = len(self.strings)
+                    self.strings.append(value)
+                    self.id_for_string[value] = this_id
+        return this_id
+
+
+    def get_ids(self, values):
+        '''
+        Array with the ids of a list of strings
+        '''
+        return array('i', [self.get_id(value) for value in values])
+
+
+    def get_string(self, this_id):
+        return self.strings[this_id]
+
+
+class SequenceColumns:
+    '''
+    One sequence for CRF++ (one row per token). The first column is the identifier (prefix+token_id) and the rest of
+    columns are arrays of ids in the string table. Iterating over it gives the rows as lists of strings, as they are
+    read by the CRF decoder and the crf_test processes
+    '''
+    def __init__(self, string_table, prefix, token_ids):
+        self.string_table = string_table
+        self.prefix = prefix
+        self.token_ids = token_ids
+        self.columns = []
+
+
+    def add_column(self, values):
+        '''
+        Adds a column given as a list of strings, one per token
+        '''
+        self.columns.append(self.string_table.get_ids(values))
+
+
+    def add_column_ids(self, ids):
+        '''
+        Adds a column already given as ids of the string table (shared, not copied)
+        '''
+        self.columns.append(ids)
+
+
+    def __len__(self):
+        return len(self.token_ids)
+
+
+    def get_row(self, num_token):
+        strings = self.string_table.strings
+        row = [self.prefix+self.token_ids[num_token]]
+        for column in self.columns:
+            row.append(strings[column[num_token]])
+        return row
+
+
+    def __iter__(self):
+        for num_token in range(len(self.token_ids)):
+            yield self.get_row(num_token)
+
+
+    def write(self, output):
+        '''
+        Writes the sequence in CRF++ format, followed by the empty line
+        '''
+        for row in self:
+            output.write('\t'.join(row)+'\n')
+        output.write('\n')
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+'''
+Registry of the features (columns) extracted for the sequences of one step. Every feature declares its labels,
+the function that extracts it and the parameter of the model that enables it. The features are independent (they
+read the document, not the columns of other features), so they are extracted in the order of the columns. When
+tagging, only the features read by the templates of the CRF++ model are extracted, the rest of columns are
+written as '-' so the columns keep their positions
+'''
+from __future__ import print_function
+import os
+import re
+import struct
+import threading
+
+
+MACRO = re.compile(r'%x\[(-?\d+),(\d+)\]')
+
+
+class Feature:
+    def __init__(self, labels, extract, arguments=[], parameter=None, optional=False, static=False):
+        self.labels = labels            #Labels of the columns, in order
+        self.extract = extract          #extract(naf_obj, token_ids, features, *arguments)
+        self.arguments = arguments      #Names of the extra arguments of the function
+        self.parameter = parameter      #Parameter of the model that enables the feature
+        self.optional = optional        #The columns are only included when the parameter is enabled
+        self.static = static            #Only depends on the sentence (see DocumentIndex.get_static_columns)
+
+
+class FeatureRegistry:
+    '''
+    Features of one step, in the order of the columns
+    '''
+    def __init__(self):
+        self.features = []
+        self.feature_for_label = {}
+
+
+    def add(self, labels, extract, arguments=[], parameter=None, optional=False, static=False):
+        feature = Feature(labels, extract, arguments, parameter, optional, static)
+        for label in labels:
+            if label in self.feature_for_label:
+                raise ValueError('The feature %s is already registered' % label)
+            self.feature_for_label[label] = feature
+        self.features.append(feature)
+
+
+    def get_features(self, overall_parameters):
+        '''
+        Features with columns for the parameters of the model
+        '''
+        return [feature for feature in self.features if not feature.optional or overall_parameters.get(feature.parameter, False)]
+
+
+    def get_column_labels(self, overall_parameters):
+        '''
+        Labels of the columns, after the identifier
+        '''
+        column_labels = []
+        for feature in self.get_features(overall_parameters):
+            column_labels.extend(feature.labels)
+        return column_labels
+
+
+    def get_features_to_extract(self, overall_parameters, used_columns=None):
+        '''
+        Features to extract, in the order of the columns. The features with a parameter are extracted only if it's
+        enabled, and if used_columns is given (indexes of the columns read by the templates, the identifier is the
+        column 0), only the ones with columns used by the model
+        '''
+        features_to_extract = []
+        num_column = 1
+        for feature in self.get_features(overall_parameters):
+            used = used_columns is None or any(n in used_columns for n in range(num_column, num_column+len(feature.labels)))
+            num_column += len(feature.labels)
+            if feature.parameter is not None and not overall_parameters.get(feature.parameter, False):
+                continue
+            if used:
+                features_to_extract.append(feature)
+        return features_to_extract
+
+
+    def is_extracted(self, label, features_to_extract):
+        return self.feature_for_label[label] in features_to_extract
+
+
+    def extract(self, features_to_extract, naf_obj, token_ids, features, arguments):
+        '''
+        Extracts the features (except the static ones) for the tokens, arguments is a dictionary with the
+        values of the extra arguments of the functions
+        '''
+        for feature in features_to_extract:
+            if not feature.static:
+                feature.extract(naf_obj, token_ids, features, *[arguments[name] for name in feature.arguments])
+
+
+    def extract_static(self, naf_obj, token_ids, features):
+        '''
+        Extracts all the static features, returns the labels
+        '''
+        labels = []
+        for feature in self.features:
+            if feature.static:
+                feature.extract(naf_obj, token_ids, features)
+                labels.extend(feature.labels)
+        return labels
+
+
+#Columns of every model, read once per process (and again if the model is trained again)
+_columns_for_model = {}
+_columns_lock = threading.Lock()
+
+def get_template_columns(model_filename):
+    '''
+    Indexes of the columns read by the templates of a CRF++ model (binary model or text version from crf_learn -t).
+    Returns None if the model can not be read
+    '''
+    try:
+        stat = os.stat(model_filename)
+    except OSError:
+        return None
+    key = (os.path.abspath(model_filename), stat.st_size, stat.st_mtime)
+    with _columns_lock:
+        if key not in _columns_for_model:
+            _columns_for_model[key] = read_template_columns(model_filename)
+        return _columns_for_model[key]
+
+
+def read_template_columns(model_filename):
+    try:
+        fd = open(model_filename, 'rb')
+    except IOError:
+        return None
+    templates = []
+    try:
+        if fd.read(8) == b'version:':
+            #Text model: header, labels and templates separated by empty lines
+            fd.seek(0)
+            num_block = 0
+            for line in fd:
+                line = line.decode('utf-8').rstrip('\n')
+                if line == '':
+                    num_block += 1
+                    if num_block == 3:
+                        break
+                elif num_block == 2:
+                    templates.append(line)
+        else:
+            #Binary model, as read by DecoderFeatureIndex::openBinaryModel in CRF++: version, type of the model, cost
+            #factor, maxid, xsize, size of the double array and size of the labels, followed by the labels, the size of
+            #the templates and the templates
+            fd.seek(0)
+            version, model_type, cost_factor, maxid, xsize, dsize, labels_size = struct.unpack('<IidIIII', fd.read(32))
+            fd.read(labels_size)
+            templates_size = struct.unpack('<I', fd.read(4))[0]
+            templates = fd.read(templates_size).decode('utf-8').split('\0')
+    except (struct.error, UnicodeDecodeError):
+        return None
+    finally:
+        fd.close()
+
+    used_columns = set()
+    for template in templates:
+        for match in MACRO.finditer(template):
+            used_columns.add(int(match.group(2)))
+    #Shared by all the calls with the same model
+    return frozenset(used_columns)
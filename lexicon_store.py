@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+
+'''
+Read-only store of lexicons (tables of string keys and values) in a binary file that is mapped in memory (mmap).
+The tables are not loaded in dictionaries, so all the processes that use the same file (for instance the workers
+of the batch mode, or several taggers in the same machine) share the pages of the file instead of keeping their
+own copy of the lexicons.
+
+Every table is a hash table: the entries are sorted by bucket (crc32 of the key), with the offsets of the first
+entry of every bucket and the offsets of every entry ("key\\0value") in the data of the table. The tables have the
+same lookup methods as dictionaries (get, in, [], len, items...). Keys and values can be strings, integers or
+tuples of strings, which are stored joined by TUPLE_SEPARATOR
+'''
+from __future__ import print_function
+import os
+import sys
+import hashlib
+import mmap
+import struct
+import tempfile
+import threading
+import zlib
+try:
+    import cPickle as pickler
+except ImportError:
+    import pickle as pickler
+
+
+MAGIC = b'OMDLEX\x00\x01'
+#The compiled lexicons are stored in the folder given by this environment variable, or in the cache folder of the user,
+#never next to the lexicons (the resources of the code or the folders of the models can be read only)
+COMPILED_FOLDER_VARIABLE = 'OPINION_MINER_LEXICON_CACHE'
+DEFAULT_COMPILED_FOLDER = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'opinion_miner')
+COMPILED_EXTENSION = '.store'
+TUPLE_SEPARATOR = '\x1f'
+#Average number of entries per bucket
+BUCKET_SIZE = 2
+
+UINT32 = struct.Struct('<I')
+TWO_UINT32 = struct.Struct('<II')
+
+
+def get_kind(value):
+    if isinstance(value, tuple):
+        return 'tuple'
+    elif isinstance(value, int):
+        return 'int'
+    else:
+        return 'str'
+
+
+def is_of_kind(value, kind):
+    '''
+    Whether the value can be encoded as the given kind (a None lemma, for instance, can not be a key)
+    '''
+    if kind == 'tuple':
+        return isinstance(value, tuple) and all(isinstance(item, str) for item in value)
+    elif kind == 'int':
+        return isinstance(value, int)
+    else:
+        return isinstance(value, str)
+
+
+def encode(value, kind):
+    if kind == 'tuple':
+        value = TUPLE_SEPARATOR.join(value)
+    elif kind == 'int':
+        value = str(value)
+    return value.encode('utf-8')
+
+
+def decode(value_bytes, kind):
+    value = value_bytes.decode('utf-8')
+    if kind == 'tuple':
+        return tuple(value.split(TUPLE_SEPARATOR))
+    elif kind == 'int':
+        return int(value)
+    return value
+
+
+def get_bucket(key_bytes, num_buckets):
+    return (zlib.crc32(key_bytes) & 0xffffffff) % num_buckets
+
+
+def build_table(table):
+    '''
+    Returns the binary representation of a dictionary: (num_entries, num_buckets, key kind, value kind, bytes)
+    '''
+    key_kind = value_kind = 'str'
+    if len(table) != 0:
+        key, value = next(iter(table.items()))
+        key_kind = get_kind(key)
+        value_kind = get_kind(value)
+    num_buckets = max(1, len(table) // BUCKET_SIZE)
+    entries = []
+    for key, value in table.items():
+        if get_kind(key) != key_kind or get_kind(value) != value_kind:
+            raise ValueError('All the keys and values of a table must be of the same kind: %r %r' % (key, value))
+        key_bytes = encode(key, key_kind)
+        value_bytes = encode(value, value_kind)
+        if b'\0' in key_bytes:
+            raise ValueError('The keys of a table can not contain \\0: %r' % key)
+        entries.append((get_bucket(key_bytes, num_buckets), key_bytes, value_bytes))
+    entries.sort()
+
+    bucket_starts = [0] * (num_buckets+1)
+    for bucket, key_bytes, value_bytes in entries:
+        bucket_starts[bucket+1] += 1
+    for bucket in range(num_buckets):
+        bucket_starts[bucket+1] += bucket_starts[bucket]
+    records = [key_bytes+b'\0'+value_bytes for bucket, key_bytes, value_bytes in entries]
+    entry_offsets = [0]
+    for record in records:
+        entry_offsets.append(entry_offsets[-1]+len(record))
+
+    table_bytes = struct.pack('<%dI' % len(bucket_starts), *bucket_starts)
+    table_bytes += struct.pack('<%dI' % len(entry_offsets), *entry_offsets)
+    table_bytes += b''.join(records)
+    return len(entries), num_buckets, key_kind, value_kind, table_bytes
+
+
+def write_store(filename, tables, info=None):
+    '''
+    Writes the tables, a list of (name, dictionary), to the file. The information (any picklable object) is stored
+    in the directory of the file. It's written to a temporary file and renamed, so other processes never map an
+    incomplete file
+    '''
+    directory_tables = []
+    blocks = []
+    offset = 0
+    for name, table in tables:
+        num_entries, num_buckets, key_kind, value_kind, table_bytes = build_table(table)
+        directory_tables.append((name, offset, num_entries, num_buckets, key_kind, value_kind))
+        blocks.append(table_bytes)
+        offset += len(table_bytes)
+    directory = pickler.dumps({'info': info, 'tables': directory_tables}, protocol=2)
+
+    fd = tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(os.path.abspath(filename)), delete=False)
+    try:
+        fd.write(MAGIC)
+        fd.write(UINT32.pack(len(directory)))
+        fd.write(directory)
+        for block in blocks:
+            fd.write(block)
+        fd.close()
+        #Readable by all the users of the lexicon
+        os.chmod(fd.name, 0o644)
+        os.rename(fd.name, filename)
+    except:
+        fd.close()
+        os.remove(fd.name)
+        raise
+
+
+class LexiconTable:
+    '''
+    One table of the store, looked up directly in the mapped file
+    '''
+    def __init__(self, data, offset, num_entries, num_buckets, key_kind, value_kind):
+        self.data = data
+        self.num_entries = num_entries
+        self.num_buckets = num_buckets
+        self.key_kind = key_kind
+        self.value_kind = value_kind
+        self.buckets_offset = offset
+        self.entries_offset = offset + UINT32.size*(num_buckets+1)
+        self.records_offset = self.entries_offset + UINT32.size*(num_entries+1)
+
+
+    def get_record(self, num_entry):
+        start, end = TWO_UINT32.unpack_from(self.data, self.entries_offset+UINT32.size*num_entry)
+        return self.data[self.records_offset+start:self.records_offset+end]
+
+
+    def find(self, key):
+        '''
+        Returns the bytes of the value of the key, or None if it's not in the table
+        '''
+        #As with a dictionary, the keys that can not be in the table (None, tuples with None...) are just not found
+        if self.num_entries == 0 or not is_of_kind(key, self.key_kind):
+            return None
+        key_bytes = encode(key, self.key_kind)
+        bucket = get_bucket(key_bytes, self.num_buckets)
+        first, last = TWO_UINT32.unpack_from(self.data, self.buckets_offset+UINT32.size*bucket)
+        key_length = len(key_bytes)
+        for num_entry in range(first, last):
+            record = self.get_record(num_entry)
+            if record[key_length:key_length+1] == b'\0' and record[:key_length] == key_bytes:
+                return record[key_length+1:]
+        return None
+
+
+    def get(self, key, default=None):
+        value_bytes = self.find(key)
+        if value_bytes is None:
+            return default
+        return decode(value_bytes, self.value_kind)
+
+
+    def __getitem__(self, key):
+        value_bytes = self.find(key)
+        if value_bytes is None:
+            raise KeyError(key)
+        return decode(value_bytes, self.value_kind)
+
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+
+    def __len__(self):
+        return self.num_entries
+
+
+    def items(self):
+        for num_entry in range(self.num_entries):
+            key_bytes, value_bytes = self.get_record(num_entry).split(b'\0', 1)
+            yield decode(key_bytes, self.key_kind), decode(value_bytes, self.value_kind)
+
+
+    def keys(self):
+        for key, value in self.items():
+            yield key
+
+
+    def values(self):
+        for key, value in self.items():
+            yield value
+
+
+    def __iter__(self):
+        return self.keys()
+
+
+class LexiconStore:
+    '''
+    File with several tables, mapped in memory (read only)
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        fd = open(filename, 'rb')
+        try:
+            self.data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            fd.close()
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.data.close()
+            raise ValueError('%s is not a lexicon store' % filename)
+        directory_length, = UINT32.unpack_from(self.data, len(MAGIC))
+        directory_start = len(MAGIC)+UINT32.size
+        directory = pickler.loads(self.data[directory_start:directory_start+directory_length])
+        self.info = directory['info']
+        self.table_for_name = {}
+        self.names = []
+        for name, offset, num_entries, num_buckets, key_kind, value_kind in directory['tables']:
+            table_offset = directory_start+directory_length+offset
+            self.table_for_name[name] = LexiconTable(self.data, table_offset, num_entries, num_buckets, key_kind, value_kind)
+            self.names.append(name)
+
+
+    def __getitem__(self, name):
+        return self.table_for_name[name]
+
+
+    def get_tables(self):
+        return [self.table_for_name[name] for name in self.names]
+
+
+def get_source_info(path, version):
+    from feature_cache import get_file_hash
+    stat = os.stat(path)
+    return (version, stat.st_size, stat.st_mtime, get_file_hash(path))
+
+
+def get_compiled_path(path):
+    '''
+    Compiled file of the lexicon path: its name and the hash of its absolute path, in the folder of the compiled lexicons
+    '''
+    compiled_folder = os.environ.get(COMPILED_FOLDER_VARIABLE) or DEFAULT_COMPILED_FOLDER
+    path_hash = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(compiled_folder, '%s_%s%s' % (os.path.basename(path), path_hash, COMPILED_EXTENSION))
+
+
+def load_compiled(path, version):
+    '''
+    Returns the store of the compiled file of path, or None if it does not exist or it's not valid for the current
+    file (different version of the tables, size, or modification time and content)
+    '''
+    compiled_path = get_compiled_path(path)
+    if not os.path.exists(compiled_path):
+        return None
+    try:
+        store = LexiconStore(compiled_path)
+        this_version, size, mtime, file_hash = store.info
+        if this_version != version:
+            return None
+        stat = os.stat(path)
+        if stat.st_size != size:
+            return None
+        if stat.st_mtime != mtime:
+            from feature_cache import get_file_hash
+            if get_file_hash(path) != file_hash:
+                return None
+    except Exception:
+        return None
+    return store
+
+
+def compile_file(path, tables, version):
+    '''
+    Stores the tables (list of (name, dictionary)) in the compiled file of path and returns its store. If the folder
+    is not writable the file is just not compiled, and None is returned
+    '''
+    compiled_path = get_compiled_path(path)
+    try:
+        if not os.path.isdir(os.path.dirname(compiled_path)):
+            os.makedirs(os.path.dirname(compiled_path))
+        write_store(compiled_path, tables, get_source_info(path, version))
+        return LexiconStore(compiled_path)
+    except (IOError, OSError) as e:
+        print('The lexicon %s could not be compiled to %s: %s' % (path, compiled_path, str(e)), file=sys.stderr)
+        return None
+
+
+#Tables of every compiled file, mapped once per process
+_tables_for_path = {}
+_tables_lock = threading.Lock()
+
+def get_compiled_tables(path, version, parse_function):
+    '''
+    Returns the list of tables of the file path: the tables of its compiled file if it's up to date, or the ones
+    returned by parse_function(path) (list of (name, dictionary)), which are compiled for the next time. If the
+    file can not be compiled the dictionaries are returned
+    '''
+    with _tables_lock:
+        tables = _tables_for_path.get((path, version))
+        if tables is None:
+            store = load_compiled(path, version)
+            if store is None:
+                parsed_tables = parse_function(path)
+                store = compile_file(path, parsed_tables, version)
+                if store is None:
+                    tables = [table for name, table in parsed_tables]
+            if tables is None:
+                tables = store.get_tables()
+            _tables_for_path[(path, version)] = tables
+        return tables
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+'''
+Bounded memo of the results of a lexicon lookup, keyed on the raw arguments of the lookup (for instance the lemma and
+the part-of-speech of a term, as they are in the KAF/NAF). The same few thousands of pairs are repeated all over a corpus,
+so most of the lookups (and the normalisation of their arguments) are done only once.
+
+The memo is a segmented LRU, so it can be kept in long-running processes (tagging server, batch mode) without growing
+and without losing the frequent keys: new keys enter the probation segment, and they are moved to the protected segment
+(PROTECTED_FRACTION of the size) when they are found again. The keys of a document full of rare words are evicted from
+the probation segment, while the frequent ones stay in the protected segment as long as they are used
+'''
+from __future__ import print_function
+import sys
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_MAX_SIZE = 20000
+PROTECTED_FRACTION = 0.8
+
+#The result of the lookup can be None, which is also memoised
+_MISSING = object()
+
+
+class LookupMemo:
+    def __init__(self, function, max_size=DEFAULT_MAX_SIZE, name=None):
+        '''
+        Memo of function(*arguments), with max_size results at most (0 to call always to the function)
+        '''
+        self.function = function
+        self.max_size = max_size
+        self.name = name or getattr(function, '__name__', 'lookup')
+        self.protected_size = int(max_size * PROTECTED_FRACTION)
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        #The tagging server can run several documents at the same time
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+
+    def __call__(self, *arguments):
+        if self.max_size <= 0:
+            return self.function(*arguments)
+        with self.lock:
+            value = self.protected.get(arguments, _MISSING)
+            if value is not _MISSING:
+                self.protected.move_to_end(arguments)
+                self.hits += 1
+                return value
+            value = self.probation.pop(arguments, _MISSING)
+            if value is not _MISSING:
+                #Found twice, it's promoted to the protected segment, and the least recently used protected key goes back
+                #to the probation segment if it's full
+                self.protected[arguments] = value
+                if len(self.protected) > self.protected_size:
+                    old_arguments, old_value = self.protected.popitem(last=False)
+                    self.add_to_probation(old_arguments, old_value)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = self.function(*arguments)
+        with self.lock:
+            if arguments not in self.protected:
+                self.add_to_probation(arguments, value)
+        return value
+
+
+    def add_to_probation(self, arguments, value):
+        self.probation[arguments] = value
+        if len(self.probation) + len(self.protected) > self.max_size:
+            self.probation.popitem(last=False)
+            self.evictions += 1
+
+
+    def __len__(self):
+        return len(self.probation) + len(self.protected)
+
+
+    def clear(self):
+        with self.lock:
+            self.probation.clear()
+            self.protected.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+    def get_hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return float(self.hits) / total
+
+
+    def report(self):
+        print('Memo of %s: %d hits, %d misses (%.1f%% hit rate), %d evictions, %d/%d entries' % (self.name, self.hits, self.misses, 100*self.get_hit_rate(), self.evictions, len(self), self.max_size), file=sys.stderr)
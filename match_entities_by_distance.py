@@ -5,6 +5,7 @@ from __future__ import print_function
 import sys
 from collections import defaultdict
 from KafNafParserPy import KafNafParser
+from document_index import get_document_index
 
 
 class Centity:
@@ -60,22 +61,10 @@ class Centity:
         return avg_position
     
     def get_avg_position_num_tokens(self, naf_obj):
-        list_ids_offset = []
-        for token in naf_obj.get_tokens():
-            list_ids_offset.append((token.get_id(),int(token.get_offset())))
-        
-        if hasattr(naf_obj, 'position_for_token'):
-            pass
-        else:
-            naf_obj.position_for_token = {}
-            numT = 0
-            for token_id, token_offset in sorted(list_ids_offset, key=lambda t: -t[1]):
-                naf_obj.position_for_token[token_id] = numT
-                numT += 1    
-            
+        document_index = get_document_index(naf_obj)
         position_total = 0
         for token_id in self.token_id_list:
-            position = naf_obj.position_for_token[token_id]
+            position = document_index.get_position_by_offset(token_id)
             position_total += position
             
         avg_position =  1.0*position_total/len(self.token_id_list)
@@ -83,8 +72,7 @@ class Centity:
     
     def get_sentence(self, naf_obj):
         first_token = self.token_id_list[0]
-        token_obj = naf_obj.get_token(first_token)
-        sentence = token_obj.get_sent()
+        sentence = get_document_index(naf_obj).sentence_for_token_id[first_token]
         return sentence
 
 def load_entities(filename):
@@ -101,6 +89,11 @@ def match_entities(expression_entities, target_entities, knaf_obj):
     matched_pairs = []
 
     if len(expression_entities) > 0:
+        #The expressions of every sentence (in the same order), so the targets are compared only with them
+        expressions_for_sentence = defaultdict(list)
+        for expression in expression_entities:
+            expressions_for_sentence[expression.get_sentence(knaf_obj)].append(expression)
+            
         for target in target_entities:
             target_sentence = target.get_sentence(knaf_obj)
             #position_for_target = target.get_avg_position(knaf_obj)
@@ -108,13 +101,11 @@ def match_entities(expression_entities, target_entities, knaf_obj):
             
             expressions_with_distance = []
             #print 'Entity: ',expression.word_list, position_for_expression
-            for expression in expression_entities:
-                expression_sentence = expression.get_sentence(knaf_obj)
-                if target_sentence == expression_sentence:
-                    #position_for_expression = expression.get_avg_position(knaf_obj)
-                    position_for_expression = expression.get_avg_position_num_tokens(knaf_obj)
-                    distance = abs(position_for_expression-position_for_target)
-                    expressions_with_distance.append((expression,distance))
+            for expression in expressions_for_sentence.get(target_sentence,[]):
+                #position_for_expression = expression.get_avg_position(knaf_obj)
+                position_for_expression = expression.get_avg_position_num_tokens(knaf_obj)
+                distance = abs(position_for_expression-position_for_target)
+                expressions_with_distance.append((expression,distance))
                 
             if len(expressions_with_distance) != 0:
                 expressions_with_distance.sort(key=lambda t: t[1])
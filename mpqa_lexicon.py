@@ -4,10 +4,25 @@ from __future__ import print_function
 from __future__ import print_function
 import os
 import re
+import sys
+
+import lexicon_store
+from lookup_memo import LookupMemo, DEFAULT_MAX_SIZE
 
 ##from __init__ import PATH_MPQA_LEXICON
 
-PATH_MPQA_LEXICON = './data/subjclueslen1-HLTEMNLP05.tff'
+__here__ = os.path.realpath(os.path.dirname(__file__))
+
+#The lexicon is in the data folder next to the code, or in the working folder as it used to be
+MPQA_LEXICON_FILENAME = 'subjclueslen1-HLTEMNLP05.tff'
+PATH_MPQA_LEXICON = os.path.join(__here__, 'data', MPQA_LEXICON_FILENAME)
+if not os.path.exists(PATH_MPQA_LEXICON):
+    PATH_MPQA_LEXICON = os.path.join('.', 'data', MPQA_LEXICON_FILENAME)
+
+#The tables of the lexicon are compiled to a lexicon store (see lexicon_store). The version changes
+#whenever the content of the tables changes
+COMPILED_VERSION = 2
+TABLE_NAMES = ['stemmed', 'stemmed_anypos', 'no_stemmed', 'no_stemmed_anypos']
 
 def normalize_pos(pos):
     pos = pos.lower()
@@ -25,40 +40,76 @@ def normalize_pos(pos):
     return new_pos
 
 
+def parse_lexicon(path):
+    '''
+    Reads the lexicon in the MPQA format and returns the tables (stemmed, stemmed_anypos, no_stemmed, no_stemmed_anypos)
+    '''
+    stemmed = {}
+    stemmed_anypos = {}
+    no_stemmed = {}
+    no_stemmed_anypos = {}
+    # Format of lines: 
+    # type=weaksubj len=1 word1=abandoned pos1=adj stemmed1=n priorpolarity=negative
+    fic = open(path)
+    for line in fic:
+        line=line.strip()+' '
+        this_type = re.findall('type=([^ ]+)', line)[0]
+        word = re.findall('word1=([^ ]+)', line)[0]
+        pos = re.findall('pos1=([^ ]+)', line)[0]
+        stemmed_value = re.findall('stemmed1=([^ ]+)', line)[0]
+        prior_polarity = re.findall('priorpolarity=([^ ]+)', line)[0]
+        pos = normalize_pos(pos)
+        if stemmed_value == 'y':
+            stemmed[(word,pos)] = (this_type,prior_polarity)
+            if True or pos == '*':  #anypos
+                stemmed_anypos[word] = (this_type,prior_polarity)
+
+        elif stemmed_value == 'n':  
+            no_stemmed[(word,pos)] = (this_type,prior_polarity) 
+            if True or pos == '*':
+                no_stemmed_anypos[word] = (this_type,prior_polarity)
+    fic.close()
+    return stemmed, stemmed_anypos, no_stemmed, no_stemmed_anypos
+
+
+def parse_lexicon_tables(path):
+    return list(zip(TABLE_NAMES, parse_lexicon(path)))
+
+
+def get_lexicon_tables(path):
+    '''
+    Returns the tables of the lexicon, mapped from the compiled lexicon if it's up to date or parsing the lexicon
+    (and compiling it) if not. They are loaded once per process, and the compiled lexicon is shared by all the
+    processes. Empty tables if the lexicon does not exist
+    '''
+    if not os.path.exists(path):
+        return ({}, {}, {}, {})
+    return tuple(lexicon_store.get_compiled_tables(path, COMPILED_VERSION, parse_lexicon_tables))
+
+
 class MPQA_subjectivity_lexicon:
-    def __init__(self):
+    def __init__(self, memo_size=DEFAULT_MAX_SIZE):
         self.stemmed = {}
         self.stemmed_anypos = {}
         self.no_stemmed = {}
         self.no_stemmed_anypos = {}
+        self.memo_size = memo_size
 
         self.__load()
         
     def __load(self):
-        # Format of lines: 
-        # type=weaksubj len=1 word1=abandoned pos1=adj stemmed1=n priorpolarity=negative
-        if os.path.exists(PATH_MPQA_LEXICON):
+        #The tables are shared with the rest of objects of the process, they are not modified
+        self.stemmed, self.stemmed_anypos, self.no_stemmed, self.no_stemmed_anypos = get_lexicon_tables(PATH_MPQA_LEXICON)
+        #Results of get_type_and_polarity for the (word, pos) given by the extractors
+        self.memo = LookupMemo(self.lookup_type_and_polarity, self.memo_size, name='MPQA lexicon')
         
-            fic = open(PATH_MPQA_LEXICON)
-            for line in fic:
-                line=line.strip()+' '
-                this_type = re.findall('type=([^ ]+)', line)[0]
-                word = re.findall('word1=([^ ]+)', line)[0]
-                pos = re.findall('pos1=([^ ]+)', line)[0]
-                stemmed = re.findall('stemmed1=([^ ]+)', line)[0]
-                prior_polarity = re.findall('priorpolarity=([^ ]+)', line)[0]
-                pos = normalize_pos(pos)
-                if stemmed == 'y':
-                    self.stemmed[(word,pos)] = (this_type,prior_polarity)
-                    if True or pos == '*':  #anypos
-                        self.stemmed_anypos[word] = (this_type,prior_polarity)
-
-                elif stemmed == 'n':  
-                    self.no_stemmed[(word,pos)] = (this_type,prior_polarity) 
-                    if True or pos == '*':
-                        self.no_stemmed_anypos[word] = (this_type,prior_polarity)
-
-            fic.close()
+    def __getstate__(self):
+        #The mapped tables and the memo are not copied to other processes, they are loaded there again
+        return {'memo_size': self.memo_size}
+    
+    def __setstate__(self, state):
+        self.memo_size = state['memo_size']
+        self.__load()
         
     def print_all(self):
         for (word,pos), (this_type, this_polarity) in list(self.stemmed.items()):
@@ -66,6 +117,9 @@ class MPQA_subjectivity_lexicon:
                 print('%s;%s;%s' % (word,pos,this_polarity.upper()))
         
     def get_type_and_polarity(self,word,pos=None):
+        return self.memo(word,pos)
+    
+    def lookup_type_and_polarity(self,word,pos=None):
         res = None
         if pos is not None:
             pos = normalize_pos(pos)
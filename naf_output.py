@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+'''
+Output of the tagged KAF/NAF without serialising the whole document again. The opinion tagger only changes the header
+(linguistic processor of the opinions) and the opinions layer, so these two elements are serialised from the tagged
+object and spliced into the bytes of the input document. The rest of the input is copied as it is. The input can
+be bytes or a mmap of the file, so big documents do not need to be read in memory
+'''
+from __future__ import print_function
+import io
+import re
+import shutil
+from lxml import etree
+
+
+#Markup of XML: comments, CDATA, processing instructions, doctype and tags (group 1: '/' for end tags, group 2: name,
+#group 3: '/' for empty elements)
+MARKUP = re.compile(br'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<!DOCTYPE(?:[^\[>]|\[.*?\])*>|<(/?)([^\s/>!?]+)(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>', re.S)
+OPINIONS_START = re.compile(br'<opinions(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>')
+OPINIONS_END = re.compile(br'</opinions\s*>')
+
+
+def find_header(data, header_tag):
+    '''
+    Returns the position of the end of the start tag of the root, and the start and end positions of the header if it's
+    the first element of the root (None if it's not there)
+    '''
+    depth = 0
+    position = 0
+    root_start_end = header_start = None
+    while True:
+        match = MARKUP.search(data, position)
+        if match is None:
+            return None
+        position = match.end()
+        if match.group(2) is None:
+            #Comments, processing instructions...
+            continue
+        is_end = match.group(1) == b'/'
+        is_empty = match.group(3) == b'/'
+        if depth == 0:
+            if is_end or is_empty:
+                return None
+            root_start_end = match.end()
+            depth = 1
+        elif depth == 1:
+            if is_end or match.group(2) != header_tag:
+                #The header is not the first layer
+                return root_start_end, None, None
+            if is_empty:
+                return root_start_end, match.start(), match.end()
+            header_start = match.start()
+            depth = 2
+        else:
+            if is_end:
+                depth -= 1
+                if depth == 1:
+                    return root_start_end, header_start, match.end()
+            elif not is_empty:
+                depth += 1
+
+
+def skip_spaces_back(data, end):
+    while end > 0 and data[end-1:end].isspace():
+        end -= 1
+    return end
+
+
+def find_root_end(data):
+    '''
+    Position of the end tag of the root: the last end tag, after it there can be only spaces, comments and processing instructions
+    '''
+    end = skip_spaces_back(data, len(data))
+    while end > 0:
+        if data[end-3:end] == b'-->':
+            end = skip_spaces_back(data, data.rfind(b'<!--', 0, end))
+        elif data[end-2:end] == b'?>':
+            end = skip_spaces_back(data, data.rfind(b'<?', 0, end))
+        elif data[end-1:end] == b'>':
+            start = data.rfind(b'</', 0, end)
+            if start == -1:
+                return None
+            return start
+        else:
+            return None
+    return None
+
+
+def is_in_markup(data, position):
+    '''
+    Whether the position is inside of a comment or a CDATA section (they can not be nested)
+    '''
+    return data.rfind(b'<!--', 0, position) > data.rfind(b'-->', 0, position) or data.rfind(b'<![CDATA[', 0, position) > data.rfind(b']]>', 0, position)
+
+
+def find_opinion_layer(data):
+    '''
+    Returns (start, end) of the opinions layer, (None, None) if there is no opinions layer in the input, or None if it can
+    not be found for sure (several layers or candidates inside comments)
+    '''
+    starts = list(OPINIONS_START.finditer(data))
+    if len(starts) == 0:
+        return None, None
+    if len(starts) > 1 or is_in_markup(data, starts[0].start()):
+        return None
+    start_match = starts[0]
+    if start_match.group(1) == b'/':
+        return start_match.start(), start_match.end()
+    ends = list(OPINIONS_END.finditer(data, start_match.end()))
+    if len(ends) != 1 or is_in_markup(data, ends[0].start()):
+        return None
+    return start_match.start(), ends[0].end()
+
+
+def serialise(node, encoding):
+    return etree.tostring(node, encoding=encoding, xml_declaration=False, with_tail=False, pretty_print=True)
+
+
+def serialise_layer(node, encoding, new_opinions=None):
+    '''
+    Returns the parts of the opinions layer: the serialised node, or with new_opinions (a binary file with serialised
+    opinion elements) the start of the node, the file and the end tag
+    '''
+    layer_bytes = serialise(node, encoding).rstrip()
+    if new_opinions is None:
+        return [layer_bytes]
+    if layer_bytes.endswith(b'/>'):
+        start = layer_bytes[:-2]+b'>\n'
+    else:
+        start = layer_bytes[:layer_bytes.rindex(b'</')]
+    return [start, new_opinions, b'</'+node.tag.encode(encoding)+b'>']
+
+
+def find_positions(data, kaf_naf_obj):
+    '''
+    Returns the positions in the input (data) of the end of the start tag of the root, the header (None if it is not
+    there), the opinions layer (None if it is not there) and the end tag of the root, or None if the input can not
+    be spliced safely
+    '''
+    encoding = kaf_naf_obj.tree.docinfo.encoding or 'UTF-8'
+    if 'UTF-16' in encoding.upper() or 'UTF-32' in encoding.upper():
+        return None
+    if kaf_naf_obj.get_type() == 'NAF':
+        header_tag = b'nafHeader'
+    else:
+        header_tag = b'kafHeader'
+
+    header_positions = find_header(data, header_tag)
+    root_end = find_root_end(data)
+    opinion_layer_positions = find_opinion_layer(data)
+    if header_positions is None or root_end is None or opinion_layer_positions is None:
+        return None
+    root_start_end, header_start, header_end = header_positions
+    opinion_layer_start, opinion_layer_end = opinion_layer_positions
+    if opinion_layer_start is not None and (opinion_layer_start < root_start_end or opinion_layer_end > root_end):
+        return None
+    #KafNafParser creates the header as the first element, if it was somewhere else in the input it's not spliced
+    header = kaf_naf_obj.get_header()
+    if header_start is None and header is not None and kaf_naf_obj.root.index(header.get_node()) != 0:
+        return None
+    return root_start_end, header_start, header_end, opinion_layer_start, opinion_layer_end, root_end
+
+
+def get_changes(data, kaf_naf_obj, keep_opinions=False, new_opinions=None):
+    '''
+    Returns the changes of the input (data) to write the tagged KAF/NAF object as a list of (start, end, new parts), in
+    the order of the document: the header and the opinions layer of the input are replaced by the ones of the object,
+    and if the opinions of the input are not kept (they were removed from the object before tagging), the new opinions
+    layer is added at the end of the document, as KafNafParser does. The new opinions can also be given already
+    serialised in a binary file (new_opinions), they are added at the end of the opinions layer of the object.
+    Returns None if the input can not be spliced safely, the object has to be dumped then
+    '''
+    positions = find_positions(data, kaf_naf_obj)
+    if positions is None:
+        return None
+    root_start_end, header_start, header_end, opinion_layer_start, opinion_layer_end, root_end = positions
+    encoding = kaf_naf_obj.tree.docinfo.encoding or 'UTF-8'
+
+    changes = []
+    header_node = kaf_naf_obj.get_header().get_node()
+    header_bytes = serialise(header_node, encoding)
+    if header_start is None:
+        changes.append((root_start_end, root_start_end, [b'\n'+header_bytes]))
+    else:
+        changes.append((header_start, header_end, [header_bytes.rstrip()]))
+
+    opinion_node = None
+    if kaf_naf_obj.opinion_layer is not None:
+        opinion_node = kaf_naf_obj.opinion_layer.get_node()
+    elif new_opinions is not None:
+        opinion_node = etree.Element('opinions')
+    if keep_opinions and opinion_layer_start is not None:
+        changes.append((opinion_layer_start, opinion_layer_end, serialise_layer(opinion_node, encoding, new_opinions)))
+    else:
+        if opinion_layer_start is not None:
+            changes.append((opinion_layer_start, opinion_layer_end, []))
+        if opinion_node is not None:
+            new_layer = serialise_layer(opinion_node, encoding, new_opinions)+[b'\n']
+            if data[root_end-1:root_end] != b'\n':
+                new_layer.insert(0, b'\n')
+            changes.append((root_end, root_end, new_layer))
+    return changes
+
+
+def write_spliced(data, kaf_naf_obj, output, keep_opinions=False, new_opinions=None):
+    '''
+    Writes the tagged KAF/NAF object to the binary stream output by splicing the header and the opinions into the input
+    (see get_changes). Returns False if the input can not be spliced, and nothing is written then
+    '''
+    changes = get_changes(data, kaf_naf_obj, keep_opinions, new_opinions)
+    if changes is None:
+        return False
+    #The input is not copied, a memoryview of bytes or of a mmap is written directly
+    input_view = memoryview(data)
+    position = 0
+    for start, end, new_parts in changes:
+        output.write(input_view[position:start])
+        for part in new_parts:
+            if isinstance(part, bytes):
+                output.write(part)
+            else:
+                part.seek(0)
+                shutil.copyfileobj(part, output)
+        position = end
+    output.write(input_view[position:])
+    input_view.release()
+    return True
+
+
+def splice_opinions(data, kaf_naf_obj, keep_opinions=False):
+    '''
+    Returns the tagged KAF/NAF object as bytes, from the bytes of the input (data), or None if the input can not
+    be spliced safely (see get_changes)
+    '''
+    output = io.BytesIO()
+    if not write_spliced(data, kaf_naf_obj, output, keep_opinions):
+        return None
+    return output.getvalue()
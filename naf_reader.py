@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+
+'''
+Fast reader of KAF/NAF files for the feature extractors. The file is read as a stream (iterparse) and only the layers
+used by the extractors are kept: the tokens and terms are stored in arrays, and the constituency, dependency and opinion
+layers are read by the classes of KafNafParserPy (so the constituency and dependency extractors are the same). The
+elements of the rest of layers (entities, coreferences, srl...) are removed as soon as they are parsed. Very large
+documents can also be read in windows of sentences (NafWindowReader)
+'''
+from __future__ import print_function
+import sys
+import io
+from lxml import etree
+
+from KafNafParserPy.constituency_data import Cconstituency
+from KafNafParserPy.dependency_data import Cdependencies
+from KafNafParserPy.opinion_data import Copinions
+from KafNafParserPy.feature_extractor import Cdependency_extractor, Cconstituency_extractor
+from KafNafParserPy import KafNafParser
+
+
+#Layers of KAF/NAF, the ones not listed here are kept in memory until the whole file is read
+LAYER_TAGS = ('nafHeader', 'kafHeader', 'raw', 'text', 'terms', 'entities', 'coreferences', 'srl', 'constituency', 'deps',
+              'opinions', 'chunks', 'features', 'properties', 'markables', 'timeExpressions', 'temporalRelations',
+              'causalRelations', 'factualities', 'factualitylayer', 'attribution', 'topics')
+#Elements of the layers: the tokens and terms are stored in the arrays, and the rest are removed as soon as they are read
+ELEMENT_TAGS = ('wf', 'term', 'entity', 'coref', 'predicate', 'chunk', 'mark', 'timex3', 'tlink', 'clink', 'factuality', 'property')
+
+
+class NafToken:
+    '''
+    Token of the reader, with the same methods used from the Cwf objects of KafNafParserPy
+    '''
+    __slots__ = ('reader', 'index')
+
+    def __init__(self, reader, index):
+        self.reader = reader
+        self.index = index
+
+    def get_id(self):
+        return self.reader.token_ids[self.index]
+
+    def get_text(self):
+        return self.reader.token_texts[self.index]
+
+    def get_sent(self):
+        return self.reader.token_sents[self.index]
+
+    def get_offset(self):
+        return self.reader.token_offsets[self.index]
+
+
+class NafSpan:
+    __slots__ = ('span_ids',)
+
+    def __init__(self, span_ids):
+        self.span_ids = span_ids
+
+    def get_span_ids(self):
+        return list(self.span_ids)
+
+
+class NafTerm:
+    '''
+    Term of the reader, with the same methods used from the Cterm objects of KafNafParserPy
+    '''
+    __slots__ = ('reader', 'index')
+
+    def __init__(self, reader, index):
+        self.reader = reader
+        self.index = index
+
+    def get_id(self):
+        return self.reader.term_ids[self.index]
+
+    def get_lemma(self):
+        return self.reader.term_lemmas[self.index]
+
+    def get_pos(self):
+        return self.reader.term_pos[self.index]
+
+    def get_span(self):
+        span_ids = self.reader.term_spans[self.index]
+        if span_ids is None:
+            return None
+        return NafSpan(span_ids)
+
+
+class NafReader:
+    '''
+    Layers of a KAF/NAF file needed to extract the features, with the same methods that the extractors use from KafNafParser
+    (get_tokens, get_token, get_terms, get_term, get_opinions and the constituency and dependency extractors). Without
+    filename the object is empty, and it's filled by NafWindowReader
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.type = None
+        self.lang = None
+        #Tokens
+        self.token_ids = []
+        self.token_texts = []
+        self.token_sents = []
+        self.token_offsets = []
+        self.num_token_for_id = {}
+        #Terms
+        self.term_ids = []
+        self.term_lemmas = []
+        self.term_pos = []
+        self.term_spans = []                #Tuple of token ids, or None if the term has no span
+        self.num_term_for_id = {}
+        #Rest of layers, objects of KafNafParserPy
+        self.constituency_layer = None
+        self.dependency_layer = None
+        self.opinion_layer = None
+        self.my_constituency_extractor = None
+        self.my_dependency_extractor = None
+        if filename is not None:
+            self.read(filename)
+
+
+    def read(self, filename):
+        #Only the end of the layers and of their elements is processed, so the rest of the document is not visited
+        #Like KafNafParser, only the first layer of every type is read
+        text_node = terms_node = None
+        root = None
+        for event, element in etree.iterparse(filename, events=('end',), tag=LAYER_TAGS+ELEMENT_TAGS, remove_blank_text=True):
+            if root is None:
+                root = element.getroottree().getroot()
+                self.type = root.tag
+                self.lang = root.get('{http://www.w3.org/XML/1998/namespace}lang')
+            parent = element.getparent()
+            if parent is root:
+                #End of a layer, the ones that are kept are referenced by their objects
+                if element.tag == 'constituency' and self.constituency_layer is None:
+                    self.constituency_layer = Cconstituency(element)
+                elif element.tag == 'deps' and self.dependency_layer is None:
+                    self.dependency_layer = Cdependencies(element)
+                elif element.tag == 'opinions' and self.opinion_layer is None:
+                    self.opinion_layer = Copinions(element, type=self.type)
+                else:
+                    element.clear()
+                root.remove(element)
+            elif parent is not None and parent.getparent() is root:
+                #End of an element of a layer
+                if parent.tag in ('constituency', 'deps', 'opinions'):
+                    continue
+                if element.tag == 'wf' and parent.tag == 'text':
+                    if text_node is None:
+                        text_node = parent
+                    if parent is text_node:
+                        self.add_token(element)
+                elif element.tag == 'term' and parent.tag == 'terms':
+                    if terms_node is None:
+                        terms_node = parent
+                    if parent is terms_node:
+                        self.add_term(element)
+                #Already stored in the arrays or not needed
+                element.clear()
+                parent.remove(element)
+
+
+    def add_token(self, element):
+        if self.type == 'KAF':
+            token_id = element.get('wid')
+        else:
+            token_id = element.get('id')
+        self.num_token_for_id[token_id] = len(self.token_ids)
+        self.token_ids.append(token_id)
+        self.token_texts.append(element.text)
+        sent = element.get('sent')
+        if sent is not None:
+            sent = sys.intern(sent)
+        self.token_sents.append(sent)
+        self.token_offsets.append(element.get('offset'))
+
+
+    def add_term(self, element):
+        if self.type == 'KAF':
+            term_id = element.get('tid')
+        else:
+            term_id = element.get('id')
+        self.num_term_for_id[term_id] = len(self.term_ids)
+        self.term_ids.append(term_id)
+        self.term_lemmas.append(element.get('lemma'))
+        pos = element.get('pos')
+        if pos is not None:
+            pos = sys.intern(pos)
+        self.term_pos.append(pos)
+        span = element.find('span')
+        if span is None:
+            self.term_spans.append(None)
+        else:
+            self.term_spans.append(tuple(target.get('id') for target in span.findall('target')))
+
+
+    def get_tokens(self):
+        for num_token in range(len(self.token_ids)):
+            yield NafToken(self, num_token)
+
+
+    def get_token(self, token_id):
+        num_token = self.num_token_for_id.get(token_id)
+        if num_token is None:
+            return None
+        return NafToken(self, num_token)
+
+
+    def get_terms(self):
+        for num_term in range(len(self.term_ids)):
+            yield NafTerm(self, num_term)
+
+
+    def get_term(self, term_id):
+        num_term = self.num_term_for_id.get(term_id)
+        if num_term is None:
+            return None
+        return NafTerm(self, num_term)
+
+
+    def get_opinions(self):
+        if self.opinion_layer is not None:
+            for opinion in self.opinion_layer.get_opinions():
+                yield opinion
+
+
+    def get_trees(self):
+        if self.constituency_layer is not None:
+            for tree in self.constituency_layer.get_trees():
+                yield tree
+
+
+    def get_dependencies(self):
+        if self.dependency_layer is not None:
+            for dep in self.dependency_layer.get_dependencies():
+                yield dep
+
+
+    def get_constituency_extractor(self):
+        if self.constituency_layer is None:
+            return None
+        if self.my_constituency_extractor is None:
+            self.my_constituency_extractor = Cconstituency_extractor(self)
+        return self.my_constituency_extractor
+
+
+    def get_dependency_extractor(self):
+        if self.dependency_layer is None:
+            return None
+        if self.my_dependency_extractor is None:
+            self.my_dependency_extractor = Cdependency_extractor(self)
+        return self.my_dependency_extractor
+
+
+class LayerStream:
+    '''
+    Elements of the first layer layer_tag (for instance the 'term' elements of 'terms') of a KAF/NAF file, read one
+    by one with its own parser. The elements of the rest of layers are removed as soon as they are parsed, and the
+    parser stops at the end of the layer
+    '''
+    def __init__(self, filename, layer_tag, element_tag):
+        self.layer_tag = layer_tag
+        self.element_tag = element_tag
+        self.found = False                  #If the layer is in the file
+        self.root = None
+        self.next_element = None            #Next element of the layer, None at the end
+        self.events = etree.iterparse(filename, events=('end',), tag=LAYER_TAGS+ELEMENT_TAGS+('dep', 'tree'), remove_blank_text=True)
+        self.advance()
+
+
+    def advance(self):
+        self.next_element = None
+        if self.events is None:
+            return
+        for event, element in self.events:
+            if self.root is None:
+                self.root = element.getroottree().getroot()
+            parent = element.getparent()
+            if parent is self.root:
+                if element.tag == self.layer_tag:
+                    #End of the layer, the rest of the file is not needed
+                    self.found = True
+                    break
+                element.clear()
+                self.root.remove(element)
+            elif parent is not None and parent.getparent() is self.root:
+                parent.remove(element)
+                if parent.tag == self.layer_tag and element.tag == self.element_tag:
+                    self.found = True
+                    self.next_element = element
+                    return
+                element.clear()
+        self.events = None
+
+
+    def pop(self):
+        element = self.next_element
+        self.advance()
+        return element
+
+
+class NafWindowReader:
+    '''
+    Reads a KAF/NAF file in windows of num_sentences sentences, every one a NafReader object with only the tokens, terms,
+    dependencies and constituency trees of its sentences, so the memory used does not depend on the size of the document.
+    Every layer is read by its own parser (LayerStream), and they have to follow the order of the text, as KAF/NAF files
+    are usually written: the terms, dependencies and trees that are not in the current window are kept for the next one.
+    If a token of a window has no term, or some elements are not in any window, in_order is set to False (and no more
+    windows are read), the document has to be read as a whole then
+    '''
+    def __init__(self, filename, num_sentences):
+        self.filename = filename
+        self.num_sentences = num_sentences
+        self.in_order = True
+
+
+    def get_windows(self):
+        tokens = LayerStream(self.filename, 'text', 'wf')
+        terms = LayerStream(self.filename, 'terms', 'term')
+        dependencies = LayerStream(self.filename, 'deps', 'dep')
+        trees = LayerStream(self.filename, 'constituency', 'tree')
+        while tokens.next_element is not None:
+            window = NafReader()
+            window.filename = self.filename
+            window.type = tokens.root.tag
+            window.lang = tokens.root.get('{http://www.w3.org/XML/1998/namespace}lang')
+
+            sentence_ids = []
+            while tokens.next_element is not None:
+                sentence_id = tokens.next_element.get('sent')
+                if len(sentence_ids) == 0 or sentence_ids[-1] != sentence_id:
+                    if len(sentence_ids) == self.num_sentences:
+                        break
+                    sentence_ids.append(sentence_id)
+                window.add_token(tokens.pop())
+
+            while terms.next_element is not None:
+                first_target = terms.next_element.find('span/target')
+                if first_target is not None and first_target.get('id') not in window.num_token_for_id:
+                    break
+                window.add_term(terms.pop())
+            num_tokens_with_term = len(set(token_id for span_ids in window.term_spans if span_ids is not None for token_id in span_ids))
+            if num_tokens_with_term != len(window.token_ids):
+                self.in_order = False
+                return
+
+            if dependencies.found:
+                deps_node = etree.Element('deps')
+                while dependencies.next_element is not None and dependencies.next_element.get('from') in window.num_term_for_id:
+                    deps_node.append(dependencies.pop())
+                window.dependency_layer = Cdependencies(deps_node)
+
+            if trees.found:
+                constituency_node = etree.Element('constituency')
+                while trees.next_element is not None:
+                    first_target = trees.next_element.find('t/span/target')
+                    if first_target is not None and first_target.get('id') not in window.num_term_for_id:
+                        break
+                    constituency_node.append(trees.pop())
+                window.constituency_layer = Cconstituency(constituency_node)
+            yield window
+
+        for stream in (terms, dependencies, trees):
+            if stream.next_element is not None:
+                self.in_order = False
+
+
+def read_header_and_opinions(filename):
+    '''
+    Returns a KafNafParser object with the header and the opinion layer of the file, used to add the opinions found
+    in the windows of NafWindowReader. The rest of layers are empty, but in the same position of the file
+    '''
+    kept_tags = ('nafHeader', 'kafHeader', 'opinions')
+    root = None
+    for event, element in etree.iterparse(filename, events=('end',), tag=LAYER_TAGS+ELEMENT_TAGS+('dep', 'tree'), remove_blank_text=True):
+        if root is None:
+            root = element.getroottree().getroot()
+        parent = element.getparent()
+        if parent is root:
+            if element.tag not in kept_tags:
+                element.clear()
+        elif parent is not None and parent.getparent() is root and parent.tag not in kept_tags:
+            element.clear()
+            parent.remove(element)
+    if root is None:
+        return KafNafParser(filename)
+    tree = root.getroottree()
+    data = etree.tostring(tree, encoding=tree.docinfo.encoding or 'UTF-8', xml_declaration=True)
+    return KafNafParser(io.BytesIO(data))
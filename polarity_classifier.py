@@ -8,6 +8,7 @@ import tempfile
 from KafNafParserPy import KafNafParser
 from collections import defaultdict
 from subprocess import check_call
+from lexicon_store import get_compiled_tables
 
 
 __here__ = os.path.realpath(os.path.dirname(__file__))
@@ -20,11 +21,34 @@ SVM_LEARN = os.path.join(__here__,'svm_light','svm_learn')
 SVM_CLASSIFY = os.path.join(__here__,'svm_light','svm_classify')
 
 
+#Versions of the tables compiled from the lexicons and the feature index (see lexicon_store)
+LEXICON_VERSION = 1
+INDEX_VERSION = 1
+
+
+def parse_type_for_lemma(lexicon_file):
+    type_for_lemma = {}
+    fd = open(lexicon_file)
+    for line in fd:
+        #tokens = line.strip().split(';')
+        tokens = line.strip().split(';')
+        type_for_lemma[tokens[0]] = tokens[2]
+    fd.close()
+    return [('type_for_lemma', type_for_lemma)]
+
+
+def parse_index_features(index_file):
+    index_fd = open(index_file,'rb')
+    index_features = pickle.load(index_fd)
+    index_fd.close()
+    return [('index_features', index_features)]
+
 
 class PolarityClassifier:
     def __init__(self, lang):
         self.index_features = {}    #Map string to int
         self.folder = None
+        self.svm_model = None       #SVMLightModel, if the model is scored in memory
         self.type_for_lemma = None
         self.__load_type_for_lemma(lang)
             
@@ -35,14 +59,9 @@ class PolarityClassifier:
         if lang=='nl':
             this_file = os.path.join(__here__,'resources','lexicon.nl.txt')
         
-        if this_file is not None:    
-            self.type_for_lemma = {}
-            fd = open(this_file)
-            for line in fd:
-                #tokens = line.strip().split(';')
-                tokens = line.strip().split(';')
-                self.type_for_lemma[tokens[0]] = tokens[2]
-            fd.close()
+        if this_file is not None:
+            #Mapped from the compiled lexicon, shared by all the processes
+            self.type_for_lemma, = get_compiled_tables(this_file, LEXICON_VERSION, parse_type_for_lemma)
 
     def extract_bow_tokens(self, this_obj, term_ids):
         features = []
@@ -261,18 +280,22 @@ class PolarityClassifier:
         
     
     
-    def load_models(self,folder):
+    def load_models(self,folder, in_process=True):
         self.folder = folder
         
         #Load the index
         whole_index_file = os.path.join(self.folder,INDEX_FILE)        
-        index_fd = open(whole_index_file,'rb')
-        self.index_features = pickle.load(index_fd)
-        index_fd.close()
+        #The index is mapped from its compiled version (see lexicon_store), it's only read when classifying
+        self.index_features, = get_compiled_tables(whole_index_file, INDEX_VERSION, parse_index_features)
         #print
         #print 'Feature index loaded from %s with %d features' % (whole_index_file,len(self.index_features))
         #print
         
+        #The svm_light model is read only once and the opinions are scored without calling to svm_classify
+        if in_process:
+            from svm_light_model import SVMLightModel
+            self.svm_model = SVMLightModel(os.path.join(self.folder, MODEL_FILE))
+        
         
     def decide_class(self,float_value):
         if float_value >= 0.0:
@@ -281,6 +304,9 @@ class PolarityClassifier:
             return 'negative'
         
     def classify_list_opinions(self,this_obj, list_id_and_term_ids):
+        if self.svm_model is not None:
+            return self.classify_list_opinions_in_process(this_obj, list_id_and_term_ids)
+        
         class_for_opinion_id = {}
         features_for_opinion_id = {}
         
@@ -319,6 +345,26 @@ class PolarityClassifier:
         return class_for_opinion_id, features_for_opinion_id
     
     
+    def classify_list_opinions_in_process(self,this_obj, list_id_and_term_ids):
+        class_for_opinion_id = {}
+        features_for_opinion_id = {}
+        
+        list_opinion_ids = []
+        list_int_features = []
+        for opinion_id, term_ids in list_id_and_term_ids:
+            string_features = self.extract_features(this_obj, term_ids)
+            list_int_features.append(self.encode_string_features(string_features, update_index=False))
+            list_opinion_ids.append(opinion_id)
+            features_for_opinion_id[opinion_id] = string_features
+        
+        if len(list_opinion_ids) != 0:
+            values = self.svm_model.decision_values(list_int_features)
+            for opinion_id, value in zip(list_opinion_ids, values):
+                class_for_opinion_id[opinion_id] = self.decide_class(value)
+        
+        return class_for_opinion_id, features_for_opinion_id
+    
+    
     def classify_kaf_naf_object(self,this_obj):
         list_ids_term_ids = []
         for opinion in this_obj.get_opinions():
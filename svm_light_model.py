@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+'''
+In-process scorer for svm_light models, it gives the same decision values as svm_classify
+'''
+from __future__ import print_function
+
+import numpy
+
+
+LINEAR = 0
+POLYNOMIAL = 1
+RBF = 2
+SIGMOID = 3
+
+
+class SVMLightModel:
+    '''
+    svm_light model loaded from the file written by svm_learn. With the linear kernel the support vectors
+    are folded into one weight vector (as svm_classify does), for the rest of kernels their values are kept
+    sorted by feature index, so the products with an example only read the values of its features
+    '''
+    def __init__(self, model_filename=None):
+        self.kernel_type = LINEAR
+        self.poly_degree = 3
+        self.rbf_gamma = 1.0
+        self.coef_lin = 1.0
+        self.coef_const = 1.0
+        self.totwords = 0
+        self.b = 0.0
+        self.weights = None             #Linear kernel
+        self.alphas = None              #Rest of kernels, values of the support vectors by feature index
+        self.feature_indexes = None
+        self.feature_svs = None
+        self.feature_values = None
+        self.sv_twonorm_sq = None
+        if model_filename is not None:
+            self.load_model(model_filename)
+
+
+    def load_model(self, model_filename):
+        fd = open(model_filename,'r')
+        version = fd.readline().strip()
+        if not version.startswith('SVM-light Version'):
+            raise ValueError('The file %s is not a svm_light model' % model_filename)
+
+        #Every value of the header is followed by a comment
+        header = []
+        for n in range(10):
+            header.append(fd.readline().split('#')[0].strip())
+        self.kernel_type = int(header[0])
+        self.poly_degree = int(header[1])
+        self.rbf_gamma = float(header[2])
+        self.coef_lin = float(header[3])
+        self.coef_const = float(header[4])
+        if self.kernel_type not in [LINEAR, POLYNOMIAL, RBF, SIGMOID]:
+            raise ValueError('Kernel type %d of the model %s is not supported' % (self.kernel_type, model_filename))
+        self.totwords = int(header[6])
+        num_sv = int(header[8]) - 1
+        self.b = float(header[9])
+
+        #Each line is a support vector: alpha*y index:value ... #comment
+        alphas = []
+        values = []
+        indexes = []
+        pointers = [0]
+        for line in fd:
+            fields = line.split('#')[0].split()
+            if len(fields) == 0:
+                continue
+            alphas.append(float(fields[0]))
+            for field in fields[1:]:
+                index, value = field.split(':')
+                if index in ['qid', 'sid', 'cost']:
+                    continue
+                indexes.append(int(index))
+                values.append(float(value))
+            pointers.append(len(indexes))
+        fd.close()
+
+        if len(alphas) != num_sv:
+            raise ValueError('The model file %s is broken, %d support vectors and %d expected' % (model_filename, len(alphas), num_sv))
+
+        alphas = numpy.array(alphas)
+        #The values are stored as 32 bits floats by svm_light
+        values = numpy.array(values, dtype=numpy.float32).astype(numpy.float64)
+        indexes = numpy.array(indexes, dtype=numpy.int64)
+        pointers = numpy.array(pointers, dtype=numpy.int64)
+
+        sv_for_value = numpy.repeat(numpy.arange(num_sv), numpy.diff(pointers))
+        if self.kernel_type == LINEAR:
+            self.weights = numpy.zeros(max(self.totwords, indexes.max() if len(indexes) else 0)+1)
+            numpy.add.at(self.weights, indexes, alphas[sv_for_value] * values)
+        else:
+            self.alphas = alphas
+            self.sv_twonorm_sq = sum_per_row(values * values, pointers)
+            order = numpy.argsort(indexes, kind='stable')
+            self.feature_indexes = indexes[order]
+            self.feature_svs = sv_for_value[order]
+            self.feature_values = values[order]
+
+
+    def decision_values(self, list_features):
+        '''
+        Returns the decision values for a list of examples, each one given as a list or dictionary of
+        feature indexes (all the features have the value 1, as in the files created by the PolarityClassifier)
+        '''
+        list_indexes = [sorted(features) for features in list_features]
+        pointers = numpy.cumsum([0]+[len(indexes) for indexes in list_indexes])
+        indexes = numpy.array([index for these_indexes in list_indexes for index in these_indexes], dtype=numpy.int64)
+
+        if self.kernel_type == LINEAR:
+            #As svm_classify, the features over the highest index of the model are ignored
+            known = numpy.where(indexes <= self.totwords, indexes, 0)
+            return sum_per_row(self.weights[known], pointers) - self.b
+
+        #Products with the support vectors: every feature of an example adds the values of that feature in the
+        #support vectors, which are contiguous (the features that are not in the model have no values)
+        num_examples = len(list_indexes)
+        starts = numpy.searchsorted(self.feature_indexes, indexes, side='left')
+        lengths = numpy.searchsorted(self.feature_indexes, indexes, side='right') - starts
+        entries = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths) + numpy.arange(lengths.sum())
+        example_for_entry = numpy.repeat(numpy.repeat(numpy.arange(num_examples), numpy.diff(pointers)), lengths)
+        products = numpy.zeros((num_examples, len(self.alphas)))
+        numpy.add.at(products, (example_for_entry, self.feature_svs[entries]), self.feature_values[entries])
+
+        if self.kernel_type == POLYNOMIAL:
+            kernel = numpy.power(self.coef_lin * products + self.coef_const, float(self.poly_degree))
+        elif self.kernel_type == RBF:
+            twonorm_sq = numpy.diff(pointers).astype(numpy.float64)
+            kernel = numpy.exp(-self.rbf_gamma * (twonorm_sq[:,None] - 2*products + self.sv_twonorm_sq[None,:]))
+        else:
+            kernel = numpy.tanh(self.coef_lin * products + self.coef_const)
+        return numpy.dot(kernel, self.alphas) - self.b
+
+
+def sum_per_row(values, pointers):
+    '''
+    Sum of values[pointers[i]:pointers[i+1]] for every i (0 for the empty rows)
+    '''
+    sums = numpy.zeros(len(pointers)-1)
+    non_empty = pointers[1:] > pointers[:-1]
+    if len(values) != 0:
+        sums[non_empty] = numpy.add.reduceat(values, pointers[:-1][non_empty])
+    return sums
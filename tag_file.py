@@ -4,19 +4,36 @@
 from __future__ import print_function
 import os
 import sys
+import io
+import math
+import mmap
+import shutil
+import tempfile
 import argparse
+import multiprocessing
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 
 from extract_features_expression import main as expression_feature_extractor
+from extract_features_expression import load_parameters as load_expression_parameters
 from extract_features_target import main as target_feature_extractor
+from extract_features_target import load_parameters as load_target_parameters
 from extract_features_holder import main as holder_feature_extractor
+from extract_features_holder import load_parameters as load_holder_parameters
 from extract_sequences import extract_sequences
+from document_index import get_document_index
 import match_entities_by_distance as entity_matcher
 from subprocess import Popen, PIPE
 
 from path_crf import PATH_TO_CRF_TEST
 from KafNafParserPy import *
 from polarity_classifier import PolarityClassifier
+from mpqa_lexicon import MPQA_subjectivity_lexicon
+from naf_output import splice_opinions, find_positions, write_spliced, serialise
+from naf_reader import NafWindowReader, read_header_and_opinions
 
 
 __desc = 'Opinion Miner Deluxe'
@@ -26,89 +43,768 @@ __version = '3.0'
 __here__ = os.path.realpath(os.path.dirname(__file__))
 
 
+def add_linguistic_processor(kaf_naf_obj):
+    my_lp = Clp()
+    my_lp.set_name(__desc)
+    my_lp.set_version(__last_edited+'_'+__version)
+    my_lp.set_timestamp()   ##Set to the current date and time
+    kaf_naf_obj.add_linguistic_processor('opinions',my_lp)
+
+
+def generate_opinion_ids(opinion_ids_used):
+    '''
+    Yields the identifiers for the new opinions (o1, o2...), skipping the ones already used
+    '''
+    num_opinion = 0
+    while True:
+        num_opinion += 1
+        new_id = 'o'+str(num_opinion)
+        if new_id not in opinion_ids_used:
+            yield new_id
+
+
+def create_opinion(E, T, H, term_id_for_token_id, new_id, this_type):
+    E_term_ids = [term_id_for_token_id[tokenid] for tokenid in E.token_id_list if tokenid in term_id_for_token_id]
+    if T is None:
+        T_term_ids = []
+    else:
+        T_term_ids = [term_id_for_token_id[tokenid] for tokenid in T.token_id_list if tokenid in term_id_for_token_id]
+    
+    if H is None:
+        H_term_ids =[]
+    else:
+        H_term_ids = [term_id_for_token_id[tokenid] for tokenid in H.token_id_list if tokenid in term_id_for_token_id]
+            
+    new_opinion = Copinion(type=this_type)
+    new_opinion.set_id(new_id)
+    
+    #Create the holder
+    if len(H_term_ids) != 0:
+        span_hol = Cspan()
+        span_hol.create_from_ids(H_term_ids)
+        my_hol = Cholder()
+        my_hol.set_span(span_hol)
+        hol_text = ' '.join(H.word_list)
+        my_hol.set_comment(hol_text)  
+        new_opinion.set_holder(my_hol)  
+        
+    #Creating target
+    if len(T_term_ids) != 0:
+        span_tar = Cspan()
+        span_tar.create_from_ids(T_term_ids)
+        my_tar = opinion_data.Ctarget()
+        my_tar.set_span(span_tar)
+        tar_text = ' '.join(T.word_list)
+        my_tar.set_comment(tar_text)
+        new_opinion.set_target(my_tar)
+        #########################    
+
+    ##Creating expression
+    span_exp = Cspan()
+    span_exp.create_from_ids(E_term_ids)
+    my_exp = Cexpression()
+    my_exp.set_span(span_exp)
+    my_exp.set_polarity('DSE')
+    #if include_polarity_strength:
+    my_exp.set_strength("1")
+    exp_text = ' '.join(E.word_list)
+    my_exp.set_comment(exp_text)
+    new_opinion.set_expression(my_exp)
+    return new_opinion
+    
+
 def add_opinions(opinion_triples,kaf_naf_obj):
-    term_id_for_token_id = {}
-    for term in kaf_naf_obj.get_terms():
-        for token_id in term.get_span().get_span_ids():
-            term_id_for_token_id[token_id] = term.get_id()
+    term_id_for_token_id = get_document_index(kaf_naf_obj).term_id_for_token_id
             
     opinion_ids_used = set()
     for opinion in kaf_naf_obj.get_opinions():
         opinion_ids_used.add(opinion.get_id())
 
     #Adding linguistic processor
-    my_lp = Clp()
-    my_lp.set_name(__desc)
-    my_lp.set_version(__last_edited+'_'+__version)
-    my_lp.set_timestamp()   ##Set to the current date and time
-    kaf_naf_obj.add_linguistic_processor('opinions',my_lp)
+    add_linguistic_processor(kaf_naf_obj)
         
-    num_opinion = 0 
-
+    new_ids = generate_opinion_ids(opinion_ids_used)
     for E, T, H in opinion_triples:
-        E_term_ids = [term_id_for_token_id[tokenid] for tokenid in E.token_id_list if tokenid in term_id_for_token_id]
-        if T is None:
-            T_term_ids = []
-        else:
-            T_term_ids = [term_id_for_token_id[tokenid] for tokenid in T.token_id_list if tokenid in term_id_for_token_id]
+        kaf_naf_obj.add_opinion(create_opinion(E, T, H, term_id_for_token_id, next(new_ids), kaf_naf_obj.get_type()))
+
+
+def get_model_folder(domain, path_to_folder, language):
+    '''
+    Returns the folder with the models, given by the path or by the domain and the language of the file
+    '''
+    if domain:
+        model_folder='models/models_%s_%s' % (domain,language)
+    else:
+        model_folder=path_to_folder
+    return model_folder
+
+
+def run_crf_test(model_filename, feature_filename):
+    '''
+    Calls to crf_test with the model and the feature file and returns the list of lines of the output
+    '''
+    tagger_cmd = []
+    tagger_cmd.append(PATH_TO_CRF_TEST)
+    tagger_cmd.append('-m')
+    tagger_cmd.append(model_filename)
+    tagger_cmd.append(feature_filename)
+    
+    tagger = Popen(' '.join(tagger_cmd), shell=True, stdout=PIPE, stderr=PIPE)
+    tagger_out, tagger_error = tagger.communicate()
+    
+    #This variable stores a list of lines with the CRF output 
+    return tagger_out.splitlines()
+
+
+def create_entities(sequences, prefix, this_type):
+    '''
+    Creates the list of Centity objects for the sequences returned by extract_sequences
+    '''
+    entities = []
+    num_entity = 0
+    for list_ids, list_words in sequences:
+        entity = entity_matcher.Centity()
+        #ids contain filename
+        ids_with_no_filename = []
+        for this_id in list_ids:
+            p = this_id.rfind('#')
+            ids_with_no_filename.append(this_id[p+1:])
+        filename = this_id[:p]
+
+        entity.create('%s#%d' % (prefix, num_entity), this_type, filename, ids_with_no_filename, list_words)
+        entities.append(entity)
+        num_entity+=1
+    return entities
+    
+
+def split_sequences_per_file(sequences):
+    '''
+    Splits the sequences returned by extract_sequences by the filename of the token identifiers (filename#token_id)
+    '''
+    sequences_per_file = {}
+    for list_ids, list_words in sequences:
+        filename = list_ids[0][:list_ids[0].rfind('#')]
+        if filename not in sequences_per_file:
+            sequences_per_file[filename] = []
+        sequences_per_file[filename].append((list_ids, list_words))
+    return sequences_per_file
+    
+
+def read_kaf_naf(source, keep_input=False):
+    '''
+    Reads a KAF/NAF object from a filename, a stream or bytes. With keep_input the bytes of the input are kept in
+    the object (input_data), so the output can be written by splicing the opinions into them (see dump_tagged)
+    '''
+    if not keep_input:
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        return KafNafParser(source)
+    if isinstance(source, bytes):
+        data = source
+    elif isinstance(source, str):
+        fd = open(source, 'rb')
+        data = fd.read()
+        fd.close()
+    else:
+        data = getattr(source, 'buffer', source).read()
+    kaf_naf_obj = KafNafParser(io.BytesIO(data))
+    kaf_naf_obj.input_data = data
+    return kaf_naf_obj
+
+
+def dump_tagged(kaf_naf_obj, output=None, fast_output=False, keep_opinions=False):
+    '''
+    Writes the tagged KAF/NAF object to a filename or binary stream (standard output by default). With fast_output
+    the header and the opinions are spliced into the bytes of the input instead of serialising the whole document,
+    unless the input was not kept or can not be spliced safely
+    '''
+    data = None
+    if fast_output and getattr(kaf_naf_obj, 'input_data', None) is not None:
+        data = splice_opinions(kaf_naf_obj.input_data, kaf_naf_obj, keep_opinions)
+    if data is None:
+        kaf_naf_obj.dump(output)
+    elif output is None:
+        getattr(sys.stdout, 'buffer', sys.stdout).write(data)
+    elif isinstance(output, str):
+        fd = open(output, 'wb')
+        fd.write(data)
+        fd.close()
+    else:
+        output.write(data)
+        
         
-        if H is None:
-            H_term_ids =[]
+class OpinionTagger:
+    '''
+    Keeps in memory the parameters, lexicons and polarity models of one model folder, so
+    any number of KAF/NAF objects can be tagged without loading them again
+    '''
+    def __init__(self, model_folder, polarity=False, keep_opinions=False, log=False, crf_backend='crf_test', crf_workers=1):
+        self.model_folder = model_folder
+        self.polarity = polarity
+        self.keep_opinions = keep_opinions
+        self.log = log
+        self.crf_backend = crf_backend
+        
+        self.expression_parameters = load_expression_parameters(model_folder)
+        self.expression_parameters['mpqa_lexicon'] = MPQA_subjectivity_lexicon()
+        self.target_parameters = load_target_parameters(model_folder)
+        self.holder_parameters = load_holder_parameters(model_folder)
+        self.polarity_classifier_for_language = {}
+        
+        #With the python backend the CRF models are also kept in memory, instead of calling to crf_test
+        self.crf_model_for_name = {}
+        if crf_backend == 'python':
+            from crf_decoder import CRFPPModel, TEXT_MODEL_EXTENSION
+            for model_name in ['expression', 'target', 'holder']:
+                text_model_filename = model_folder+'/model.'+model_name+TEXT_MODEL_EXTENSION
+                if not os.path.exists(text_model_filename):
+                    raise IOError('The text model %s does not exist, it is created by training with crf_learn -t' % text_model_filename)
+                self.crf_model_for_name[model_name] = CRFPPModel(text_model_filename)
+        elif crf_backend == 'coprocess':
+            #Or crf_test keeps running between documents, with crf_workers processes per model
+            from crf_test_pool import CRFTestPool
+            for model_name in ['expression', 'target', 'holder']:
+                self.crf_model_for_name[model_name] = CRFTestPool(model_folder+'/model.'+model_name, num_workers=crf_workers)
+        
+        
+    def get_polarity_classifier(self, language):
+        if language not in self.polarity_classifier_for_language:
+            my_polarity_classifier = PolarityClassifier(language)
+            my_polarity_classifier.load_models(os.path.join(__here__,'polarity_models',language))
+            self.polarity_classifier_for_language[language] = my_polarity_classifier
+        return self.polarity_classifier_for_language[language]
+        
+        
+    def tag(self, kaf_naf_obj):
+        '''
+        Detects the opinions and adds them to the KAF/NAF object
+        '''
+        # We need to set this manually because the identifier for CRF will be the concatenation
+        # of the filename and the token id, and it's a <File> object if we create the kaf_naf_obj
+        # from a open stream
+        kaf_naf_obj.filename = 'stdin'
+        self.tag_list([kaf_naf_obj])
+        
+        
+    def tag_list(self, list_kaf_naf_obj):
+        '''
+        Detects the opinions for a list of KAF/NAF objects, with one single feature file and one call
+        to CRF for every step. The filename attribute of the objects has to be different for every object,
+        as it is used to split the output of CRF per file
+        '''
+        if not self.keep_opinions:
+            for kaf_naf_obj in list_kaf_naf_obj:
+                kaf_naf_obj.remove_opinion_layer()
+        
+        expression_sequences, target_sequences, holder_sequences = self.detect_sequences(list_kaf_naf_obj)
+        
+        expression_sequences_per_file = split_sequences_per_file(expression_sequences)
+        target_sequences_per_file = split_sequences_per_file(target_sequences)
+        holder_sequences_per_file = split_sequences_per_file(holder_sequences)
+        
+        for kaf_naf_obj in list_kaf_naf_obj:
+            self.add_opinions_for_sequences(kaf_naf_obj,
+                                            expression_sequences_per_file.get(kaf_naf_obj.filename,[]),
+                                            target_sequences_per_file.get(kaf_naf_obj.filename,[]),
+                                            holder_sequences_per_file.get(kaf_naf_obj.filename,[]))
+        
+        
+    def tag_in_windows(self, kaf_naf_obj, window_reader):
+        '''
+        Detects the opinions of a document read in windows of sentences by window_reader (naf_reader.NafWindowReader),
+        so only one window and its features are in memory at the same time. kaf_naf_obj has only the header and the
+        opinions of the document (naf_reader.read_header_and_opinions): the linguistic processor is added to it, and
+        the new opinions are written, already serialised, to a temporary file that is returned (None if there are no
+        opinions), to be spliced into the document (naf_output.write_spliced)
+        '''
+        if not self.keep_opinions:
+            kaf_naf_obj.remove_opinion_layer()
+        add_linguistic_processor(kaf_naf_obj)
+        this_type = kaf_naf_obj.get_type()
+        encoding = kaf_naf_obj.tree.docinfo.encoding or 'UTF-8'
+        opinion_ids_used = set()
+        for opinion in kaf_naf_obj.get_opinions():
+            opinion_ids_used.add(opinion.get_id())
+        new_ids = generate_opinion_ids(opinion_ids_used)
+        #The polarity of the opinions of the input is also calculated, in the window of their expression
+        opinions_to_classify = []
+        if self.polarity:
+            opinions_to_classify = list(kaf_naf_obj.get_opinions())
+        
+        opinions_fd = tempfile.TemporaryFile()
+        for window in window_reader.get_windows():
+            window.filename = kaf_naf_obj.filename
+            expression_sequences, target_sequences, holder_sequences = self.detect_sequences([window])
+            final_triples = self.get_opinion_triples(window, expression_sequences, target_sequences, holder_sequences)
+            term_id_for_token_id = get_document_index(window).term_id_for_token_id
+            window.opinion_layer = Copinions(type=this_type)
+            for E, T, H in final_triples:
+                window.opinion_layer.add_opinion(create_opinion(E, T, H, term_id_for_token_id, next(new_ids), this_type))
+                
+            if self.polarity:
+                my_polarity_classifier = self.get_polarity_classifier(kaf_naf_obj.get_language())
+                my_polarity_classifier.classify_kaf_naf_object(window)
+                opinions_in_window = []
+                list_ids_term_ids = []
+                for opinion in opinions_to_classify:
+                    term_ids = opinion.get_expression().get_span().get_span_ids()
+                    if len(term_ids) != 0 and all(window.get_term(term_id) is not None for term_id in term_ids):
+                        opinions_in_window.append(opinion)
+                        list_ids_term_ids.append((opinion.get_id(), term_ids))
+                if len(opinions_in_window) != 0:
+                    class_for_opinion_id, features_for_opinion_id = my_polarity_classifier.classify_list_opinions(window, list_ids_term_ids)
+                    for opinion in opinions_in_window:
+                        opinion.get_expression().set_polarity(class_for_opinion_id[opinion.get_id()])
+                    
+            for opinion in window.get_opinions():
+                opinions_fd.write(serialise(opinion.get_node(), encoding))
+        
+        if opinions_fd.tell() == 0:
+            opinions_fd.close()
+            return None
+        return opinions_fd
+        
+        
+    def detect_sequences(self, list_kaf_naf_obj):
+        '''
+        Runs the three steps for a list of KAF/NAF objects and returns the sequences of expressions, targets and holders
+        '''
+        #########################################
+        ########  BEGIN  EXPRESSION PART     ####
+        #########################################
+        
+        # 1) CALL TO THE FEATURE EXTRACTOR FOR EXPRESSIONS
+        # 2) CALL TO THE MODEL
+        expression_out_lines = self.run_crf(expression_feature_extractor, 'expression', list_kaf_naf_obj, overall_parameters=self.expression_parameters)
+          
+        # The expression sequences detected:
+        #[(['example_en.naf#w4'], ['nice']), 
+        # (['example_en.naf#w9', 'example_en.naf#w10', 'example_en.naf#w11'], ['the', 'best', '!!'])]
+        expression_sequences = extract_sequences(expression_out_lines,'DSE')
+        #########################################
+        ########  END  EXPRESSION PART     ####
+        #########################################
+     
+     
+        #########################################
+        ########  TARGET AND HOLDER PARTS    ####
+        #########################################
+        # Both depend only on the expressions, so they run at the same time (the feature
+        # extraction of one step can run while the CRF process of the other one is working).
+        # The document index built by the expression step is shared by both
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            target_future = executor.submit(self.detect_entities, target_feature_extractor, self.target_parameters, 'target', 'TARGET', list_kaf_naf_obj, expression_sequences)
+            holder_future = executor.submit(self.detect_entities, holder_feature_extractor, self.holder_parameters, 'holder', 'HOLDER', list_kaf_naf_obj, expression_sequences)
+            target_sequences = target_future.result()
+            holder_sequences = holder_future.result()
+        return expression_sequences, target_sequences, holder_sequences
+        
+        
+    def detect_entities(self, feature_extractor, parameters, model_name, entity_type, list_kaf_naf_obj, expression_sequences):
+        '''
+        Runs the feature extractor and the CRF model for the targets or the holders of the detected expressions
+        '''
+        out_lines = self.run_crf(feature_extractor, model_name, list_kaf_naf_obj, overall_parameters=parameters, detected_dse=expression_sequences)
+        return extract_sequences(out_lines, entity_type)
+    
+    
+    def run_crf(self, feature_extractor, model_name, list_kaf_naf_obj, **extractor_arguments):
+        '''
+        Extracts the features and tags them with the CRF model, with a new crf_test process, with the decoder
+        in memory (python backend) or with the crf_test processes kept running (coprocess backend).
+        Returns the lines of the output in the format of crf_test
+        '''
+        if self.crf_backend != 'crf_test':
+            sequences = feature_extractor(list_kaf_naf_obj,'tag', self.model_folder, log=self.log, in_memory=True, **extractor_arguments)
+            return self.crf_model_for_name[model_name].tag_sequences(sequences)
         else:
-            H_term_ids = [term_id_for_token_id[tokenid] for tokenid in H.token_id_list if tokenid in term_id_for_token_id]
-        
-        new_id = None
-        while True:
-            new_id = 'o'+str(num_opinion+1)
-            if new_id not in opinion_ids_used:
-                opinion_ids_used.add(new_id)
-                break
-            else:
-                num_opinion += 1
+            feature_file = feature_extractor(list_kaf_naf_obj,'tag', self.model_folder, log=self.log, **extractor_arguments)
+            out_lines = run_crf_test(self.model_folder+'/model.'+model_name, feature_file)
+            os.remove(feature_file)
+            return out_lines
+    
+    
+    def add_opinions_for_sequences(self, kaf_naf_obj, expression_sequences, target_sequences, holder_sequences):
+        '''
+        Links the expressions, targets and holders detected for one KAF/NAF object and adds the opinions to it
+        '''
+        final_triples = self.get_opinion_triples(kaf_naf_obj, expression_sequences, target_sequences, holder_sequences)
+        
+        ## CREATE THE KAF/NAF OPINIONS
+        add_opinions(final_triples,kaf_naf_obj)
+        
+        if self.polarity:
+            my_polarity_classifier = self.get_polarity_classifier(kaf_naf_obj.get_language())
+            my_polarity_classifier.classify_kaf_naf_object(kaf_naf_obj)
+            
+            
+    def get_opinion_triples(self, kaf_naf_obj, expression_sequences, target_sequences, holder_sequences):
+        '''
+        Links the expressions, targets and holders detected for one KAF/NAF object, returns the list of
+        (expression, target, holder) entities
+        '''
+        log = self.log
+        
+        #################################################
+        ########  EXPRESSION/TARGET  PART            ####
+        ################################################# 
+        expression_entities = create_entities(expression_sequences, 'exp', 'DSE')
+        target_entities = create_entities(target_sequences, 'tar', 'TARGET')
+         
+        #We set target fixed and one expression is selected for every target   
+        #matched_exp_tar = entity_matcher.match_entities(expression_entities,target_entities)
+        
+        #We set expressions fixed
+        matched_tar_exp = entity_matcher.match_entities(target_entities, expression_entities, kaf_naf_obj)
+        
+        holder_entities = create_entities(holder_sequences, 'hol', 'HOLDER')
+        matched_hol_exp = entity_matcher.match_entities(holder_entities, expression_entities, kaf_naf_obj)
+        
+        
+        ###CREATE THE FINAL TRIPLES
+        #The first target and holder matched with every expression
+        target_for_expression_id = {}
+        for this_target, this_exp in matched_tar_exp:
+            target_for_expression_id.setdefault(this_exp.id, this_target)
+        holder_for_expression_id = {}
+        for this_holder, this_exp in matched_hol_exp:
+            holder_for_expression_id.setdefault(this_exp.id, this_holder)
+            
+        final_triples = []
+        for expression in expression_entities:
+            selected_target = target_for_expression_id.get(expression.id)
+            selected_holder = holder_for_expression_id.get(expression.id)
+            final_triples.append((expression, selected_target, selected_holder))
+            
+            
+        if log:
+            print('FOUND ENTITIES', kaf_naf_obj.filename, file=sys.stderr)
+            print('  Expressions', file=sys.stderr)
+            for list_ids, list_words in expression_sequences:
+                print('    ==>', ' '.join(list_words), str(list_ids), file=sys.stderr)
+            print('  Targets', file=sys.stderr)
+            for list_ids, list_words in target_sequences:
+                print('    ==>', ' '.join(list_words), str(list_ids), file=sys.stderr)
+            print('  Holders', file=sys.stderr)
+            for list_ids, list_words in holder_sequences:
+                print('    ==>', ' '.join(list_words), str(list_ids), file=sys.stderr)
+            print(file=sys.stderr)
+            print(file=sys.stderr)
+            print('  Complete opinions', file=sys.stderr)
+            for e, t, h in final_triples:
+                print('    ==>', file=sys.stderr)
+                print('      Expression:', e.to_line(), file=sys.stderr)
+                if t is None:
+                    print('      Target: NONE', file=sys.stderr)
+                else:
+                    print('      Target:', t.to_line(), file=sys.stderr)
                 
-        new_opinion = Copinion(type=kaf_naf_obj.get_type())
-        new_opinion.set_id(new_id)
-        
-        #Create the holder
-        if len(H_term_ids) != 0:
-            span_hol = Cspan()
-            span_hol.create_from_ids(H_term_ids)
-            my_hol = Cholder()
-            my_hol.set_span(span_hol)
-            hol_text = ' '.join(H.word_list)
-            my_hol.set_comment(hol_text)  
-            new_opinion.set_holder(my_hol)  
+                if h is None:
+                    print('      Holder: NONE', file=sys.stderr)
+                else:
+                    print('      Holder:', h.to_line(), file=sys.stderr)
+        
+        return final_triples
+            
             
-        #Creating target
-        if len(T_term_ids) != 0:
-            span_tar = Cspan()
-            span_tar.create_from_ids(T_term_ids)
-            my_tar = opinion_data.Ctarget()
-            my_tar.set_span(span_tar)
-            tar_text = ' '.join(T.word_list)
-            my_tar.set_comment(tar_text)
-            new_opinion.set_target(my_tar)
-            #########################    
+class OpinionTaggerSet:
+    '''
+    Keeps one OpinionTagger for every model folder, created the first time that a KAF/NAF object needs it
+    (with the domain option the model folder depends on the language of the file)
+    '''
+    def __init__(self, domain, path_to_folder, polarity=False, keep_opinions=False, log=False, crf_backend='crf_test', crf_workers=1, fast_output=False, window=None):
+        self.domain = domain
+        self.path_to_folder = path_to_folder
+        self.polarity = polarity
+        self.keep_opinions = keep_opinions
+        self.log = log
+        self.crf_backend = crf_backend
+        self.crf_workers = crf_workers
+        self.fast_output = fast_output
+        self.window = window
+        self.tagger_for_folder = {}
+        self.lock = threading.Lock()
+        
+    def get_tagger(self, kaf_naf_obj):
+        model_folder = get_model_folder(self.domain, self.path_to_folder, kaf_naf_obj.get_language())
+        with self.lock:
+            if model_folder not in self.tagger_for_folder:
+                if not os.path.exists(model_folder):
+                    raise IOError('There are no models in the folder %s' % model_folder)
+                if self.log:
+                    print('Loading the models from %s' % model_folder, file=sys.stderr)
+                self.tagger_for_folder[model_folder] = OpinionTagger(model_folder, polarity=self.polarity, keep_opinions=self.keep_opinions, log=self.log, crf_backend=self.crf_backend, crf_workers=self.crf_workers)
+            return self.tagger_for_folder[model_folder]
+        
+        
+def load_list_of_files(path):
+    '''
+    Returns the list of KAF/NAF files in a folder, or in a file with one path per line
+    '''
+    files = []
+    if os.path.isdir(path):
+        for this_file in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path,this_file)):
+                files.append(os.path.join(path,this_file))
+    else:
+        fd = open(path,'r')
+        for line in fd:
+            line = line.strip()
+            if line != '':
+                files.append(line)
+        fd.close()
+    return files
+
+
+def get_output_filename(filename, output_folder):
+    return os.path.join(output_folder, os.path.basename(filename))
+
 
-        ##Creating expression
-        span_exp = Cspan()
-        span_exp.create_from_ids(E_term_ids)
-        my_exp = Cexpression()
-        my_exp.set_span(span_exp)
-        my_exp.set_polarity('DSE')
-        #if include_polarity_strength:
-        my_exp.set_strength("1")
-        exp_text = ' '.join(E.word_list)
-        my_exp.set_comment(exp_text)
-        new_opinion.set_expression(my_exp)
+def check_output_filenames(files):
+    '''
+    The tagged files are written to the output folder with their own name, so two files of the list with the same name
+    (in different folders) would overwrite each other. Raises ValueError if there are any
+    '''
+    files_for_name = {}
+    for filename in files:
+        files_for_name.setdefault(os.path.basename(filename), []).append(filename)
+    duplicated = [these_files for name, these_files in sorted(files_for_name.items()) if len(these_files) > 1]
+    if len(duplicated) != 0:
+        raise ValueError('Several files of the list have the same name and would be written to the same output file: %s' % '; '.join(', '.join(these_files) for these_files in duplicated))
+
+
+def tag_block(files, tagger_set):
+    '''
+    Tags a block of KAF/NAF files with one call to CRF per step and returns the list of (filename, KAF/NAF object)
+    '''
+    list_filename_obj = []
+    for num_file, filename in enumerate(files):
+        try:
+            kaf_naf_obj = read_kaf_naf(filename, keep_input=tagger_set.fast_output)
+        except Exception as e:
+            print('Error reading the file %s: %s' % (filename, str(e)), file=sys.stderr)
+            continue
+        #The identifier of the file is the first column of the CRF files, which are split by spaces, and the sequences
+        #are given back to every file by it: the position in the block makes it unique ("a b.naf" and "a_b.naf")
+        kaf_naf_obj.filename = '%d_%s' % (num_file, os.path.basename(filename).replace(' ','_').replace('\t','_').replace('#','_'))
+        list_filename_obj.append((filename, kaf_naf_obj))
         
-        kaf_naf_obj.add_opinion(new_opinion)
-        #########################
+    #Objects grouped by model folder (language)
+    taggers = []
+    objects_for_tagger = {}
+    for filename, kaf_naf_obj in list_filename_obj:
+        tagger = tagger_set.get_tagger(kaf_naf_obj)
+        if tagger not in objects_for_tagger:
+            taggers.append(tagger)
+            objects_for_tagger[tagger] = []
+        objects_for_tagger[tagger].append(kaf_naf_obj)
+    
+    for tagger in taggers:
+        tagger.tag_list(objects_for_tagger[tagger])
+    return list_filename_obj
+
+
+def tag_file_in_windows(filename, output, tagger_set, num_sentences, crf_filename=None):
+    '''
+    Tags a KAF/NAF file reading it in windows of num_sentences sentences (see OpinionTagger.tag_in_windows) and writes
+    the tagged document to output (filename, binary stream or the standard output if None) by splicing the opinions into
+    the file. The document is tagged as a whole if it can not be spliced or its layers are not in the order of the text
+    '''
+    kaf_naf_obj = read_header_and_opinions(filename)
+    if crf_filename is None:
+        crf_filename = filename.replace(' ','_').replace('\t','_')
+    kaf_naf_obj.filename = crf_filename
+    tagger = tagger_set.get_tagger(kaf_naf_obj)
+    
+    fd = open(filename, 'rb')
+    try:
+        data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        #Empty file
+        data = b''
+    opinions_fd = None
+    window_reader = NafWindowReader(filename, num_sentences)
+    if find_positions(data, kaf_naf_obj) is not None:
+        opinions_fd = tagger.tag_in_windows(kaf_naf_obj, window_reader)
+        if not window_reader.in_order:
+            print('The layers of %s are not in the order of the text, it is tagged as a whole' % crf_filename, file=sys.stderr)
+            
+    if isinstance(output, str):
+        output_fd = open(output, 'wb')
+    elif output is None:
+        output_fd = getattr(sys.stdout, 'buffer', sys.stdout)
+    else:
+        output_fd = output
+    if not window_reader.in_order or not write_spliced(data, kaf_naf_obj, output_fd, tagger.keep_opinions, opinions_fd):
+        kaf_naf_obj = KafNafParser(filename)
+        kaf_naf_obj.filename = crf_filename
+        tagger.tag_list([kaf_naf_obj])
+        kaf_naf_obj.dump(output_fd)
+    if isinstance(output, str):
+        output_fd.close()
+    if opinions_fd is not None:
+        opinions_fd.close()
+    if isinstance(data, mmap.mmap):
+        data.close()
+    fd.close()
+
+
+def tag_file_in_windows_to_folder(filename, output_folder, tagger_set):
+    '''
+    Tags the file in windows and writes it to the output folder with its own name. Returns the output filename, or None
+    if the file could not be tagged
+    '''
+    output_filename = get_output_filename(filename, output_folder)
+    try:
+        tag_file_in_windows(filename, output_filename, tagger_set, tagger_set.window)
+    except Exception as e:
+        print('Error tagging the file %s: %s' % (filename, str(e)), file=sys.stderr)
+        return None
+    return output_filename
+
+
+def tag_batch(files, output_folder, tagger_set, batch_size=100, log=False):
+    '''
+    Tags the list of KAF/NAF files in blocks of batch_size files. Every block is tagged with one call to CRF
+    per step, and every file is written to the output folder with its own name (ValueError if two files have the
+    same name, see check_output_filenames)
+    '''
+    check_output_filenames(files)
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+    
+    if tagger_set.window is not None:
+        #Every file is tagged by itself, in windows of sentences
+        for filename in files:
+            output_filename = tag_file_in_windows_to_folder(filename, output_folder, tagger_set)
+            if log and output_filename is not None:
+                print('Tagged %s --> %s' % (filename, output_filename), file=sys.stderr)
+        return
         
+    for num_first in range(0, len(files), batch_size):
+        for filename, kaf_naf_obj in tag_block(files[num_first:num_first+batch_size], tagger_set):
+            output_filename = get_output_filename(filename, output_folder)
+            dump_tagged(kaf_naf_obj, output_filename, tagger_set.fast_output, tagger_set.keep_opinions)
+            if log:
+                print('Tagged %s --> %s' % (filename, output_filename), file=sys.stderr)
+    
+    
+#The tagger set of every worker process when tagging in parallel, the models are loaded once per process
+worker_tagger_set = None
+
+def init_worker(domain, path_to_folder, polarity, keep_opinions, log, crf_backend, crf_workers, fast_output, window):
+    global worker_tagger_set
+    worker_tagger_set = OpinionTaggerSet(domain, path_to_folder, polarity=polarity, keep_opinions=keep_opinions, log=log, crf_backend=crf_backend, crf_workers=crf_workers, fast_output=fast_output, window=window)
+    
+    
+def tag_block_in_worker(files):
+    '''
+    Tags a block of files in a worker process and returns the list of (filename, tagged KAF/NAF as bytes)
+    '''
+    list_filename_output = []
+    for filename, kaf_naf_obj in tag_block(files, worker_tagger_set):
+        output = io.BytesIO()
+        dump_tagged(kaf_naf_obj, output, worker_tagger_set.fast_output, worker_tagger_set.keep_opinions)
+        list_filename_output.append((filename, output.getvalue()))
+    return list_filename_output
+
+
+def tag_file_in_windows_in_worker(filename_and_folder):
+    '''
+    Tags one file in windows in a worker process, the file is written by the worker (the output is not kept in memory)
+    '''
+    filename, output_folder = filename_and_folder
+    return tag_file_in_windows_to_folder(filename, output_folder, worker_tagger_set)
+
+
+def tag_batch_parallel(files, output_folder, num_processes, worker_arguments, batch_size=100, unordered=False, log=False, window=None):
+    '''
+    Tags the list of KAF/NAF files in a pool of num_processes processes. The blocks of files are written
+    in the same order of the input, or as soon as they are tagged if unordered is set. If the files are
+    tagged in windows of sentences (window), every file is tagged and written by a worker process. ValueError if
+    two files have the same name (see check_output_filenames)
+    '''
+    check_output_filenames(files)
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+    
+    if window is not None:
+        pool = multiprocessing.Pool(num_processes, initializer=init_worker, initargs=worker_arguments)
+        for filename, output_filename in zip(files, pool.imap(tag_file_in_windows_in_worker, [(filename, output_folder) for filename in files])):
+            if log and output_filename is not None:
+                print('Tagged %s --> %s' % (filename, output_filename), file=sys.stderr)
+        pool.close()
+        pool.join()
+        return
+    
+    #Smaller blocks if there are not enough files to keep all the processes busy
+    batch_size = max(1, min(batch_size, int(math.ceil(len(files)*1.0/num_processes))))
+    blocks = [files[num_first:num_first+batch_size] for num_first in range(0, len(files), batch_size)]
+    
+    pool = multiprocessing.Pool(num_processes, initializer=init_worker, initargs=worker_arguments)
+    if unordered:
+        results = pool.imap_unordered(tag_block_in_worker, blocks)
+    else:
+        results = pool.imap(tag_block_in_worker, blocks)
+        
+    for list_filename_output in results:
+        for filename, output in list_filename_output:
+            output_filename = get_output_filename(filename, output_folder)
+            fd = open(output_filename,'wb')
+            fd.write(output)
+            fd.close()
+            if log:
+                print('Tagged %s --> %s' % (filename, output_filename), file=sys.stderr)
+    pool.close()
+    pool.join()
+    
+    
+class TaggingRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Tags the KAF/NAF document sent in the body of a POST request and answers with the tagged document
+    '''
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        tagger_set = self.server.tagger_set
+        #A document that can not be read is an error of the request, the rest are errors of the server
+        try:
+            kaf_naf_obj = read_kaf_naf(self.rfile.read(length), keep_input=tagger_set.fast_output)
+        except Exception as e:
+            self.send_error(400, 'The document can not be read: %s' % str(e))
+            return
+        try:
+            tagger = tagger_set.get_tagger(kaf_naf_obj)
+            tagger.tag(kaf_naf_obj)
+            output = io.BytesIO()
+            dump_tagged(kaf_naf_obj, output, tagger_set.fast_output, tagger_set.keep_opinions)
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            self.send_error(500, str(e))
+            return
         
+        response = output.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml; charset=UTF-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
         
+    def log_message(self, format, *args):
+        if self.server.log:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
         
 
+class TaggingServer(ThreadingHTTPServer):
+    '''
+    HTTP server that keeps the taggers (models, parameters and lexicons) in memory
+    '''
+    daemon_threads = True
+    
+    def __init__(self, address, tagger_set, log=False):
+        ThreadingHTTPServer.__init__(self, address, TaggingRequestHandler)
+        self.tagger_set = tagger_set
+        self.log = log
+        
         
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Detects opinions in KAF/NAF files', epilog='Example of use:  cat example.naf | %(prog)s -d hotel')
@@ -123,6 +819,16 @@ if __name__ == '__main__':
     parser.add_argument('-log',dest='log',action='store_true',help='Show log information')
     parser.add_argument('-polarity', dest='polarity', action='store_true', help='Run the polarity (positive/negative) classifier too')
     parser.add_argument('-keep-opinions',dest='keep_opinions',action='store_true',help='Keep the opinions from the input (by default will be deleted)')
+    parser.add_argument('-server', dest='server_port', type=int, help='Run as a server on localhost:PORT that tags the KAF/NAF documents sent by POST, keeping the models in memory')
+    parser.add_argument('-batch', dest='batch', help='Tag all the KAF/NAF files in a folder or in a file with one path per line, instead of the input stream')
+    parser.add_argument('-o', dest='output_folder', help='Folder to store the tagged files in batch mode')
+    parser.add_argument('-batch-size', dest='batch_size', type=int, default=100, help='Number of files tagged with every call to CRF in batch mode (default 100)')
+    parser.add_argument('-j', dest='num_processes', type=int, default=1, help='Number of processes for tagging in batch mode (default 1)')
+    parser.add_argument('-unordered', dest='unordered', action='store_true', help='With -j, write the files as soon as they are tagged instead of in the input order')
+    parser.add_argument('-crf-backend', dest='crf_backend', choices=['crf_test','python','coprocess'], default='crf_test', help='Tag with calls to crf_test (default), with the CRF decoder in memory (python), which needs the text models created with crf_learn -t, or with crf_test processes kept running (coprocess)')
+    parser.add_argument('-crf-workers', dest='crf_workers', type=int, default=1, help='Number of crf_test processes per model with the coprocess backend (default 1)')
+    parser.add_argument('-fast-output', dest='fast_output', action='store_true', help='Write the output by inserting the opinions into the input document instead of serialising the whole document again')
+    parser.add_argument('-window', dest='window', type=int, help='Read and tag the documents in windows of WINDOW sentences, so the memory used does not depend on the size of the documents (not for the server)')
     
     if len(sys.argv) == 1:
         #To print by default the help, in case 
@@ -130,6 +836,40 @@ if __name__ == '__main__':
  
     args = parser.parse_args(sys.argv[1:])
     
+    if args.log:
+        print('Path to CRF TEST: %s' % PATH_TO_CRF_TEST, file=sys.stderr)
+        
+    if args.server_port is not None or args.batch is not None:
+        tagger_set = OpinionTaggerSet(args.domain, args.path_to_folder, polarity=args.polarity, keep_opinions=args.keep_opinions, log=args.log, crf_backend=args.crf_backend, crf_workers=args.crf_workers, fast_output=args.fast_output, window=args.window)
+        
+    if args.batch is not None:
+        if args.output_folder is None:
+            print('The output folder (-o) is required for tagging a batch of files', file=sys.stderr)
+            sys.exit(-1)
+        files = load_list_of_files(args.batch)
+        try:
+            check_output_filenames(files)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(-1)
+        if args.log:
+            print('Tagging %d files in blocks of %d files with %d processes' % (len(files), args.batch_size, args.num_processes), file=sys.stderr)
+        if args.num_processes > 1:
+            worker_arguments = (args.domain, args.path_to_folder, args.polarity, args.keep_opinions, args.log, args.crf_backend, args.crf_workers, args.fast_output, args.window)
+            tag_batch_parallel(files, args.output_folder, args.num_processes, worker_arguments, batch_size=args.batch_size, unordered=args.unordered, log=args.log, window=args.window)
+        else:
+            tag_batch(files, args.output_folder, tagger_set, batch_size=args.batch_size, log=args.log)
+        sys.exit(0)
+        
+    if args.server_port is not None:
+        server = TaggingServer(('localhost', args.server_port), tagger_set, log=args.log)
+        print('Tagging server listening on localhost:%d' % args.server_port, file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        sys.exit(0)
     
     if sys.stdin.isatty():
         print('Input stream required', file=sys.stderr)
@@ -137,28 +877,25 @@ if __name__ == '__main__':
         parser.print_help(sys.stderr)
         sys.exit(-1)
     
-    if args.log:
-        print('Path to CRF TEST: %s' % PATH_TO_CRF_TEST, file=sys.stderr)                                                  
-    kaf_naf_obj = KafNafParser(sys.stdin)
-    
-    if not args.keep_opinions:
-        kaf_naf_obj.remove_opinion_layer()
+    if args.window is not None:
+        #The input stream is stored in a temporary file, it's read in windows
+        input_fd = tempfile.NamedTemporaryFile(delete=False)
+        shutil.copyfileobj(getattr(sys.stdin, 'buffer', sys.stdin), input_fd)
+        input_fd.close()
+        tagger_set = OpinionTaggerSet(args.domain, args.path_to_folder, polarity=args.polarity, keep_opinions=args.keep_opinions, log=args.log, crf_backend=args.crf_backend, crf_workers=args.crf_workers, window=args.window)
+        try:
+            tag_file_in_windows(input_fd.name, None, tagger_set, args.window, crf_filename='stdin')
+        finally:
+            os.remove(input_fd.name)
+        sys.exit(0)
     
-    # We need to set this manually because the identifier for CRF will be the concatenation
-    # of the filename and the token id, and it's a <File> object if we create the kaf_naf_obj
-    # from a open stream
-    kaf_naf_obj.filename = 'stdin'
+    kaf_naf_obj = read_kaf_naf(sys.stdin, keep_input=args.fast_output)
     
-   
     language = kaf_naf_obj.get_language()
     if args.log:
         print('Language in the file: %s' % language, file=sys.stderr)
         
-    model_folder=None
-    if args.domain:
-        model_folder='models/models_%s_%s' % (args.domain,language)
-    else:
-        model_folder=args.path_to_folder
+    model_folder = get_model_folder(args.domain, args.path_to_folder, language)
     
     if args.log:
         print('Model folder: %s' % model_folder, file=sys.stderr)
@@ -168,212 +905,7 @@ if __name__ == '__main__':
         print('    Model folder should be: %s' % model_folder, file=sys.stderr)
         sys.exit(-1)
     
-    #########################################
-    ########  BEGIN  EXPRESSION PART     ####
-    #########################################
-    
-    # 1) CALL TO THE FEATURE EXTRACTOR FOR EXPRESSIONS
-    #feature_file = expression_feature_extractor(inputfile,'tag', model_folder)
-    feature_file = expression_feature_extractor(kaf_naf_obj,'tag', model_folder, log=args.log)
-
-    
-    # 2) CALL TO THE MODEL
-    expression_tagger_cmd = []
-    expression_tagger_cmd.append(PATH_TO_CRF_TEST)
-    expression_tagger_cmd.append('-m')
-    expression_tagger_cmd.append(model_folder+'/model.expression')
-    expression_tagger_cmd.append(feature_file)
-    
-    expression_tagger = Popen(' '.join(expression_tagger_cmd), shell=True, stdout=PIPE, stderr=PIPE)
-    expression_out, expression_error = expression_tagger.communicate()
-    
-    #This variable stores a list of lines with the CRF output 
-    expression_out_lines = expression_out.splitlines()
-
-    ######
-    
-      
-    # The expression sequences detected:
-    #[(['example_en.naf#w4'], ['nice']), 
-    # (['example_en.naf#w9', 'example_en.naf#w10', 'example_en.naf#w11'], ['the', 'best', '!!'])]
-    expression_sequences = extract_sequences(expression_out_lines,'DSE')
-    #########################################
-    ########  END  EXPRESSION PART     ####
-    #########################################
- 
- 
-    #########################################
-    ########  BEGIN TARGET PART          ####
-    #########################################
-    
-    
-    target_features_file = target_feature_extractor(kaf_naf_obj,'tag',model_folder,detected_dse=expression_sequences, log=args.log)
-
-
-    target_tagger_cmd = []
-    target_tagger_cmd.append(PATH_TO_CRF_TEST)
-    target_tagger_cmd.append('-m')
-    target_tagger_cmd.append(model_folder+'/model.target')
-    target_tagger_cmd.append(target_features_file)
-                    
-    target_tagger = Popen(' '.join(target_tagger_cmd), shell=True, stdout=PIPE, stderr=PIPE)
-    target_out, target_error = target_tagger.communicate()
-                            
-    #This variable stores a list of lines with the CRF output 
-    target_out_lines = target_out.splitlines()
-    target_sequences = extract_sequences(target_out_lines,'TARGET')
-    
-    #########################################
-    ########  END TARGET PART          ####
-    #########################################
-
-    
-    #########################################
-    ########  BEGIN HOLDER PART          ####
-    #########################################
-    
-    holder_features_file = holder_feature_extractor(kaf_naf_obj,'tag', model_folder, detected_dse=expression_sequences, log=args.log)
-    
-    holder_tagger_cmd = []
-    holder_tagger_cmd.append(PATH_TO_CRF_TEST)
-    holder_tagger_cmd.append('-m')
-    holder_tagger_cmd.append(model_folder+'/model.holder')
-    holder_tagger_cmd.append(holder_features_file)
-                    
-    holder_tagger = Popen(' '.join(holder_tagger_cmd), shell=True, stdout=PIPE, stderr=PIPE)
-    holder_out, holder_error = holder_tagger.communicate()
-                            
-    #This variable stores a list of lines with the CRF output 
-    holder_out_lines = holder_out.splitlines()
-
-    holder_sequences = extract_sequences(holder_out_lines,'HOLDER')
-        
-    #########################################
-    ########  END HOLDER PART            ####
-    #########################################
-    
-    
-    #################################################
-    ########  EXPRESSION/TARGET  PART            ####
-    ################################################# 
-    expression_entities = []
-    num_exp = 0
-    for list_ids, list_words in expression_sequences:
-        exp_entity = entity_matcher.Centity()
-        #ids contain filename
-        ids_with_no_filename = []
-        for this_id in list_ids:
-            p = this_id.rfind('#')
-            ids_with_no_filename.append(this_id[p+1:])
-        filename = this_id[:p]
-
-        exp_entity.create('exp#%d' % num_exp, 'DSE', filename, ids_with_no_filename, list_words)
-        expression_entities.append(exp_entity)
-        num_exp+=1
-    
-
-    target_entities = []
-    num_tar = 0
-    for list_ids, list_words in target_sequences:
-        tar_entity = entity_matcher.Centity()
-        #ids contain filename
-        ids_with_no_filename = []
-        for this_id in list_ids:
-            p = this_id.rfind('#')
-            ids_with_no_filename.append(this_id[p+1:])
-        filename = this_id[:p]
-
-        tar_entity.create('tar#%d' % num_tar, 'TARGET', filename, ids_with_no_filename, list_words)
-        target_entities.append(tar_entity)
-        num_tar+=1
-     
-    #We set target fixed and one expression is selected for every target   
-    #matched_exp_tar = entity_matcher.match_entities(expression_entities,target_entities)
-    
-    #We set expressions fixed
-    matched_tar_exp = entity_matcher.match_entities(target_entities, expression_entities, kaf_naf_obj)
-    
-    holder_entities = []
-    num_hol = 0
-    for list_ids, list_words in holder_sequences:
-        hol_entity = entity_matcher.Centity()
-        #ids contain filename
-        ids_with_no_filename = []
-        for this_id in list_ids:
-            p = this_id.rfind('#')
-            ids_with_no_filename.append(this_id[p+1:])
-        filename = this_id[:p]
-
-        hol_entity.create('hol#%d' % num_tar, 'HOLDER', filename, ids_with_no_filename, list_words)
-        holder_entities.append(hol_entity)
-        num_hol+=1
-       
-    matched_hol_exp = entity_matcher.match_entities(holder_entities, expression_entities, kaf_naf_obj)
-    
-    
-    
-    ###CREATE THE FINAL TRIPLES
-    final_triples = []
-    for expression in expression_entities:
-        selected_target = None
-        selected_holder = None
-        for this_target, this_exp in matched_tar_exp:
-            if expression.id == this_exp.id:
-                selected_target = this_target
-                break
-        
-        for this_holder, this_exp in matched_hol_exp:
-            if expression.id == this_exp.id:
-                selected_holder = this_holder
-                break
-            
-        final_triples.append((expression, selected_target, selected_holder))
-        
-        
-    if args.log:
-        print('FOUND ENTITIES', file=sys.stderr)
-        print('  Expressions', file=sys.stderr)
-        for list_ids, list_words in expression_sequences:
-            print('    ==>', ' '.join(list_words), str(list_ids), file=sys.stderr)
-        print('  Targets', file=sys.stderr)
-        for list_ids, list_words in target_sequences:
-            print('    ==>', ' '.join(list_words), str(list_ids), file=sys.stderr)
-        print('  Holders', file=sys.stderr)
-        for list_ids, list_words in holder_sequences:
-            print('    ==>', ' '.join(list_words), str(list_ids), file=sys.stderr)
-        print(file=sys.stderr)
-        print(file=sys.stderr)
-        print('  Complete opinions', file=sys.stderr)
-        for e, t, h in final_triples:
-            print('    ==>', file=sys.stderr)
-            print('      Expression:', e.to_line(), file=sys.stderr)
-            if t is None:
-                print('      Target: NONE', file=sys.stderr)
-            else:
-                print('      Target:', t.to_line(), file=sys.stderr)
-            
-            if h is None:
-                print('      Holder: NONE', file=sys.stderr)
-            else:
-                print('      Holder:', h.to_line(), file=sys.stderr)
-            
-             
-    
-    #Remove feature_file feature_file
-    #Remove also the target file  target_features_file
-    
-    os.remove(feature_file)
-    os.remove(target_features_file)
-    os.remove(holder_features_file)
-    
-    
-    ## CREATE THE KAF/NAF OPINIONS
-    add_opinions(final_triples,kaf_naf_obj)
-    
-    if args.polarity:
-        my_polarity_classifier = PolarityClassifier(language)
-        my_polarity_classifier.load_models(os.path.join(__here__,'polarity_models',language))
-        my_polarity_classifier.classify_kaf_naf_object(kaf_naf_obj)
-    
-    kaf_naf_obj.dump()
+    tagger = OpinionTagger(model_folder, polarity=args.polarity, keep_opinions=args.keep_opinions, log=args.log, crf_backend=args.crf_backend, crf_workers=args.crf_workers)
+    tagger.tag(kaf_naf_obj)
     
+    dump_tagged(kaf_naf_obj, fast_output=args.fast_output, keep_opinions=args.keep_opinions)
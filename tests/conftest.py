@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+from lxml import etree
+
+#The modules of the opinion miner are scripts in the root folder of the repository
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_FOLDER not in sys.path:
+    sys.path.insert(0, ROOT_FOLDER)
+
+from lexicon_store import COMPILED_FOLDER_VARIABLE
+
+
+@pytest.fixture(autouse=True, scope='session')
+def compiled_lexicons(tmp_path_factory):
+    #The lexicons compiled by the tests are not written to the cache folder of the user
+    folder = str(tmp_path_factory.mktemp('compiled_lexicons'))
+    previous_folder = os.environ.get(COMPILED_FOLDER_VARIABLE)
+    os.environ[COMPILED_FOLDER_VARIABLE] = folder
+    yield folder
+    if previous_folder is None:
+        del os.environ[COMPILED_FOLDER_VARIABLE]
+    else:
+        os.environ[COMPILED_FOLDER_VARIABLE] = previous_folder
+
+
+#A tiny model (expression, target and holder, with the text models of crf_learn -t) and two documents, one of them
+#with opinions
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+@pytest.fixture
+def model_folder():
+    return os.path.join(FIXTURES_FOLDER, 'model')
+
+
+@pytest.fixture
+def document():
+    return os.path.join(FIXTURES_FOLDER, 'document.naf')
+
+
+@pytest.fixture
+def document_with_opinions():
+    return os.path.join(FIXTURES_FOLDER, 'document_with_opinions.naf')
+
+
+def canonical_xml(data):
+    '''
+    Canonical form of a KAF/NAF document, without the blank text and the timestamps of the linguistic processors
+    '''
+    tree = etree.fromstring(data, etree.XMLParser(remove_blank_text=True))
+    for lp in tree.iter('lp'):
+        for attribute in ('timestamp', 'beginTimestamp', 'endTimestamp', 'hostname'):
+            lp.attrib.pop(attribute, None)
+    return etree.tostring(tree, method='c14n')
+
+
+@pytest.fixture
+def training_files():
+    #The document with opinions and three variations of it, with other words and opinions
+    corpus_folder = os.path.join(FIXTURES_FOLDER, 'corpus')
+    return [os.path.join(FIXTURES_FOLDER, 'document_with_opinions.naf')] + [os.path.join(corpus_folder, filename) for filename in sorted(os.listdir(corpus_folder))]
+
+
+def write_file_list(folder, files):
+    '''
+    Input of the training and testing (-i): a file with the list of KAF/NAF files
+    '''
+    list_filename = os.path.join(str(folder), 'files.list')
+    with open(list_filename, 'w') as fd:
+        for filename in files:
+            fd.write(filename+'\n')
+    return list_filename
+
+
+@pytest.fixture
+def file_list():
+    return write_file_list
+
+
+@pytest.fixture
+def canonical():
+    return canonical_xml
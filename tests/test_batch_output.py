@@ -0,0 +1,51 @@
+import io
+import os
+import shutil
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+from tag_file import OpinionTaggerSet, check_output_filenames, tag_batch, tag_batch_parallel
+
+
+def test_different_names_are_accepted():
+    check_output_filenames(['a/doc1.naf', 'b/doc2.naf', 'doc3.naf'])
+
+
+def test_same_name_in_different_folders_is_rejected():
+    with pytest.raises(ValueError) as error:
+        check_output_filenames(['a/doc.naf', 'b/other.naf', 'b/doc.naf'])
+    assert 'a/doc.naf' in str(error.value) and 'b/doc.naf' in str(error.value)
+    assert 'other.naf' not in str(error.value)
+
+
+def test_batch_stops_before_writing(tmp_path):
+    output_folder = tmp_path / 'output'
+    with pytest.raises(ValueError):
+        tag_batch(['a/doc.naf', 'b/doc.naf'], str(output_folder), None)
+    with pytest.raises(ValueError):
+        tag_batch_parallel(['a/doc.naf', 'b/doc.naf'], str(output_folder), 2, None)
+    assert not output_folder.exists()
+
+
+def tag_document(tagger_set, filename):
+    kaf_naf_obj = KafNafParser(filename)
+    kaf_naf_obj.filename = 'stdin'
+    tagger_set.get_tagger(kaf_naf_obj).tag_list([kaf_naf_obj])
+    output = io.BytesIO()
+    kaf_naf_obj.dump(output)
+    return output.getvalue()
+
+
+def test_names_that_differ_in_spaces_keep_their_opinions(tmp_path, model_folder, canonical, document, document_with_opinions):
+    #Both names are "a_b.naf" once the spaces are replaced, they must not share the identifier of the CRF files
+    input_folder = tmp_path / 'input'
+    input_folder.mkdir()
+    files = [str(input_folder / 'a b.naf'), str(input_folder / 'a_b.naf')]
+    shutil.copy(document_with_opinions, files[0])
+    shutil.copy(document, files[1])
+    tagger_set = OpinionTaggerSet(None, model_folder, crf_backend='python')
+    tag_batch(files, str(tmp_path / 'output'), tagger_set)
+    for filename in files:
+        with open(str(tmp_path / 'output' / os.path.basename(filename)), 'rb') as fd:
+            assert canonical(fd.read()) == canonical(tag_document(tagger_set, filename))
@@ -0,0 +1,67 @@
+import io
+import threading
+from concurrent.futures import Future
+
+from KafNafParserPy import KafNafParser
+
+import tag_file
+from tag_file import OpinionTagger
+
+
+class SerialExecutor:
+    '''
+    Executor that runs every call when it is submitted, in the thread that submits it
+    '''
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+def tag_documents(tagger, filenames):
+    list_kaf_naf_obj = []
+    for num_file, filename in enumerate(filenames):
+        list_kaf_naf_obj.append(KafNafParser(filename))
+        list_kaf_naf_obj[-1].filename = 'file%d' % num_file
+    tagger.tag_list(list_kaf_naf_obj)
+    outputs = []
+    for kaf_naf_obj in list_kaf_naf_obj:
+        output = io.BytesIO()
+        kaf_naf_obj.dump(output)
+        outputs.append(output.getvalue())
+    return outputs
+
+
+def test_target_and_holder_steps_run_at_the_same_time(monkeypatch, model_folder, document_with_opinions):
+    #Every step waits for the other one, which only returns if both are running at once
+    barrier = threading.Barrier(2, timeout=10)
+    threads = {}
+    detect_entities = OpinionTagger.detect_entities
+    def waiting_detect_entities(self, feature_extractor, parameters, model_name, *args):
+        threads[model_name] = threading.current_thread()
+        barrier.wait()
+        return detect_entities(self, feature_extractor, parameters, model_name, *args)
+    monkeypatch.setattr(OpinionTagger, 'detect_entities', waiting_detect_entities)
+
+    tag_documents(OpinionTagger(model_folder, crf_backend='python'), [document_with_opinions])
+    assert sorted(threads) == ['holder', 'target']
+    assert threads['target'] is not threads['holder']
+    assert threading.current_thread() not in threads.values()
+
+
+def test_concurrent_steps_tag_as_the_serial_steps(monkeypatch, model_folder, document, document_with_opinions, canonical):
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    concurrent_outputs = tag_documents(tagger, [document_with_opinions, document])
+    monkeypatch.setattr(tag_file, 'ThreadPoolExecutor', SerialExecutor)
+    serial_outputs = tag_documents(tagger, [document_with_opinions, document])
+    assert b'<opinion_target' in concurrent_outputs[0] and b'<opinion_holder' in concurrent_outputs[0]
+    assert [canonical(output) for output in concurrent_outputs] == [canonical(output) for output in serial_outputs]
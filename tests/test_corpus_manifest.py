@@ -0,0 +1,96 @@
+import os
+import shutil
+
+import pytest
+
+import extract_features_target
+
+
+def copy_files(folder, files):
+    os.mkdir(folder)
+    copies = []
+    for filename in files:
+        copies.append(os.path.join(folder, os.path.basename(filename)))
+        shutil.copy(filename, copies[-1])
+    return copies
+
+
+def count_processed(monkeypatch, fail_on=None):
+    '''
+    Records the files processed by the extractor, and fails with the file fail_on
+    '''
+    processed = []
+    process_file_in_worker = extract_features_target.process_file_in_worker
+    def counting_process(filename):
+        if filename == fail_on:
+            raise RuntimeError('Extraction failed')
+        processed.append(filename)
+        return process_file_in_worker(filename)
+    monkeypatch.setattr(extract_features_target, 'process_file_in_worker', counting_process)
+    return processed
+
+
+def train(list_filename, folder, overall_parameters=None):
+    if not os.path.isdir(folder):
+        os.mkdir(folder)
+    return extract_features_target.main(list_filename, 'train', folder, overall_parameters or {})
+
+
+def read(filename):
+    with open(filename, 'rb') as fd:
+        return fd.read()
+
+
+def test_only_new_and_modified_files_are_processed(monkeypatch, tmp_path, training_files, file_list):
+    files = copy_files(str(tmp_path / 'corpus'), training_files)
+    folder = str(tmp_path / 'model')
+    train(file_list(tmp_path, files[:3]), folder)
+
+    #One file modified, one removed and one added
+    shutil.copy(training_files[3], files[1])
+    new_files = [files[0], files[1], files[3]]
+    processed = count_processed(monkeypatch)
+    training_filename = train(file_list(tmp_path, new_files), folder)
+    assert processed == [files[1], files[3]]
+    with open(os.path.join(folder, extract_features_target.MANIFEST_FILENAME)) as fd:
+        assert [line.split('\t')[0] for line in fd][1:] == new_files
+
+    #Same training file as the one created from scratch
+    assert training_filename == os.path.join(folder, extract_features_target.TRAINING_FILENAME)
+    scratch_filename = train(file_list(tmp_path, new_files), str(tmp_path / 'scratch'))
+    assert read(training_filename) == read(scratch_filename)
+    assert not os.path.exists(training_filename+'.new')
+
+
+def test_failed_extraction_keeps_the_previous_training_file(monkeypatch, tmp_path, training_files, file_list):
+    files = copy_files(str(tmp_path / 'corpus'), training_files)
+    list_filename = file_list(tmp_path, files)
+    folder = str(tmp_path / 'model')
+    training_filename = train(list_filename, folder)
+    manifest_filename = os.path.join(folder, extract_features_target.MANIFEST_FILENAME)
+    training_file = read(training_filename)
+    manifest = read(manifest_filename)
+
+    shutil.copy(training_files[0], files[2])
+    count_processed(monkeypatch, fail_on=files[2])
+    with pytest.raises(RuntimeError):
+        train(list_filename, folder)
+    assert read(training_filename) == training_file
+    assert read(manifest_filename) == manifest
+
+    #The next run still reuses the files that did not change
+    monkeypatch.undo()
+    processed = count_processed(monkeypatch)
+    train(list_filename, folder)
+    assert processed == [files[2]]
+
+
+def test_other_parameters_process_all_the_files(monkeypatch, tmp_path, training_files, file_list):
+    list_filename = file_list(tmp_path, training_files)
+    folder = str(tmp_path / 'model')
+    train(list_filename, folder)
+    processed = count_processed(monkeypatch)
+    train(list_filename, folder)
+    assert processed == []
+    train(list_filename, folder, {'some_parameter': 3})
+    assert processed == training_files
@@ -0,0 +1,88 @@
+import io
+import os
+import shutil
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import extract_features_expression
+import extract_features_target
+import extract_features_holder
+from crf_decoder import CRFPPModel, TEXT_MODEL_EXTENSION
+from extract_sequences import extract_sequences
+from path_crf import PATH_TO_CRF_TEST
+from tag_file import OpinionTagger, run_crf_test
+
+
+needs_crf_test = pytest.mark.skipif(not os.path.exists(PATH_TO_CRF_TEST), reason='crf_test is not installed')
+needs_stdbuf = pytest.mark.skipif(shutil.which('stdbuf') is None, reason='stdbuf is not installed')
+
+
+def tag_document(tagger, filename):
+    kaf_naf_obj = KafNafParser(filename)
+    tagger.tag(kaf_naf_obj)
+    output = io.BytesIO()
+    kaf_naf_obj.dump(output)
+    return output.getvalue()
+
+
+def create_feature_file(tagger, model_name, filename):
+    '''
+    Feature file of one step for the document, the targets and holders for the expressions found by the model
+    '''
+    kaf_naf_obj = KafNafParser(filename)
+    kaf_naf_obj.filename = 'stdin'
+    kaf_naf_obj.remove_opinion_layer()
+    expression_file = extract_features_expression.main([kaf_naf_obj], 'tag', tagger.model_folder, overall_parameters=tagger.expression_parameters)
+    if model_name == 'expression':
+        return expression_file
+    expression_lines = run_crf_test(os.path.join(tagger.model_folder, 'model.expression'), expression_file)
+    os.remove(expression_file)
+    expression_sequences = extract_sequences(expression_lines, 'DSE')
+    if model_name == 'target':
+        return extract_features_target.main([kaf_naf_obj], 'tag', tagger.model_folder, overall_parameters=tagger.target_parameters, detected_dse=expression_sequences)
+    return extract_features_holder.main([kaf_naf_obj], 'tag', tagger.model_folder, overall_parameters=tagger.holder_parameters, detected_dse=expression_sequences)
+
+
+@needs_crf_test
+@pytest.mark.parametrize('model_name', ['expression', 'target', 'holder'])
+def test_python_decoder_gives_the_labels_of_crf_test(model_folder, document_with_opinions, model_name):
+    tagger = OpinionTagger(model_folder)
+    feature_file = create_feature_file(tagger, model_name, document_with_opinions)
+    try:
+        crf_test_lines = run_crf_test(os.path.join(model_folder, 'model.'+model_name), feature_file)
+        model = CRFPPModel(os.path.join(model_folder, 'model.'+model_name+TEXT_MODEL_EXTENSION))
+        python_rows = model.tag_file(feature_file)
+    finally:
+        os.remove(feature_file)
+    crf_test_rows = [line.decode('utf-8').split('\t') if line.strip() else [] for line in crf_test_lines]
+    while len(crf_test_rows) != 0 and crf_test_rows[-1] == []:
+        crf_test_rows.pop()
+    while len(python_rows) != 0 and python_rows[-1] == []:
+        python_rows.pop()
+    assert python_rows == crf_test_rows
+    #Not only the outside label
+    assert len(set(row[-1] for row in crf_test_rows if len(row) != 0)) > 1
+
+
+@needs_crf_test
+def test_python_backend_tags_as_crf_test(model_folder, document, canonical):
+    crf_test_output = tag_document(OpinionTagger(model_folder, crf_backend='crf_test'), document)
+    python_output = tag_document(OpinionTagger(model_folder, crf_backend='python'), document)
+    assert b'<opinion ' in crf_test_output
+    assert canonical(python_output) == canonical(crf_test_output)
+
+
+@needs_crf_test
+@needs_stdbuf
+@pytest.mark.parametrize('crf_workers', [1, 2])
+def test_coprocess_backend_tags_as_crf_test(model_folder, document, document_with_opinions, canonical, crf_workers):
+    crf_test_tagger = OpinionTagger(model_folder, crf_backend='crf_test')
+    coprocess_tagger = OpinionTagger(model_folder, crf_backend='coprocess', crf_workers=crf_workers)
+    try:
+        #Several documents with the same processes
+        for filename in [document, document_with_opinions, document]:
+            assert canonical(tag_document(coprocess_tagger, filename)) == canonical(tag_document(crf_test_tagger, filename))
+    finally:
+        for model in coprocess_tagger.crf_model_for_name.values():
+            model.close()
@@ -0,0 +1,52 @@
+import io
+import re
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import extract_features_expression
+import extract_features_target
+import extract_features_holder
+from document_index import get_document_index
+
+
+@pytest.mark.parametrize('fixture_name', ['document', 'document_with_opinions'])
+def test_deepest_phrase_of_the_constituency_extractor(request, fixture_name):
+    naf_obj = KafNafParser(request.getfixturevalue(fixture_name))
+    index = get_document_index(naf_obj)
+    assert index.deepest_phrase_for_term_id is None
+    extractor = KafNafParser(request.getfixturevalue(fixture_name)).get_constituency_extractor()
+    labels = set()
+    for term in naf_obj.get_terms():
+        label = index.get_deepest_phrase(term.get_id())
+        assert label == extractor.get_deepest_phrase_for_termid(term.get_id())[0]
+        labels.add(label)
+    assert len(labels) > 2 and None not in labels
+    assert index.get_deepest_phrase('unknown_term') is None
+
+
+@pytest.mark.parametrize('module', [extract_features_expression, extract_features_target, extract_features_holder])
+def test_chunk_feature_of_every_step(module, document_with_opinions):
+    naf_obj = KafNafParser(document_with_opinions)
+    index = get_document_index(naf_obj)
+    token_ids = [token.get_id() for token in naf_obj.get_tokens()]
+    features = dict((token_id, {}) for token_id in token_ids)
+    assert module.extract_chunks(naf_obj, token_ids, features) == ['deepest_chunk']
+
+    #The labels that were obtained from the constituency extractor for every token
+    extractor = KafNafParser(document_with_opinions).get_constituency_extractor()
+    for token_id in token_ids:
+        assert features[token_id]['deepest_chunk'] == extractor.get_deepest_phrase_for_termid(index.term_id_for_token_id[token_id])[0]
+
+
+def test_document_without_constituents(document_with_opinions):
+    with open(document_with_opinions, 'rb') as fd:
+        data = re.sub(br'<constituency>.*</constituency>', b'', fd.read(), flags=re.S)
+    naf_obj = KafNafParser(io.BytesIO(data))
+    index = get_document_index(naf_obj)
+    term_ids = [term.get_id() for term in naf_obj.get_terms()]
+    assert [index.get_deepest_phrase(term_id) for term_id in term_ids] == [None] * len(term_ids)
+    token_ids = [token.get_id() for token in naf_obj.get_tokens()]
+    features = dict((token_id, {}) for token_id in token_ids)
+    extract_features_expression.extract_chunks(naf_obj, token_ids, features)
+    assert features == dict((token_id, {}) for token_id in token_ids)
@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+from dependency_paths import DependencyPathsToSpan
+from document_index import get_document_index
+
+
+#Dependencies with several heads for some terms, so there are several paths to the root and ties between paths of
+#the same length (head, dependent, function)
+MULTIPLE_HEADS = [('t2', 't1', 'a'), ('t3', 't2', 'b'), ('t3', 't1', 'c'), ('t4', 't3', 'd'), ('t5', 't4', 'e'),
+                  ('t5', 't2', 'f'), ('t6', 't5', 'g'), ('t7', 't6', 'h'), ('t8', 't6', 'i'), ('t8', 't7', 'j'),
+                  ('t9', 't8', 'k'), ('t4', 't9', 'l'), ('t10', 't9', 'm'), ('t10', 't3', 'n')]
+
+
+def create_document(num_terms, dependencies):
+    text = ''.join('<wf id="w%d" sent="1" offset="%d" length="1">x</wf>' % (num, num*2) for num in range(1, num_terms+1))
+    terms = ''.join('<term id="t%d" lemma="x" pos="N"><span><target id="w%d"/></span></term>' % (num, num) for num in range(1, num_terms+1))
+    deps = ''.join('<dep from="%s" to="%s" rfunc="%s"/>' % dependency for dependency in dependencies)
+    naf = '<NAF xml:lang="en" version="v3"><nafHeader/><text>%s</text><terms>%s</terms><deps>%s</deps></NAF>' % (text, terms, deps)
+    return KafNafParser(io.BytesIO(naf.encode('utf-8')))
+
+
+def get_term_ids_per_sentence(kaf_naf_obj):
+    sentence_for_token_id = dict((token.get_id(), token.get_sent()) for token in kaf_naf_obj.get_tokens())
+    term_ids_per_sentence = {}
+    for term in kaf_naf_obj.get_terms():
+        sentence = sentence_for_token_id[term.get_span().get_span_ids()[0]]
+        term_ids_per_sentence.setdefault(sentence, []).append(term.get_id())
+    return [term_ids_per_sentence[sentence] for sentence in sorted(term_ids_per_sentence, key=int)]
+
+
+def get_spans(kaf_naf_obj, term_ids_per_sentence):
+    '''
+    Single terms, consecutive terms of every sentence, the expressions of the document and one span across sentences
+    '''
+    spans = []
+    for term_ids in term_ids_per_sentence:
+        for length in (1, 2, 3):
+            for start in range(len(term_ids)-length+1):
+                spans.append(term_ids[start:start+length])
+    for opinion in kaf_naf_obj.get_opinions():
+        if opinion.get_expression() is not None:
+            spans.append(opinion.get_expression().get_span().get_span_ids())
+    if len(term_ids_per_sentence) > 1:
+        spans.append([term_ids_per_sentence[0][0], term_ids_per_sentence[1][0]])
+    return spans
+
+
+def check_same_paths(kaf_naf_obj):
+    document_index = get_document_index(kaf_naf_obj)
+    extractor = document_index.get_dependency_extractor()
+    term_ids_per_sentence = get_term_ids_per_sentence(kaf_naf_obj)
+    all_term_ids = [term_id for term_ids in term_ids_per_sentence for term_id in term_ids]
+    num_paths = 0
+    for span in get_spans(kaf_naf_obj, term_ids_per_sentence):
+        paths_to_span = DependencyPathsToSpan(document_index, extractor, span)
+        for term_id in all_term_ids:
+            path = paths_to_span.get_shortest_path_to_span(term_id)
+            assert path == extractor.get_shortest_path_spans([term_id], span), (term_id, span)
+            if path:
+                num_paths += 1
+    assert num_paths > 0
+
+
+@pytest.mark.parametrize('document_name', ['document', 'document_with_opinions'])
+def test_same_paths_as_the_dependency_extractor(request, document_name):
+    check_same_paths(KafNafParser(request.getfixturevalue(document_name)))
+
+
+def test_same_paths_with_several_heads():
+    check_same_paths(create_document(10, MULTIPLE_HEADS))
@@ -0,0 +1,82 @@
+import threading
+
+from KafNafParserPy import KafNafParser
+
+import document_index
+from document_index import DocumentIndex, get_document_index
+from tag_file import OpinionTagger
+
+
+def test_index_has_the_tokens_and_terms_of_the_document(document_with_opinions):
+    naf_obj = KafNafParser(document_with_opinions)
+    index = get_document_index(naf_obj)
+    tokens = list(naf_obj.get_tokens())
+    sentence_ids = []
+    for num_token, token in enumerate(tokens):
+        if token.get_sent() not in sentence_ids:
+            sentence_ids.append(token.get_sent())
+        assert index.sentence_for_token_id[token.get_id()] == token.get_sent()
+        assert index.num_token_for_token_id[token.get_id()] == num_token
+    assert index.sentence_ids == sentence_ids
+    assert len(sentence_ids) > 1
+    assert sum(index.token_ids_for_sentence.values(), []) == [token.get_id() for token in tokens]
+
+    for term in naf_obj.get_terms():
+        assert index.token_ids_for_term_id[term.get_id()] == term.get_span().get_span_ids()
+        for token_id in term.get_span().get_span_ids():
+            assert index.term_id_for_token_id[token_id] == term.get_id()
+    assert len(index.term_id_for_token_id) == len(tokens)
+
+    #The last token is the first one by decreasing offset
+    by_offset = sorted(tokens, key=lambda token: -int(token.get_offset()))
+    assert [index.get_position_by_offset(token.get_id()) for token in by_offset] == list(range(len(tokens)))
+
+
+def test_index_is_created_once_per_document(monkeypatch, model_folder, document, document_with_opinions):
+    naf_obj = KafNafParser(document)
+    assert get_document_index(naf_obj) is get_document_index(naf_obj)
+    assert get_document_index(KafNafParser(document)) is not get_document_index(naf_obj)
+
+    #The three steps of the tagger and the opinions share the index
+    created_for = []
+    class CountingDocumentIndex(DocumentIndex):
+        def __init__(self, naf_obj):
+            created_for.append(naf_obj.filename)
+            DocumentIndex.__init__(self, naf_obj)
+    monkeypatch.setattr(document_index, 'DocumentIndex', CountingDocumentIndex)
+    list_kaf_naf_obj = []
+    for num_file, filename in enumerate([document_with_opinions, document]):
+        list_kaf_naf_obj.append(KafNafParser(filename))
+        list_kaf_naf_obj[-1].filename = 'file%d' % num_file
+    OpinionTagger(model_folder, crf_backend='python').tag_list(list_kaf_naf_obj)
+    assert sorted(created_for) == ['file0', 'file1']
+    assert len(list(list_kaf_naf_obj[0].get_opinions())) != 0
+
+
+def test_extractors_are_created_once_by_concurrent_steps(monkeypatch, document_with_opinions):
+    naf_obj = KafNafParser(document_with_opinions)
+    index = get_document_index(naf_obj)
+    created = []
+    get_dependency_extractor = naf_obj.get_dependency_extractor
+    get_constituency_extractor = naf_obj.get_constituency_extractor
+    def counting(name, function):
+        def create_extractor():
+            created.append(name)
+            return function()
+        return create_extractor
+    naf_obj.get_dependency_extractor = counting('dependency', get_dependency_extractor)
+    naf_obj.get_constituency_extractor = counting('constituency', get_constituency_extractor)
+
+    barrier = threading.Barrier(8)
+    extractors = []
+    def get_extractors():
+        barrier.wait()
+        extractors.append((index.get_dependency_extractor(), index.get_constituency_extractor()))
+    threads = [threading.Thread(target=get_extractors) for num_thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(created) == ['constituency', 'dependency']
+    assert len(extractors) == 8 and len(set(extractors)) == 1
+    assert extractors[0][0] is not None and extractors[0][1] is not None
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import extract_features_target
+import extract_features_holder
+from document_index import get_document_index
+
+
+def get_distances(naf_obj, token_ids, expression_ids):
+    '''
+    Distances to the DSE computed token by token, as the extractors did before the matrix of get_distances_to_dse
+    '''
+    num_token_for_token_id = get_document_index(naf_obj).num_token_for_token_id
+    min_pos_eid = min(num_token_for_token_id[eid] for eid in expression_ids)
+    max_pos_eid = max(num_token_for_token_id[eid] for eid in expression_ids)
+    distances = []
+    for token_id in token_ids:
+        position = num_token_for_token_id[token_id]
+        if position >= min_pos_eid and position <= max_pos_eid:
+            distances.append(0)
+        else:
+            distances.append(min(position-min_pos_eid, position-max_pos_eid))
+    return distances
+
+
+@pytest.fixture
+def naf_obj(document_with_opinions):
+    return KafNafParser(document_with_opinions)
+
+
+def get_random_expressions(token_ids, num_expressions, generator):
+    expressions = []
+    for num_expression in range(num_expressions):
+        #Contiguous or not, of one token or more, anywhere in the sentence
+        expressions.append(sorted(generator.sample(token_ids, generator.randint(1, min(4, len(token_ids)))), key=token_ids.index))
+    return expressions
+
+
+@pytest.mark.parametrize('module', [extract_features_target, extract_features_holder])
+def test_matrix_is_the_distance_of_every_token(naf_obj, module):
+    generator = random.Random(14)
+    index = get_document_index(naf_obj)
+    for sentence_id in index.sentence_ids:
+        token_ids = index.token_ids_for_sentence[sentence_id]
+        for num_trial in range(50):
+            expressions = get_random_expressions(token_ids, generator.randint(1, 5), generator)
+            distances = module.get_distances_to_dse(naf_obj, token_ids, expressions)
+            assert distances.shape == (len(expressions), len(token_ids))
+            for expression_ids, row in zip(expressions, distances.tolist()):
+                assert row == get_distances(naf_obj, token_ids, expression_ids)
+
+
+@pytest.mark.parametrize('module, extract, bucket', [
+    (extract_features_target, extract_features_target.extract_distance_dse_target, lambda distance: str(distance//3)),
+    (extract_features_holder, extract_features_holder.extract_distance_to_dse, lambda distance: str(distance/3))])
+def test_feature_values_do_not_change(naf_obj, module, extract, bucket):
+    index = get_document_index(naf_obj)
+    opinions_per_sentence = {}
+    for opinion in naf_obj.get_opinions():
+        first_term_id = opinion.get_expression().get_span().get_span_ids()[0]
+        opinions_per_sentence.setdefault(index.sentence_for_token_id[index.token_ids_for_term_id[first_term_id][0]], []).append(opinion)
+    assert max(len(these_opinions) for these_opinions in opinions_per_sentence.values()) > 1
+
+    values = set()
+    for sentence_id, these_opinions in opinions_per_sentence.items():
+        token_ids = index.token_ids_for_sentence[sentence_id]
+        distances = module.get_distances_to_dse(naf_obj, token_ids, these_opinions)
+        for num_opinion, opinion in enumerate(these_opinions):
+            expected = get_distances(naf_obj, token_ids, module.get_token_ids_for_opinion_expression(naf_obj, opinion))
+            #Given the row of the matrix of the sentence, or computed for the opinion alone
+            for row in (distances[num_opinion], None):
+                features = dict((token_id, {}) for token_id in token_ids)
+                assert extract(naf_obj, token_ids, features, opinion, row) == ['distance_to_dse']
+                assert [features[token_id]['distance_to_dse'] for token_id in token_ids] == [bucket(distance) for distance in expected]
+                values.update(features[token_id]['distance_to_dse'] for token_id in token_ids)
+    #Tokens before, in and after the expressions
+    assert len(values) > 3
@@ -0,0 +1,64 @@
+import io
+import re
+
+import pytest
+
+from naf_output import splice_opinions
+from tag_file import OpinionTagger, read_kaf_naf, dump_tagged
+
+
+def read_bytes(filename):
+    fd = open(filename, 'rb')
+    data = fd.read()
+    fd.close()
+    return data
+
+
+def latin1(data):
+    text = data.decode('utf-8').replace("encoding='UTF-8'", "encoding='ISO-8859-1'")
+    return text.replace('<kafHeader>', '<!-- café crème --><kafHeader>', 1).encode('iso-8859-1')
+
+
+def without_header(data):
+    return re.sub(br'<kafHeader>.*?</kafHeader>', b'', data, flags=re.S)
+
+
+def with_trailing_comment(data):
+    return data.rstrip() + b'\n<!-- end of the document -->\n'
+
+
+def with_opinions_in_comment(data):
+    #The opinions layer can not be found for sure, the document is serialised as a whole
+    return data.replace(b'<text>', b'<!-- <opinions></opinions> --><text>', 1)
+
+
+VARIANTS = {
+    'input': (lambda data: data, True),
+    'latin1': (latin1, True),
+    'without_header': (without_header, True),
+    'trailing_comment': (with_trailing_comment, True),
+    'opinions_in_comment': (with_opinions_in_comment, False),
+}
+
+
+@pytest.mark.parametrize('keep_opinions', [False, True])
+@pytest.mark.parametrize('variant', sorted(VARIANTS))
+@pytest.mark.parametrize('document_name', ['document', 'document_with_opinions'])
+def test_spliced_output_is_the_dumped_document(request, model_folder, canonical, document_name, variant, keep_opinions):
+    transform, can_be_spliced = VARIANTS[variant]
+    data = transform(read_bytes(request.getfixturevalue(document_name)))
+    tagger = OpinionTagger(model_folder, keep_opinions=keep_opinions, crf_backend='python')
+
+    kaf_naf_obj = read_kaf_naf(data)
+    tagger.tag(kaf_naf_obj)
+    dumped = io.BytesIO()
+    kaf_naf_obj.dump(dumped)
+
+    kaf_naf_obj = read_kaf_naf(data, keep_input=True)
+    tagger.tag(kaf_naf_obj)
+    assert (splice_opinions(data, kaf_naf_obj, keep_opinions) is not None) == can_be_spliced
+    spliced = io.BytesIO()
+    dump_tagged(kaf_naf_obj, spliced, fast_output=True, keep_opinions=keep_opinions)
+
+    assert b'<opinion ' in dumped.getvalue()
+    assert canonical(spliced.getvalue()) == canonical(dumped.getvalue())
@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import extract_features_expression
+import feature_cache
+from feature_cache import FeatureCache
+
+
+def count_processed(monkeypatch):
+    processed = []
+    process_file_in_worker = extract_features_expression.process_file_in_worker
+    def counting_process(filename):
+        processed.append(filename)
+        return process_file_in_worker(filename)
+    monkeypatch.setattr(extract_features_expression, 'process_file_in_worker', counting_process)
+    return processed
+
+
+def extract(list_filename, folder, cache_folder, this_type='test', overall_parameters=None):
+    '''
+    Testing (or training) file of the expressions, created with the parameters of the model in folder
+    '''
+    if this_type == 'test':
+        overall_parameters = dict(overall_parameters or {}, gold_standard=os.path.join(os.path.dirname(list_filename), 'gold'))
+    output_filename = extract_features_expression.main(list_filename, this_type, folder, overall_parameters, cache_folder=cache_folder)
+    with open(output_filename, 'rb') as fd:
+        return fd.read()
+
+
+def copy_model(tmp_path, model_folder):
+    #The testing files are written in the folder of the model
+    folder = str(tmp_path / 'model')
+    shutil.copytree(model_folder, folder)
+    return folder
+
+
+def test_get_and_put(tmp_path, document):
+    cache = FeatureCache(str(tmp_path), 'expression', 'test', {})
+    key = cache.get_key(document)
+    assert cache.get(key, True) is None
+    cache.put(key, 'sequences', 'gold standard')
+    assert cache.get(key, True) == ('sequences', 'gold standard')
+    assert cache.get(key, False) == ('sequences', None)
+    assert (cache.hits, cache.misses) == (2, 1)
+    #Objects and missing files are not cached
+    assert cache.get_key(str(tmp_path / 'missing.naf')) is None
+
+
+def test_second_run_reads_the_cache(monkeypatch, tmp_path, model_folder, training_files, file_list):
+    list_filename = file_list(tmp_path, training_files)
+    model_folder = copy_model(tmp_path, model_folder)
+    cache_folder = str(tmp_path / 'cache')
+    processed = count_processed(monkeypatch)
+    testing_file = extract(list_filename, model_folder, cache_folder)
+    assert processed == training_files
+    del processed[:]
+    assert extract(list_filename, model_folder, cache_folder) == testing_file
+    assert processed == []
+    #Without the cache
+    assert extract(list_filename, model_folder, None) == testing_file
+    assert processed == training_files
+
+
+def test_other_configuration_is_not_read(monkeypatch, tmp_path, model_folder, training_files, file_list):
+    list_filename = file_list(tmp_path, training_files[:2])
+    model_folder = copy_model(tmp_path, model_folder)
+    cache_folder = str(tmp_path / 'cache')
+    extract(list_filename, model_folder, cache_folder)
+    processed = count_processed(monkeypatch)
+    extract(list_filename, model_folder, cache_folder, overall_parameters={'some_parameter': 3})
+    assert processed == training_files[:2]
+
+    del processed[:]
+    monkeypatch.setattr(feature_cache, 'get_code_version', lambda: 'other version')
+    extract(list_filename, model_folder, cache_folder)
+    assert processed == training_files[:2]
+
+
+def test_sequences_of_the_manifest_are_cached(monkeypatch, tmp_path, training_files, file_list):
+    list_filename = file_list(tmp_path, training_files)
+    first_folder = str(tmp_path / 'first')
+    os.mkdir(first_folder)
+    training_file = extract(list_filename, first_folder, None, 'train', {})
+    #All the files are in the manifest, the cache is filled with them
+    cache_folder = str(tmp_path / 'cache')
+    processed = count_processed(monkeypatch)
+    assert extract(list_filename, first_folder, cache_folder, 'train', {}) == training_file
+    assert processed == []
+    #And used for other models
+    second_folder = str(tmp_path / 'second')
+    os.mkdir(second_folder)
+    assert extract(list_filename, second_folder, cache_folder, 'train', {}) == training_file
+    assert processed == []
@@ -0,0 +1,91 @@
+import io
+import os
+import threading
+from array import array
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import extract_features_expression
+import extract_features_target
+import extract_features_holder
+from document_index import get_document_index
+from extract_sequences import extract_sequences
+from feature_columns import SequenceColumns, StringTable
+from tag_file import OpinionTagger
+
+
+def test_every_string_is_stored_once():
+    table = StringTable()
+    ids = table.get_ids(['the', 'DT', 'the', '-', 'DT'])
+    assert isinstance(ids, array)
+    assert list(ids) == [0, 1, 0, 2, 1]
+    assert table.strings == ['the', 'DT', '-']
+    assert [table.get_string(this_id) for this_id in ids] == ['the', 'DT', 'the', '-', 'DT']
+    assert table.get_id('DT') == 1 and table.get_id('new') == 3
+
+
+def test_strings_added_by_several_threads():
+    table = StringTable()
+    values = ['value%d' % (num_value % 50) for num_value in range(2000)]
+    barrier = threading.Barrier(4)
+    ids_per_thread = []
+    def add_values():
+        barrier.wait()
+        ids_per_thread.append(list(table.get_ids(values)))
+    threads = [threading.Thread(target=add_values) for num_thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(table.strings) == len(set(table.strings)) == 50
+    assert all(ids == ids_per_thread[0] for ids in ids_per_thread)
+    assert [table.get_string(this_id) for this_id in ids_per_thread[0]] == values
+
+
+def test_rows_and_crf_format():
+    table = StringTable()
+    shared_column = table.get_ids(['Good', 'film'])
+    sequence = SequenceColumns(table, 'doc.naf#', ['w1', 'w2'])
+    sequence.add_column_ids(shared_column)
+    sequence.add_column(['JJ', 'NN'])
+    sequence.add_column(['B-DSE', 'O'])
+    assert sequence.columns[0] is shared_column
+    assert len(sequence) == 2
+    assert list(sequence) == [['doc.naf#w1', 'Good', 'JJ', 'B-DSE'], ['doc.naf#w2', 'film', 'NN', 'O']]
+    output = io.StringIO()
+    sequence.write(output)
+    assert output.getvalue() == 'doc.naf#w1\tGood\tJJ\tB-DSE\ndoc.naf#w2\tfilm\tNN\tO\n\n'
+
+
+def read_feature_file(feature_file):
+    with open(feature_file) as fd:
+        blocks = fd.read().split('\n\n')
+    os.remove(feature_file)
+    return [[line.split('\t') for line in block.split('\n')] for block in blocks if block.strip()]
+
+
+@pytest.mark.parametrize('model_name', ['expression', 'target', 'holder'])
+def test_sequences_in_memory_are_the_feature_file(model_folder, document_with_opinions, model_name):
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    modules = {'expression': extract_features_expression, 'target': extract_features_target, 'holder': extract_features_holder}
+    parameters = {'expression': tagger.expression_parameters, 'target': tagger.target_parameters, 'holder': tagger.holder_parameters}
+    kaf_naf_obj = KafNafParser(document_with_opinions)
+    kaf_naf_obj.filename = 'stdin'
+    kaf_naf_obj.remove_opinion_layer()
+    arguments = {}
+    if model_name != 'expression':
+        expression_sequences = extract_features_expression.main([kaf_naf_obj], 'tag', model_folder, overall_parameters=tagger.expression_parameters, in_memory=True)
+        arguments['detected_dse'] = extract_sequences(tagger.crf_model_for_name['expression'].tag_sequences(expression_sequences), 'DSE')
+        assert len(arguments['detected_dse']) != 0
+
+    sequences = modules[model_name].main([kaf_naf_obj], 'tag', model_folder, overall_parameters=parameters[model_name], in_memory=True, **arguments)
+    feature_file = modules[model_name].main([kaf_naf_obj], 'tag', model_folder, overall_parameters=parameters[model_name], **arguments)
+    assert [list(sequence) for sequence in sequences] == read_feature_file(feature_file)
+    assert all(isinstance(sequence, SequenceColumns) for sequence in sequences)
+
+    #The values of all the sequences are stored once in the table of the document
+    feature_values = get_document_index(kaf_naf_obj).feature_values
+    num_values = sum(len(sequence) * len(sequence.columns) for sequence in sequences)
+    assert all(sequence.string_table is feature_values for sequence in sequences)
+    assert len(feature_values.strings) == len(set(feature_values.strings)) < num_values
@@ -0,0 +1,97 @@
+import os
+import shutil
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import feature_registry
+from crf_decoder import TEXT_MODEL_EXTENSION
+from feature_registry import FeatureRegistry
+from tag_file import OpinionTagger
+
+
+def create_registry():
+    registry = FeatureRegistry()
+    registry.add(['token'], None, static=True)
+    registry.add(['lemma', 'pos'], None, static=True)
+    registry.add(['in_lexicon'], None, parameter='use_lexicon')
+    registry.add(['experiment'], None, parameter='use_experiment', optional=True)
+    registry.add(['chunk'], None)
+    return registry
+
+
+def get_labels(features):
+    return [feature.labels[0] for feature in features]
+
+
+def test_columns_and_features_in_order():
+    registry = create_registry()
+    #The column of in_lexicon is always there, the optional one only with its parameter
+    assert registry.get_column_labels({}) == ['token', 'lemma', 'pos', 'in_lexicon', 'chunk']
+    assert registry.get_column_labels({'use_experiment': True}) == ['token', 'lemma', 'pos', 'in_lexicon', 'experiment', 'chunk']
+    assert get_labels(registry.get_features_to_extract({})) == ['token', 'lemma', 'chunk']
+    assert get_labels(registry.get_features_to_extract({'use_lexicon': True, 'use_experiment': True})) == ['token', 'lemma', 'in_lexicon', 'experiment', 'chunk']
+
+
+def test_only_the_columns_of_the_templates_are_extracted():
+    registry = create_registry()
+    #Column 0 is the identifier, 3 is the part-of-speech and 5 the chunk (4 with the experiment)
+    assert get_labels(registry.get_features_to_extract({'use_lexicon': True}, frozenset([3, 5]))) == ['lemma', 'chunk']
+    assert get_labels(registry.get_features_to_extract({'use_lexicon': True, 'use_experiment': True}, frozenset([1, 5]))) == ['token', 'experiment']
+    #Read by the templates, but the model was not trained with the parameter
+    assert get_labels(registry.get_features_to_extract({}, frozenset([4]))) == []
+
+
+def test_labels_are_registered_once():
+    registry = create_registry()
+    with pytest.raises(ValueError):
+        registry.add(['pos'], None)
+
+
+def count_reads(monkeypatch):
+    '''
+    Replaces the parser of the models by one that records the files it reads
+    '''
+    read_files = []
+    read_template_columns = feature_registry.read_template_columns
+    def counting_read(model_filename):
+        read_files.append(model_filename)
+        return read_template_columns(model_filename)
+    monkeypatch.setattr(feature_registry, 'read_template_columns', counting_read)
+    monkeypatch.setattr(feature_registry, '_columns_for_model', {})
+    return read_files
+
+
+def test_binary_and_text_models_have_the_same_columns(model_folder):
+    for model_name in ('expression', 'target', 'holder'):
+        model_filename = os.path.join(model_folder, 'model.'+model_name)
+        columns = feature_registry.get_template_columns(model_filename)
+        assert columns
+        assert columns == feature_registry.get_template_columns(model_filename+TEXT_MODEL_EXTENSION)
+
+
+def test_missing_model_has_no_columns(tmp_path):
+    assert feature_registry.get_template_columns(str(tmp_path / 'model.expression')) is None
+
+
+def test_every_model_is_read_once(monkeypatch, model_folder, document):
+    read_files = count_reads(monkeypatch)
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    for num_document in range(3):
+        tagger.tag(KafNafParser(document))
+    assert sorted(os.path.basename(filename) for filename in read_files) == ['model.expression', 'model.holder', 'model.target']
+
+
+def test_model_trained_again_is_read_again(monkeypatch, tmp_path, model_folder):
+    read_files = count_reads(monkeypatch)
+    model_filename = str(tmp_path / 'model.expression')
+    shutil.copy(os.path.join(model_folder, 'model.expression'), model_filename)
+    columns = feature_registry.get_template_columns(model_filename)
+    assert feature_registry.get_template_columns(model_filename) == columns
+    assert len(read_files) == 1
+
+    #Same model with a newer modification time, as if crf_learn had written it again
+    stat = os.stat(model_filename)
+    os.utime(model_filename, (stat.st_atime, stat.st_mtime+10))
+    assert feature_registry.get_template_columns(model_filename) == columns
+    assert len(read_files) == 2
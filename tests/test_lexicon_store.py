@@ -0,0 +1,139 @@
+import io
+import os
+import re
+import shutil
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import extract_features_expression
+import mpqa_lexicon
+from feature_registry import get_template_columns
+import lexicon_store
+from lexicon_store import COMPILED_FOLDER_VARIABLE, LexiconStore, get_compiled_path, write_store
+from tag_file import OpinionTagger
+
+
+MPQA_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'subjclueslen1-HLTEMNLP05.tff')
+
+
+@pytest.fixture
+def store(tmp_path):
+    filename = str(tmp_path / 'tables.store')
+    write_store(filename, [('words', {'nice': 'POSITIVE', 'awful': 'NEGATIVE'}),
+                           ('pairs', {('nice', 'a'): ('strongsubj', 'positive')}),
+                           ('index', {'tokenBOW###nice': 1, 'termBOW###nice': 2})])
+    return LexiconStore(filename)
+
+
+def test_lookups_as_a_dictionary(store):
+    assert store['words'].get('nice') == 'POSITIVE'
+    assert store['words'].get('good') is None
+    assert 'awful' in store['words']
+    assert store['pairs'][('nice', 'a')] == ('strongsubj', 'positive')
+    assert store['index'].get('termBOW###nice') == 2
+    assert dict(store['words'].items()) == {'nice': 'POSITIVE', 'awful': 'NEGATIVE'}
+
+
+def test_keys_that_can_not_be_in_the_table(store):
+    for table, key in [('words', None), ('words', 3), ('words', ('nice',)), ('pairs', None), ('pairs', (None, 'a')),
+                       ('pairs', ('nice', None)), ('pairs', 'nice'), ('index', None)]:
+        assert store[table].get(key) is None
+        assert store[table].get(key, 0) == 0
+        assert key not in store[table]
+        with pytest.raises(KeyError):
+            store[table][key]
+
+
+@pytest.fixture
+def mpqa_path(tmp_path, monkeypatch):
+    #A copy of the lexicon in a temporary folder, so it's compiled again for every test
+    path = str(tmp_path / os.path.basename(MPQA_FIXTURE))
+    shutil.copy(MPQA_FIXTURE, path)
+    monkeypatch.setattr(mpqa_lexicon, 'PATH_MPQA_LEXICON', path)
+    return path
+
+
+def test_mpqa_lexicon_without_lemma(mpqa_path):
+    lexicon = mpqa_lexicon.MPQA_subjectivity_lexicon()
+    assert os.path.exists(get_compiled_path(mpqa_path))
+    assert lexicon.get_type_and_polarity('nice', 'JJ') == ('strongsubj', 'positive')
+    assert lexicon.get_type_and_polarity(None, 'JJ') is None
+    assert lexicon.get_type_and_polarity(None) is None
+
+
+def remove_lemmas(filename, num_lemmas):
+    fd = open(filename, 'rb')
+    data = fd.read()
+    fd.close()
+    data, num_removed = re.subn(br' lemma="[^"]*"', b'', data, count=num_lemmas)
+    assert num_removed == num_lemmas
+    return data
+
+
+def test_tag_terms_without_lemma(mpqa_path, model_folder, document, canonical):
+    data = remove_lemmas(document, 5)
+    #The model is trained with -mpqa and reads the column of the MPQA lexicon
+    assert extract_features_expression.load_parameters(model_folder)['use_mpqa_lexicon']
+    mpqa_column = extract_features_expression.FEATURES.get_column_labels({}).index('in_mpqa_lexicon')+1
+    assert mpqa_column in get_template_columns(os.path.join(model_folder, extract_features_expression.MODEL_FILENAME))
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    kaf_naf_obj = KafNafParser(io.BytesIO(data))
+    assert any(term.get_lemma() is None for term in kaf_naf_obj.get_terms())
+    tagger.tag(kaf_naf_obj)
+    output = io.BytesIO()
+    kaf_naf_obj.dump(output)
+    assert b'<opinions' in output.getvalue()
+
+
+def test_train_with_mpqa_and_terms_without_lemma(mpqa_path, tmp_path, document_with_opinions, file_list):
+    #The first 7 terms: "i say that the Hotel be awful", "say" and "awful" are in the lexicon
+    filename = str(tmp_path / 'document.naf')
+    fd = open(filename, 'wb')
+    fd.write(remove_lemmas(document_with_opinions, 7))
+    fd.close()
+    folder = str(tmp_path / 'model')
+    os.mkdir(folder)
+    overall_parameters = {'use_mpqa_lexicon': True}
+    training_filename = extract_features_expression.main(file_list(tmp_path, [filename]), 'train', folder, overall_parameters)
+    mpqa_column = extract_features_expression.FEATURES.get_column_labels(overall_parameters).index('in_mpqa_lexicon')+1
+    fd = open(training_filename)
+    mpqa_values = [line.split('\t')[mpqa_column] for line in fd if line.strip() != '']
+    fd.close()
+    assert mpqa_values[:7] == ['0'] * 7
+    assert '1' in mpqa_values[7:]
+
+
+def parse_words(path):
+    with open(path) as fd:
+        return [('words', dict(line.split() for line in fd))]
+
+
+def test_compiled_in_the_folder_of_the_variable(monkeypatch, tmp_path):
+    monkeypatch.setattr(lexicon_store, '_tables_for_path', {})
+    lexicon_folder = tmp_path / 'lexicon'
+    lexicon_folder.mkdir()
+    path = str(lexicon_folder / 'words.txt')
+    with open(path, 'w') as fd:
+        fd.write('nice POSITIVE\nawful NEGATIVE\n')
+    #The folder of the lexicon is read only, nothing is written next to it
+    os.chmod(str(lexicon_folder), 0o555)
+    compiled_folder = str(tmp_path / 'compiled')
+    monkeypatch.setenv(COMPILED_FOLDER_VARIABLE, compiled_folder)
+    try:
+        words, = lexicon_store.get_compiled_tables(path, 1, parse_words)
+        assert isinstance(words, lexicon_store.LexiconTable)
+        assert words.get('nice') == 'POSITIVE'
+        assert os.listdir(str(lexicon_folder)) == ['words.txt']
+        assert os.listdir(compiled_folder) == [os.path.basename(get_compiled_path(path))]
+        #Mapped from the compiled file in the next process
+        monkeypatch.setattr(lexicon_store, '_tables_for_path', {})
+        words, = lexicon_store.get_compiled_tables(path, 1, None)
+        assert words.get('awful') == 'NEGATIVE'
+    finally:
+        os.chmod(str(lexicon_folder), 0o755)
+
+
+def test_lexicons_with_the_same_name(tmp_path):
+    #Lexicons of different folders, like the feature indexes of the polarity models
+    assert get_compiled_path(str(tmp_path / 'en' / 'index.bin')) != get_compiled_path(str(tmp_path / 'nl' / 'index.bin'))
@@ -0,0 +1,151 @@
+import io
+import os
+import pickle
+import shutil
+import threading
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import mpqa_lexicon
+from lookup_memo import LookupMemo
+from tag_file import OpinionTagger
+
+
+MPQA_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'subjclueslen1-HLTEMNLP05.tff')
+
+
+class CountingLookup:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, word, pos=None):
+        self.calls.append((word, pos))
+        if word.startswith('no'):
+            return None
+        return (word, pos)
+
+
+def test_every_key_is_looked_up_once():
+    lookup = CountingLookup()
+    memo = LookupMemo(lookup, 100)
+    for num_time in range(3):
+        assert memo('nice', 'JJ') == ('nice', 'JJ')
+        assert memo('nice', 'NN') == ('nice', 'NN')
+        #The keys that are not in the lexicon are also kept
+        assert memo('nothing', 'NN') is None
+    assert lookup.calls == [('nice', 'JJ'), ('nice', 'NN'), ('nothing', 'NN')]
+    assert (memo.hits, memo.misses, memo.evictions, len(memo)) == (6, 3, 0, 3)
+    assert memo.get_hit_rate() == pytest.approx(6.0 / 9)
+
+    memo.clear()
+    assert (memo.hits, memo.misses, len(memo)) == (0, 0, 0)
+    memo('nice', 'JJ')
+    assert len(lookup.calls) == 4
+
+
+def test_memo_of_size_zero_looks_up_always():
+    lookup = CountingLookup()
+    memo = LookupMemo(lookup, 0)
+    for num_time in range(3):
+        assert memo('nice', 'JJ') == ('nice', 'JJ')
+    assert len(lookup.calls) == 3 and len(memo) == 0
+
+
+def test_frequent_keys_stay_after_many_rare_keys():
+    lookup = CountingLookup()
+    memo = LookupMemo(lookup, 10)
+    frequent_keys = [('word%d' % num_key, 'NN') for num_key in range(5)]
+    for num_time in range(2):
+        for key in frequent_keys:
+            memo(*key)
+    #A document full of words that are seen once
+    for num_key in range(100):
+        memo('rare%d' % num_key, 'NN')
+    assert len(memo) == 10
+    assert memo.evictions == 95
+    del lookup.calls[:]
+    for key in frequent_keys:
+        memo(*key)
+    assert lookup.calls == []
+
+    #Without the protected segment (plain LRU) they would have been evicted too
+    assert memo('rare0', 'NN') == ('rare0', 'NN')
+    assert lookup.calls == [('rare0', 'NN')]
+
+
+def test_protected_keys_go_back_to_probation():
+    memo = LookupMemo(CountingLookup(), 5)
+    #Every key is found twice, and there are 4 protected keys at most: the least recently used one goes back to the
+    #probation segment, where it's the first one to be evicted
+    for num_key in range(6):
+        memo('word%d' % num_key)
+        memo('word%d' % num_key)
+    assert list(memo.protected) == [('word%d' % num_key,) for num_key in range(2, 6)]
+    assert list(memo.probation) == [('word1',)]
+    assert memo.evictions == 1 and len(memo) == 5
+
+
+def test_lookups_from_several_threads():
+    lookup = CountingLookup()
+    memo = LookupMemo(lookup, 50)
+    keys = [('word%d' % (num_key % 80), 'NN') for num_key in range(2000)]
+    barrier = threading.Barrier(4)
+    results = []
+    def look_up():
+        barrier.wait()
+        results.append([memo(*key) for key in keys])
+    threads = [threading.Thread(target=look_up) for num_thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(these_results == keys for these_results in results)
+    assert memo.hits + memo.misses == 8000
+    assert len(memo) <= 50 and len(memo.probation) + len(memo.protected) == len(memo)
+
+
+@pytest.fixture
+def mpqa_path(tmp_path, monkeypatch):
+    path = str(tmp_path / os.path.basename(MPQA_FIXTURE))
+    shutil.copy(MPQA_FIXTURE, path)
+    monkeypatch.setattr(mpqa_lexicon, 'PATH_MPQA_LEXICON', path)
+    return path
+
+
+def test_mpqa_lexicon_gives_the_lookups(mpqa_path):
+    lexicon = mpqa_lexicon.MPQA_subjectivity_lexicon(memo_size=4)
+    pairs = []
+    for word in ['nice', 'good', 'awful', 'say', 'says', 'table', None]:
+        for pos in ['JJ', 'adj', 'NN', 'VBZ', 'anypos', 'G', None]:
+            pairs.append((word, pos))
+    expected = [lexicon.lookup_type_and_polarity(word, pos) for word, pos in pairs]
+    assert ('strongsubj', 'positive') in expected and None in expected
+    for num_time in range(3):
+        assert [lexicon.get_type_and_polarity(word, pos) for word, pos in pairs] == expected
+    assert lexicon.memo.evictions != 0 and len(lexicon.memo) == 4
+
+    #Sent to other processes without the memo, it's created again
+    copy = pickle.loads(pickle.dumps(lexicon))
+    assert copy.memo is not lexicon.memo and len(copy.memo) == 0 and copy.memo.max_size == 4
+    assert [copy.get_type_and_polarity(word, pos) for word, pos in pairs] == expected
+
+
+def tag_document(tagger, filename):
+    kaf_naf_obj = KafNafParser(filename)
+    tagger.tag(kaf_naf_obj)
+    output = io.BytesIO()
+    kaf_naf_obj.dump(output)
+    return output.getvalue()
+
+
+def test_tagging_with_and_without_memo(mpqa_path, model_folder, document_with_opinions, canonical):
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    memo = tagger.expression_parameters['mpqa_lexicon'].memo
+    output = tag_document(tagger, document_with_opinions)
+    assert memo.hits != 0
+    assert any(value is not None for value in memo.probation.values()) or any(value is not None for value in memo.protected.values())
+    assert canonical(tag_document(tagger, document_with_opinions)) == canonical(output)
+
+    tagger.expression_parameters['mpqa_lexicon'] = mpqa_lexicon.MPQA_subjectivity_lexicon(memo_size=0)
+    assert canonical(tag_document(tagger, document_with_opinions)) == canonical(output)
@@ -0,0 +1,160 @@
+import io
+import re
+
+import pytest
+from lxml import etree
+from KafNafParserPy import KafNafParser
+
+from naf_reader import NafReader, NafWindowReader
+
+
+def read(filename):
+    with open(filename, 'rb') as fd:
+        return fd.read()
+
+
+def write(path, data):
+    with open(str(path), 'wb') as fd:
+        fd.write(data)
+    return str(path)
+
+
+def to_naf(data):
+    '''
+    NAF version of the KAF fixtures: the same document with the names of NAF for the root, the header and the identifiers
+    '''
+    data = data.replace(b'<KAF ', b'<NAF ').replace(b'</KAF>', b'</NAF>').replace(b'kafHeader>', b'nafHeader>')
+    return data.replace(b' wid="', b' id="').replace(b' tid="', b' id="')
+
+
+@pytest.fixture(params=['KAF', 'NAF'])
+def document_file(request, tmp_path, document_with_opinions):
+    data = read(document_with_opinions)
+    if request.param == 'NAF':
+        data = to_naf(data)
+    return write(tmp_path / 'document.naf', data)
+
+
+def get_span_ids(element):
+    span = element.get_span()
+    if span is None:
+        return None
+    return list(span.get_span_ids())
+
+
+def get_tokens(naf_obj):
+    return [(token.get_id(), token.get_text(), token.get_sent(), token.get_offset()) for token in naf_obj.get_tokens()]
+
+
+def get_terms(naf_obj):
+    return [(term.get_id(), term.get_lemma(), term.get_pos(), get_span_ids(term)) for term in naf_obj.get_terms()]
+
+
+def get_dependencies(naf_obj):
+    return [(dep.get_from(), dep.get_to(), dep.get_function()) for dep in naf_obj.get_dependencies()]
+
+
+def test_same_layers_as_kafnafparser(document_file):
+    parser = KafNafParser(document_file)
+    reader = NafReader(document_file)
+    assert reader.type == parser.get_type()
+    assert reader.lang == parser.get_language()
+    assert get_tokens(reader) == get_tokens(parser)
+    assert get_terms(reader) == get_terms(parser)
+    assert len(get_tokens(reader)) == 70
+    for token_id, text, sent, offset in get_tokens(parser):
+        assert reader.get_token(token_id).get_text() == text
+    for term_id, lemma, pos, span_ids in get_terms(parser):
+        term = reader.get_term(term_id)
+        assert (term.get_lemma(), term.get_pos(), get_span_ids(term)) == (lemma, pos, span_ids)
+    assert reader.get_token('missing') is None and reader.get_term('missing') is None
+    assert get_dependencies(reader) == get_dependencies(parser)
+    assert [opinion.get_id() for opinion in reader.get_opinions()] == [opinion.get_id() for opinion in parser.get_opinions()]
+    assert len(list(reader.get_opinions())) == 7
+    assert len(list(reader.get_trees())) == len(list(parser.get_trees())) == 5
+    #The extractors of KafNafParserPy work on the reader
+    for term_id, lemma, pos, span_ids in get_terms(parser):
+        assert reader.get_constituency_extractor().get_deepest_phrase_for_termid(term_id) == parser.get_constituency_extractor().get_deepest_phrase_for_termid(term_id)
+
+
+def without_trees_and_dependencies(data):
+    return re.sub(br'<deps>.*</deps>', b'', re.sub(br'<constituency>.*</constituency>', b'', data, flags=re.S), flags=re.S)
+
+
+def test_missing_layers(tmp_path, document):
+    reader = NafReader(write(tmp_path / 'document.naf', without_trees_and_dependencies(read(document))))
+    assert len(get_terms(reader)) == 42
+    assert reader.get_dependency_extractor() is None and reader.get_constituency_extractor() is None
+    assert list(reader.get_opinions()) == [] and list(reader.get_dependencies()) == []
+
+
+def get_window_layers(filename, num_sentences):
+    window_reader = NafWindowReader(filename, num_sentences)
+    windows = list(window_reader.get_windows())
+    return window_reader, windows
+
+
+@pytest.mark.parametrize('num_sentences', [1, 2, 3, 100])
+def test_windows_split_the_document(document_file, num_sentences):
+    reader = NafReader(document_file)
+    window_reader, windows = get_window_layers(document_file, num_sentences)
+    assert window_reader.in_order
+    num_sentences_in_document = len(set(reader.token_sents))
+    assert len(windows) == -(-num_sentences_in_document // num_sentences)
+    for window in windows:
+        assert len(set(window.token_sents)) <= num_sentences
+        #Every token of the window has its term
+        assert set(token_id for span_ids in window.term_spans for token_id in span_ids) == set(window.token_ids)
+    assert sum((get_tokens(window) for window in windows), []) == get_tokens(reader)
+    assert sum((get_terms(window) for window in windows), []) == get_terms(reader)
+    assert sum((get_dependencies(window) for window in windows), []) == get_dependencies(reader)
+    assert sum(len(list(window.get_trees())) for window in windows) == len(list(reader.get_trees()))
+
+
+def cross_sentences(data):
+    '''
+    The span of the last term of the first sentence also takes the first token of the second sentence
+    '''
+    tree = etree.parse(io.BytesIO(data))
+    tokens = tree.findall('text/wf')
+    last_token = [token for token in tokens if token.get('sent') == '1'][-1]
+    next_token = tokens[tokens.index(last_token)+1]
+    assert next_token.get('sent') == '2'
+    for term in tree.findall('terms/term'):
+        span = term.find('span')
+        if [target.get('id') for target in span] == [last_token.get('wid')]:
+            etree.SubElement(span, 'target', id=next_token.get('wid'))
+    return etree.tostring(tree, encoding='UTF-8', xml_declaration=True)
+
+
+def test_term_across_the_windows(tmp_path, document):
+    filename = write(tmp_path / 'document.naf', cross_sentences(read(document)))
+    #The term can not be given to any window of one sentence, the document has to be read as a whole
+    window_reader, windows = get_window_layers(filename, 1)
+    assert not window_reader.in_order
+    assert len(windows) == 0
+    #In windows of two sentences both tokens are in the first one
+    window_reader, windows = get_window_layers(filename, 2)
+    assert window_reader.in_order
+    assert sum((get_terms(window) for window in windows), []) == get_terms(NafReader(filename))
+
+
+def test_token_without_term(tmp_path, document):
+    #Without the dependencies and trees of the term, which would not be in any window either
+    data = without_trees_and_dependencies(read(document))
+    data, num_removed = re.subn(br'<term [^>]*tid="t20">.*?</term>', b'', data, count=1, flags=re.S)
+    assert num_removed == 1
+    window_reader, windows = get_window_layers(write(tmp_path / 'document.naf', data), 1)
+    assert not window_reader.in_order
+
+
+def test_layers_out_of_order(tmp_path, document):
+    #The terms before the text: every layer is read by its own parser, so the order of the layers does not matter
+    data = read(document)
+    terms = re.search(br'<terms>.*</terms>', data, flags=re.S).group(0)
+    data = data.replace(terms, b'').replace(b'<text>', terms+b'<text>')
+    filename = write(tmp_path / 'document.naf', data)
+    assert get_terms(NafReader(filename)) == get_terms(NafReader(document))
+    window_reader, windows = get_window_layers(filename, 1)
+    assert window_reader.in_order
+    assert sum((get_terms(window) for window in windows), []) == get_terms(NafReader(document))
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import extract_features_expression
+import extract_features_target
+import extract_features_holder
+
+STEPS = [extract_features_expression, extract_features_target, extract_features_holder]
+
+
+def extract(list_filename, folder, num_processes):
+    '''
+    Training and testing files of the three steps, as created by the command line (-t train, -t test and -j)
+    '''
+    os.mkdir(folder)
+    extract_features_expression.main(list_filename, 'train', folder, {'use_wordnet_lexicon': True}, num_processes=num_processes)
+    extract_features_target.main(list_filename, 'train', folder, {}, num_processes=num_processes)
+    extract_features_holder.main(list_filename, 'train', folder, {}, num_processes=num_processes)
+    for step in STEPS:
+        gold_filename = os.path.join(folder, 'gold.'+step.MODEL_FILENAME.split('.')[1])
+        step.main(list_filename, 'test', folder, {'gold_standard': gold_filename}, num_processes=num_processes)
+
+
+def read_files(folder):
+    content_for_name = {}
+    for name in sorted(os.listdir(folder)):
+        if name.startswith(('training.', 'testing.', 'gold.', 'parameters.')):
+            with open(os.path.join(folder, name), 'rb') as fd:
+                content_for_name[name] = fd.read()
+    return content_for_name
+
+
+def test_parameters_are_saved_and_loaded(tmp_path, training_files, file_list):
+    list_filename = file_list(tmp_path, training_files)
+    folder = str(tmp_path / 'model')
+    os.mkdir(folder)
+    extract_features_target.main(list_filename, 'train', folder, {'some_parameter': 3})
+    assert extract_features_target.load_parameters(folder) == {'some_parameter': 3}
+    overall_parameters = {'gold_standard': str(tmp_path / 'gold')}
+    extract_features_target.main(list_filename, 'test', folder, overall_parameters)
+    assert overall_parameters['some_parameter'] == 3
+
+
+@pytest.mark.parametrize('num_processes', [2, 3])
+def test_parallel_extraction_gives_the_serial_files(tmp_path, training_files, file_list, num_processes):
+    list_filename = file_list(tmp_path, training_files)
+    extract(list_filename, str(tmp_path / 'serial'), 1)
+    extract(list_filename, str(tmp_path / 'parallel'), num_processes)
+    serial_files = read_files(str(tmp_path / 'serial'))
+    assert len(serial_files) == 12
+    assert all(len(content) != 0 for content in serial_files.values())
+    assert read_files(str(tmp_path / 'parallel')) == serial_files
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import pytest
+
+from tag_file import OpinionTaggerSet, tag_batch, tag_batch_parallel
+
+
+@pytest.fixture
+def batch_files(tmp_path, training_files, document):
+    #Two files whose names only differ in a space (in the same block), and the documents of the corpus
+    input_folder = tmp_path / 'input'
+    input_folder.mkdir()
+    files = []
+    for name, filename in [('a b.naf', training_files[1]), ('a_b.naf', document)]:
+        files.append(str(input_folder / name))
+        shutil.copy(filename, files[-1])
+    for filename in training_files + [document]:
+        files.append(str(input_folder / os.path.basename(filename)))
+        shutil.copy(filename, files[-1])
+    return files
+
+
+def read_outputs(folder, files, canonical):
+    outputs = []
+    for filename in files:
+        with open(os.path.join(folder, os.path.basename(filename)), 'rb') as fd:
+            outputs.append(canonical(fd.read()))
+    return outputs
+
+
+@pytest.mark.parametrize('window', [None, 2])
+@pytest.mark.parametrize('unordered', [False, True])
+def test_parallel_output_is_the_serial_output(tmp_path, model_folder, canonical, batch_files, unordered, window):
+    tagger_set = OpinionTaggerSet(None, model_folder, crf_backend='python', window=window)
+    tag_batch(batch_files, str(tmp_path / 'serial'), tagger_set, batch_size=2)
+    serial_outputs = read_outputs(str(tmp_path / 'serial'), batch_files, canonical)
+    assert sum(b'<opinion ' in output for output in serial_outputs) >= 5
+    #Every file gets its own opinions, as if it was tagged alone
+    for num_file, filename in enumerate(batch_files):
+        tag_batch([filename], str(tmp_path / ('alone%d' % num_file)), tagger_set)
+        assert read_outputs(str(tmp_path / ('alone%d' % num_file)), [filename], canonical) == [serial_outputs[num_file]]
+
+    worker_arguments = (None, model_folder, False, False, False, 'python', 1, False, window)
+    tag_batch_parallel(batch_files, str(tmp_path / 'parallel'), 3, worker_arguments, batch_size=2, unordered=unordered, window=window)
+    assert sorted(os.listdir(str(tmp_path / 'parallel'))) == sorted(os.path.basename(filename) for filename in batch_files)
+    assert read_outputs(str(tmp_path / 'parallel'), batch_files, canonical) == serial_outputs
+
+
+def test_files_are_written_in_the_input_order(tmp_path, model_folder, batch_files, capsys):
+    worker_arguments = (None, model_folder, False, False, False, 'python', 1, False, None)
+    tag_batch_parallel(batch_files, str(tmp_path / 'parallel'), 3, worker_arguments, batch_size=1, log=True)
+    tagged = [line.split(' --> ')[0][len('Tagged '):] for line in capsys.readouterr().err.splitlines() if line.startswith('Tagged ')]
+    assert tagged == batch_files
@@ -0,0 +1,72 @@
+import copy
+import io
+import re
+import time
+
+from lxml import etree
+from KafNafParserPy import KafNafParser
+
+from tag_file import OpinionTagger
+
+
+ID_ATTRIBUTES = ('wid', 'tid', 'id', 'from', 'to')
+ID_OFFSET = 100000
+LAYERS = ('text', 'terms', 'deps', 'constituency')
+NUMBERED_ID = re.compile(r'^([^\d]*)(\d+)$')
+
+
+def create_big_document(filename, num_copies):
+    '''
+    Document with the layers of the fixture repeated num_copies times, with new identifiers, sentences and offsets
+    '''
+    tree = etree.parse(filename)
+    root = tree.getroot()
+    layers = [root.find(tag) for tag in LAYERS if root.find(tag) is not None]
+    elements_for_layer = [[element for element in layer if isinstance(element.tag, str)] for layer in layers]
+    num_sentences = max(int(wf.get('sent')) for wf in root.find('text'))
+    text_length = max(int(wf.get('offset'))+int(wf.get('length')) for wf in root.find('text'))
+    for num_copy in range(1, num_copies):
+        for layer, elements in zip(layers, elements_for_layer):
+            for element in elements:
+                new_element = copy.deepcopy(element)
+                for sub_element in new_element.iter():
+                    for attribute in ID_ATTRIBUTES:
+                        match = NUMBERED_ID.match(sub_element.get(attribute, ''))
+                        if match is not None:
+                            sub_element.set(attribute, '%s%d' % (match.group(1), int(match.group(2))+ID_OFFSET*num_copy))
+                    if sub_element.get('sent') is not None:
+                        sub_element.set('sent', str(int(sub_element.get('sent'))+num_sentences*num_copy))
+                    if sub_element.get('offset') is not None:
+                        sub_element.set('offset', str(int(sub_element.get('offset'))+(text_length+1)*num_copy))
+                layer.append(new_element)
+    return etree.tostring(tree, encoding='UTF-8', xml_declaration=True)
+
+
+def get_detection_time(tagger, data, repetitions=3):
+    '''
+    Best time of the feature extraction (and decoding) of the three steps for the document
+    '''
+    best_time = None
+    for repetition in range(repetitions):
+        kaf_naf_obj = KafNafParser(io.BytesIO(data))
+        kaf_naf_obj.filename = 'stdin'
+        start = time.time()
+        expression_sequences, target_sequences, holder_sequences = tagger.detect_sequences([kaf_naf_obj])
+        elapsed = time.time() - start
+        if best_time is None or elapsed < best_time:
+            best_time = elapsed
+    return best_time, len(expression_sequences)
+
+
+def test_extraction_time_grows_linearly(model_folder, document):
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    small_copies, big_copies = 10, 160
+    small_time, small_expressions = get_detection_time(tagger, create_big_document(document, small_copies))
+    big_time, big_expressions = get_detection_time(tagger, create_big_document(document, big_copies))
+    #The same expressions are found in every copy, so the targets and holders are also extracted for all of them
+    assert small_expressions > 0
+    assert big_expressions == small_expressions * big_copies // small_copies
+    #16 times bigger: a linear extraction takes about 16 times longer, a quadratic one about 256 times (with the
+    #former scans over the whole document for every sentence it took more than 80 times longer)
+    ratio = big_time / small_time
+    assert ratio < 2.5 * big_copies / small_copies, 'The extraction took %.1f times longer for a document %d times bigger' % (ratio, big_copies // small_copies)
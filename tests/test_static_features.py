@@ -0,0 +1,106 @@
+import io
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+import extract_features_expression
+import extract_features_target
+import extract_features_holder
+from document_index import DocumentIndex, get_document_index
+from tag_file import OpinionTagger
+
+
+STEP_MODULES = [extract_features_expression, extract_features_target, extract_features_holder]
+
+
+def tag_document(tagger, filename):
+    kaf_naf_obj = KafNafParser(filename)
+    tagger.tag(kaf_naf_obj)
+    output = io.BytesIO()
+    kaf_naf_obj.dump(output)
+    return kaf_naf_obj, output.getvalue()
+
+
+def get_gold_expressions(kaf_naf_obj):
+    '''
+    Expressions of the opinions of the document, in the format of the sequences detected by the expression step
+    '''
+    index = get_document_index(kaf_naf_obj)
+    expressions = []
+    for opinion in kaf_naf_obj.get_opinions():
+        token_ids = []
+        for term_id in opinion.get_expression().get_span().get_span_ids():
+            token_ids.extend(index.token_ids_for_term_id[term_id])
+        expressions.append(([kaf_naf_obj.filename+'#'+token_id for token_id in token_ids], token_ids))
+    return expressions
+
+
+def test_static_features_are_extracted_once_per_sentence(monkeypatch, model_folder, document_with_opinions):
+    extracted = []
+    for module in STEP_MODULES:
+        for feature in module.FEATURES.features:
+            if feature.static:
+                def counting_extract(naf_obj, token_ids, features, extract=feature.extract, labels=feature.labels):
+                    extracted.append((tuple(labels), naf_obj.document_index.sentence_for_token_id[token_ids[0]]))
+                    return extract(naf_obj, token_ids, features)
+                monkeypatch.setattr(feature, 'extract', counting_extract)
+
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    kaf_naf_obj = KafNafParser(document_with_opinions)
+    kaf_naf_obj.filename = 'stdin'
+    expressions = get_gold_expressions(kaf_naf_obj)
+    sequences = extract_features_expression.main([kaf_naf_obj], 'tag', model_folder, overall_parameters=tagger.expression_parameters, in_memory=True)
+    #Two expressions in most of the sentences, with one sequence for each of them in the target and holder steps
+    target_sequences = extract_features_target.main([kaf_naf_obj], 'tag', model_folder, overall_parameters=tagger.target_parameters, detected_dse=expressions, in_memory=True)
+    holder_sequences = extract_features_holder.main([kaf_naf_obj], 'tag', model_folder, overall_parameters=tagger.holder_parameters, detected_dse=expressions, in_memory=True)
+    index = get_document_index(kaf_naf_obj)
+    assert len(sequences) == len(index.sentence_ids)
+    assert len(target_sequences) == len(holder_sequences) == len(expressions) == 7
+
+    assert len(extracted) == len(set(extracted))
+    assert sorted(set(sentence_id for labels, sentence_id in extracted)) == sorted(index.sentence_ids)
+
+
+@pytest.mark.parametrize('module', STEP_MODULES)
+def test_shared_columns_are_the_features_of_every_step(model_folder, document_with_opinions, module):
+    kaf_naf_obj, output = tag_document(OpinionTagger(model_folder, crf_backend='python'), document_with_opinions)
+    index = get_document_index(kaf_naf_obj)
+    for sentence_id in index.sentence_ids:
+        token_ids = index.token_ids_for_sentence[sentence_id]
+        features = dict((token_id, {}) for token_id in token_ids)
+        labels = module.FEATURES.extract_static(kaf_naf_obj, token_ids, features)
+        static_columns = index.static_columns_for_sentence[sentence_id]
+        for label in labels:
+            values = []
+            for token_id in token_ids:
+                value = features[token_id].get(label)
+                values.append('-' if value is None else value.replace(' ', '_'))
+            assert [index.feature_values.get_string(this_id) for this_id in static_columns[label]] == values
+
+
+def get_rows(model_folder, document_with_opinions):
+    '''
+    Rows of the target and holder sequences for the expressions of the opinions of the document, and its tagged output
+    '''
+    tagger = OpinionTagger(model_folder, crf_backend='python')
+    kaf_naf_obj = KafNafParser(document_with_opinions)
+    kaf_naf_obj.filename = 'stdin'
+    expressions = get_gold_expressions(kaf_naf_obj)
+    rows = []
+    for module, parameters in [(extract_features_target, tagger.target_parameters), (extract_features_holder, tagger.holder_parameters)]:
+        for sequence in module.main([kaf_naf_obj], 'tag', model_folder, overall_parameters=parameters, detected_dse=expressions, in_memory=True):
+            rows.append(list(sequence))
+    return rows, tag_document(tagger, document_with_opinions)[1]
+
+
+def test_output_without_sharing_the_static_columns(monkeypatch, model_folder, document_with_opinions, canonical):
+    shared_rows, shared_output = get_rows(model_folder, document_with_opinions)
+    assert b'<opinion_target' in shared_output
+    get_static_columns = DocumentIndex.get_static_columns
+    def get_static_columns_again(self, sentence_id, static_features):
+        self.static_columns_for_sentence.pop(sentence_id, None)
+        return get_static_columns(self, sentence_id, static_features)
+    monkeypatch.setattr(DocumentIndex, 'get_static_columns', get_static_columns_again)
+    rows, output = get_rows(model_folder, document_with_opinions)
+    assert rows == shared_rows
+    assert canonical(output) == canonical(shared_output)
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from svm_light_model import SVMLightModel
+
+#Models of the four kernels of svm_light, with the decision values of svm_classify for the examples
+SVM_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'svm')
+KERNELS = ['linear', 'polynomial', 'rbf', 'sigmoid']
+
+
+def read_examples():
+    examples = []
+    with open(os.path.join(SVM_FOLDER, 'examples.txt')) as fd:
+        for line in fd:
+            examples.append(dict((int(field.split(':')[0]), 1) for field in line.split()[1:]))
+    return examples
+
+
+@pytest.mark.parametrize('kernel', KERNELS)
+def test_decision_values_of_svm_classify(kernel):
+    model = SVMLightModel(os.path.join(SVM_FOLDER, 'model.'+kernel))
+    with open(os.path.join(SVM_FOLDER, 'predictions.'+kernel)) as fd:
+        expected = [float(line) for line in fd]
+    decision_values = model.decision_values(read_examples())
+    assert len(decision_values) == len(expected)
+    #svm_classify writes 8 significant digits
+    assert max(abs(value - float('%.8g' % expected_value)) for value, expected_value in zip(decision_values, expected)) < 1e-6
+
+
+@pytest.mark.parametrize('kernel', KERNELS)
+def test_features_out_of_the_model(kernel):
+    #The examples are not expanded to the size of their highest index
+    model = SVMLightModel(os.path.join(SVM_FOLDER, 'model.'+kernel))
+    decision_values = model.decision_values([[3, 5000], [3, 10**12]])
+    assert decision_values[0] == decision_values[1]
+
+
+def test_no_examples():
+    model = SVMLightModel(os.path.join(SVM_FOLDER, 'model.rbf'))
+    assert len(model.decision_values([])) == 0
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from tag_file import OpinionTaggerSet, TaggingServer
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+
+TAG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tag_file.py')
+
+
+@pytest.fixture(params=[False, True], ids=['dump', 'fast_output'])
+def server(request, model_folder):
+    #On an ephemeral port, in a thread of the test process
+    tagger_set = OpinionTaggerSet(None, model_folder, crf_backend='python', fast_output=request.param)
+    tagging_server = TaggingServer(('localhost', 0), tagger_set)
+    thread = threading.Thread(target=tagging_server.serve_forever)
+    thread.start()
+    yield tagging_server
+    tagging_server.shutdown()
+    tagging_server.server_close()
+    thread.join()
+
+
+def post(server, data):
+    response = urlopen(Request('http://localhost:%d/' % server.server_address[1], data=data), timeout=60)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+def tag_from_stdin(model_folder, filename, fast_output):
+    arguments = [sys.executable, TAG_FILE, '-f', model_folder, '-crf-backend', 'python']
+    if fast_output:
+        arguments.append('-fast-output')
+    with open(filename, 'rb') as fd:
+        return subprocess.check_output(arguments, stdin=fd)
+
+
+@pytest.mark.parametrize('document_name', ['document', 'document_with_opinions'])
+def test_server_gives_the_output_of_stdin(request, server, model_folder, canonical, document_name):
+    filename = request.getfixturevalue(document_name)
+    with open(filename, 'rb') as fd:
+        data = fd.read()
+    expected = tag_from_stdin(model_folder, filename, server.tagger_set.fast_output)
+    assert b'<opinion ' in expected
+    #The models are kept between requests
+    for num_request in range(2):
+        assert canonical(post(server, data)) == canonical(expected)
+
+
+def test_malformed_document(server, document, canonical):
+    with pytest.raises(HTTPError) as error:
+        post(server, b'<NAF xml:lang="en"><text><wf id="w1">')
+    assert error.value.code == 400
+    error.value.close()
+    #The server keeps tagging
+    with open(document, 'rb') as fd:
+        assert b'<opinion ' in post(server, fd.read())
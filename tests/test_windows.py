@@ -0,0 +1,57 @@
+import io
+import re
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+from tag_file import OpinionTaggerSet, tag_file_in_windows
+
+
+def with_reversed_terms(data):
+    '''
+    The terms are not in the order of the text, the document can not be read in windows and it's tagged as a whole
+    '''
+    terms_start = data.index(b'<terms>')+len(b'<terms>')
+    terms_end = data.index(b'</terms>')
+    terms = re.findall(br'<term\b.*?</term>', data[terms_start:terms_end], flags=re.S)
+    assert len(terms) > 1
+    return data[:terms_start] + b'\n'.join(terms[::-1]) + data[terms_end:]
+
+
+def tag_whole_document(tagger_set, filename):
+    kaf_naf_obj = KafNafParser(filename)
+    kaf_naf_obj.filename = filename
+    tagger = tagger_set.get_tagger(kaf_naf_obj)
+    tagger.tag_list([kaf_naf_obj])
+    output = io.BytesIO()
+    kaf_naf_obj.dump(output)
+    return output.getvalue()
+
+
+def tag_in_windows(tagger_set, filename, num_sentences):
+    output = io.BytesIO()
+    tag_file_in_windows(filename, output, tagger_set, num_sentences)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('keep_opinions', [False, True])
+@pytest.mark.parametrize('num_sentences', [1, 2, 1000])
+@pytest.mark.parametrize('document_name', ['document', 'document_with_opinions'])
+def test_windows_give_the_whole_document(request, model_folder, canonical, document_name, num_sentences, keep_opinions):
+    filename = request.getfixturevalue(document_name)
+    tagger_set = OpinionTaggerSet(None, model_folder, keep_opinions=keep_opinions, crf_backend='python', window=num_sentences)
+    whole_output = tag_whole_document(tagger_set, filename)
+    assert b'<opinion ' in whole_output
+    assert canonical(tag_in_windows(tagger_set, filename, num_sentences)) == canonical(whole_output)
+
+
+def test_terms_out_of_order(tmp_path, model_folder, canonical, document):
+    filename = str(tmp_path / 'reversed.naf')
+    fd = open(document, 'rb')
+    data = fd.read()
+    fd.close()
+    fd = open(filename, 'wb')
+    fd.write(with_reversed_terms(data))
+    fd.close()
+    tagger_set = OpinionTaggerSet(None, model_folder, crf_backend='python', window=1)
+    assert canonical(tag_in_windows(tagger_set, filename, 1)) == canonical(tag_whole_document(tagger_set, filename))
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+from KafNafParserPy import KafNafParser
+
+from wordnet_lexicon import WordnetLexicon, count_lemmas
+
+
+def read_bytes(filename):
+    fd = open(filename, 'rb')
+    data = fd.read()
+    fd.close()
+    return data
+
+
+@pytest.fixture
+def damaged_document(tmp_path, document_with_opinions):
+    '''
+    The opinions of the fixture with one holder without span and one target with a term that does not exist
+    '''
+    data = read_bytes(document_with_opinions)
+    data = data.replace(b'<opinion_holder><span><target id="t1"/></span></opinion_holder>', b'<opinion_holder/>', 1)
+    data = data.replace(b'<opinion_target><span><target id="t5"/>', b'<opinion_target><span><target id="t999"/><target id="t5"/>', 1)
+    filename = str(tmp_path / 'damaged.naf')
+    fd = open(filename, 'wb')
+    fd.write(data)
+    fd.close()
+    return filename
+
+
+@pytest.mark.parametrize('opinion_entity', ['expression', 'target', 'holder'])
+def test_damaged_entities_are_skipped(document_with_opinions, damaged_document, opinion_entity):
+    frequencies = count_lemmas(document_with_opinions, opinion_entity)
+    damaged_frequencies = count_lemmas(damaged_document, opinion_entity)
+    assert sum(frequencies.values()) > 0
+    if opinion_entity == 'holder':
+        assert sum(damaged_frequencies.values()) == sum(frequencies.values()) - 1
+    else:
+        assert damaged_frequencies == frequencies
+    #Same with the KafNafParser object
+    assert count_lemmas(KafNafParser(damaged_document), opinion_entity) == damaged_frequencies
+
+
+@pytest.mark.parametrize('num_processes', [1, 2])
+def test_create_save_and_load(tmp_path, document, document_with_opinions, damaged_document, num_processes):
+    lexicon = WordnetLexicon()
+    lexicon.create_from_files([document, document_with_opinions, damaged_document], 'expression', num_processes)
+    filename = str(tmp_path / 'lexicon.bin')
+    lexicon.save_to_file(filename)
+    loaded = WordnetLexicon()
+    loaded.load_from_file(filename)
+    expected = count_lemmas(document_with_opinions, 'expression') + count_lemmas(damaged_document, 'expression')
+    assert dict(loaded.frequency_for_lemma.items()) == dict(expected)
+    for lemma, frequency in expected.items():
+        assert loaded.get_frequency(lemma) == frequency
+    assert loaded.get_frequency('not-a-lemma') == 0
+    assert loaded.get_frequency(None) == 0
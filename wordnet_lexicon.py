@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+'''
+Lexicon of the lemmas of one type of opinion entity (expressions, targets or holders) in the training files, with the
+number of times that every lemma is part of the span of one entity. It's used by the feature in_wordnet_lexicon of the
+expression extractor (option -wn_lex). The lexicon is stored as a lexicon store (see lexicon_store), which is mapped
+in memory when it's loaded, so it's loaded at once and shared by all the processes that tag with the same model
+'''
+from __future__ import print_function
+import sys
+import multiprocessing
+from collections import Counter
+
+from KafNafParserPy import KafNafParser
+from naf_reader import NafReader
+from lexicon_store import LexiconStore, write_store
+from lookup_memo import LookupMemo, DEFAULT_MAX_SIZE
+
+
+TABLE_NAME = 'frequency'
+OPINION_ENTITIES = ('expression', 'target', 'holder')
+
+
+def get_opinion_entity(opinion, opinion_entity):
+    if opinion_entity == 'expression':
+        return opinion.get_expression()
+    elif opinion_entity == 'target':
+        return opinion.get_target()
+    else:
+        return opinion.get_holder()
+
+
+def count_lemmas(filename, opinion_entity):
+    '''
+    Returns the frequency of the lemmas in the spans of the opinion entities of one KAF/NAF file (or object). As in the
+    training of the extractors, the non-opinionated expressions and the entities without span are not considered
+    '''
+    if isinstance(filename, (KafNafParser, NafReader)):
+        naf_obj = filename
+    else:
+        #Only the layers needed (terms and opinions) are read
+        naf_obj = NafReader(filename)
+    frequency_for_lemma = Counter()
+    for opinion in naf_obj.get_opinions():
+        expression = opinion.get_expression()
+        if expression is None or expression.get_polarity() == 'NON-OPINIONATED':
+            continue
+        entity = get_opinion_entity(opinion, opinion_entity)
+        if entity is None:
+            continue
+        span = entity.get_span()
+        if span is not None:
+            for term_id in span.get_span_ids():
+                term_obj = get_term(naf_obj, term_id)
+                if term_obj is not None and term_obj.get_lemma() is not None:
+                    frequency_for_lemma[term_obj.get_lemma()] += 1
+    return frequency_for_lemma
+
+
+def get_term(naf_obj, term_id):
+    '''
+    Returns the term, or None if the opinion refers to a term that is not in the terms layer
+    '''
+    try:
+        return naf_obj.get_term(term_id)
+    except KeyError:
+        return None
+
+
+def count_lemmas_in_worker(arguments):
+    filename, opinion_entity = arguments
+    return count_lemmas(filename, opinion_entity)
+
+
+class WordnetLexicon:
+    def __init__(self, memo_size=DEFAULT_MAX_SIZE):
+        self.frequency_for_lemma = {}       #Map lemma --> frequency, a dictionary or a table of a lexicon store
+        self.filename = None
+        self.memo_size = memo_size
+        self.memo = LookupMemo(self.lookup_frequency, memo_size, name='WordNet lexicon')
+
+
+    def create_from_files(self, files, opinion_entity, num_processes=1):
+        '''
+        Creates the lexicon from the opinion entities (expression, target or holder) of a list of KAF/NAF files, which
+        are read in num_processes processes
+        '''
+        if opinion_entity not in OPINION_ENTITIES:
+            raise ValueError('Unknown opinion entity %s, it must be one of %s' % (opinion_entity, ', '.join(OPINION_ENTITIES)))
+        arguments = [(filename, opinion_entity) for filename in files]
+        frequency_for_lemma = Counter()
+        if num_processes > 1 and len(files) > 1:
+            pool = multiprocessing.Pool(num_processes)
+            for file_frequencies in pool.imap_unordered(count_lemmas_in_worker, arguments, chunksize=8):
+                frequency_for_lemma.update(file_frequencies)
+            pool.close()
+            pool.join()
+        else:
+            for these_arguments in arguments:
+                frequency_for_lemma.update(count_lemmas_in_worker(these_arguments))
+        self.frequency_for_lemma = dict(frequency_for_lemma)
+        self.filename = None
+        self.memo.clear()
+        print('WordNet lexicon created with %d lemmas of %s from %d files' % (len(self.frequency_for_lemma), opinion_entity, len(files)), file=sys.stderr)
+
+
+    def save_to_file(self, filename):
+        write_store(filename, [(TABLE_NAME, self.frequency_for_lemma)], info={'lemmas': len(self.frequency_for_lemma)})
+
+
+    def load_from_file(self, filename):
+        '''
+        Maps the lexicon saved in filename, the lemmas are not loaded in memory
+        '''
+        self.frequency_for_lemma = LexiconStore(filename)[TABLE_NAME]
+        self.filename = filename
+        self.memo.clear()
+
+
+    def lookup_frequency(self, lemma):
+        if lemma is None:
+            return 0
+        return self.frequency_for_lemma.get(lemma, 0)
+
+
+    def get_frequency(self, lemma):
+        '''
+        Frequency of the lemma in the lexicon, 0 if it's not there
+        '''
+        return self.memo(lemma)
+
+
+    def __len__(self):
+        return len(self.frequency_for_lemma)
+
+
+    def __getstate__(self):
+        #A lexicon loaded from a file is mapped again in other processes, the memo is not copied
+        state = {'memo_size': self.memo_size, 'filename': self.filename}
+        if self.filename is None:
+            state['frequency_for_lemma'] = self.frequency_for_lemma
+        return state
+
+
+    def __setstate__(self, state):
+        self.__init__(state['memo_size'])
+        if state['filename'] is not None:
+            self.load_from_file(state['filename'])
+        else:
+            self.frequency_for_lemma = state['frequency_for_lemma']